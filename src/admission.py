@@ -0,0 +1,71 @@
+import asyncio
+import time
+from typing import Dict, Any
+from src.config import MAX_CONCURRENT_REQUESTS, MAX_QUEUED_REQUESTS
+
+
+class AdmissionRejected(Exception):
+    """Raised when the server is saturated and the request should be retried later (HTTP 429)."""
+
+
+class AdmissionLimiter:
+    """
+    Bounds the number of requests processed at once with an asyncio semaphore.
+
+    Up to `max_queued` requests wait for a slot; once the queue is full, new
+    requests are rejected immediately instead of piling up behind the LLM.
+    Used from a single event loop, so the counters need no lock.
+    """
+
+    def __init__(self, max_concurrent: int = MAX_CONCURRENT_REQUESTS, max_queued: int = MAX_QUEUED_REQUESTS):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.total_wait_s = 0.0
+        self.max_wait_s = 0.0
+
+    def is_full(self) -> bool:
+        """True if a new request would be rejected."""
+        return self._semaphore.locked() and self.waiting >= self.max_queued
+
+    async def acquire(self) -> None:
+        """Waits for a slot, or raises AdmissionRejected at once if the queue is full."""
+        if self.is_full():
+            self.rejected += 1
+            raise AdmissionRejected(f"{self.in_flight} requests in flight and {self.waiting} queued")
+        self.waiting += 1
+        start = time.perf_counter()
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        wait_s = time.perf_counter() - start
+        self.total_wait_s += wait_s
+        self.max_wait_s = max(self.max_wait_s, wait_s)
+        self.admitted += 1
+        self.in_flight += 1
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    async def __aenter__(self) -> "AdmissionLimiter":
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        self.release()
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue-depth and admission counters for monitoring."""
+        return {
+            "max_concurrent": self.max_concurrent, "max_queued": self.max_queued,
+            "in_flight": self.in_flight, "queue_depth": self.waiting,
+            "admitted": self.admitted, "rejected": self.rejected,
+            "mean_wait_ms": 1000 * self.total_wait_s / self.admitted if self.admitted else 0.0,
+            "max_wait_ms": 1000 * self.max_wait_s,
+        }
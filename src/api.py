@@ -1,21 +1,87 @@
 # src/api.py
-from fastapi import FastAPI, HTTPException
+import asyncio
+import hmac
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple, Union
 import faiss
-from rank_bm25 import BM25Okapi
 
-from src.config import FAISS_INDEX_PATH, BM25_INDEX_PATH, CHUNKS_PATH
-from src.indexer import load_indexes  # We only need the load function now
-from src.retriever import query_boeing_manual
+from src.admission import AdmissionLimiter, AdmissionRejected
+from src.cache import AnswerCache, CachedAnswer, get_retrieval_cache
+from src.batch import batch_query
+from src.config import (FAISS_INDEX_PATH, BM25_INDEX_PATH, CHUNKS_PATH, INDEX_DIR, MANUALS_CONFIG, RETRIEVAL_WORKERS, BATCH_MAX_QUESTIONS, METRICS_ENABLED, QUERY_ENCODER_INT8,
+                        INDEX_WATCH_INTERVAL_S, ADMIN_TOKEN)
+from src.embedding import EmbeddingService, EmbeddingBatcher, CachedEmbedder, set_embedding_service
+from src.generator import Prompt, generate_from_prompt_async, stream_from_prompt_async
+from src.indexer import normalize_filters
+from src.llm_client import RETRYABLE_ERRORS, TIMEOUT_ERRORS, get_llm_client
+from src.metrics import in_context, observe_request, render_metrics, start_timing
+from src.page_images import set_page_image_store
+from src.registry import IndexRegistry, IndexWatcher, Manual, RetrievedQuery, lookup_tables, retrieve_query
+from src.retriever import answer_response, get_reranker
+from src.tables import TableAnswer
 
 # --- Pydantic Models for Request and Response ---
 class QuestionRequest(BaseModel):
     question: str
+    # Recall/latency knobs for approximate FAISS indexes (ignored by exact ones)
+    nprobe: Optional[int] = None
+    ef_search: Optional[int] = None
+    # Manuals to search (see GET /manuals); defaults to the default manual
+    manuals: Optional[List[str]] = None
+    # Restrict retrieval to chunks with these metadata values, e.g.
+    # {"table_type": "field_climb_limits", "altitude": "2000", "runway_condition": "dry"}.
+    # Fields: table_type, altitude, runway_condition, flap_setting.
+    filters: Optional[Dict[str, Union[str, int, float, List[Union[str, int, float]]]]] = None
+    # Include the per-stage timing breakdown in the response
+    timing: bool = False
+
+class Source(BaseModel):
+    manual: str
+    page: int
+    score: Optional[float] = None
 
 class AnswerResponse(BaseModel):
     answer: str
     pages: List[int]
+    sources: List[Source] = []
+    # "exact" or "semantic" when the answer came from the answer cache
+    cache: Optional[str] = None
+    # The performance table type when the answer was read directly from a table
+    table: Optional[str] = None
+    # When requested: {"total_ms", "stages_ms": {stage: ms}, "counts": {"prompt_tokens", "output_tokens", "images"}}
+    timing: Optional[Dict[str, Any]] = None
+
+class BatchRequest(BaseModel):
+    questions: List[str]
+    nprobe: Optional[int] = None
+    ef_search: Optional[int] = None
+    manuals: Optional[List[str]] = None
+    # Applied to every question (see QuestionRequest.filters)
+    filters: Optional[Dict[str, Union[str, int, float, List[Union[str, int, float]]]]] = None
+    # False returns the retrieved pages only, without calling Gemini
+    generate: bool = True
+
+class BatchItem(BaseModel):
+    question: str
+    answer: Optional[str] = None
+    pages: List[int] = []
+    sources: List[Source] = []
+    table: Optional[str] = None
+    # Set when this question failed; the other questions are unaffected
+    error: Optional[str] = None
+
+class BatchResponse(BaseModel):
+    results: List[BatchItem]
+
+class ReloadRequest(BaseModel):
+    # Manuals to reload; defaults to every loaded manual
+    manuals: Optional[List[str]] = None
 
 # --- FastAPI Application Initialization ---
 app = FastAPI(
@@ -25,9 +91,16 @@ app = FastAPI(
 )
 
 # --- Global Variables for Indexes and Chunks ---
-index: faiss.IndexFlatIP = None
-bm25: BM25Okapi = None
-all_chunks: List[Dict[str, Any]] = None
+# Manuals are loaded by the registry on demand and unloaded under its memory budget.
+registry: IndexRegistry = None
+embedder: CachedEmbedder = None
+# Hot-swaps manuals whose index files change (INDEX_WATCH_INTERVAL_S > 0).
+watcher: Optional[IndexWatcher] = None
+# Retrieval and prompt building are CPU-bound: they run on a pool sized to the cores,
+# while generation is awaited on the event loop.
+retrieval_executor = ThreadPoolExecutor(max_workers=RETRIEVAL_WORKERS or os.cpu_count() or 1, thread_name_prefix="retrieval")
+admission = AdmissionLimiter()
+answer_cache = AnswerCache()
 
 @app.on_event("startup")
 def startup_event():
@@ -35,15 +108,19 @@ def startup_event():
     On application startup, load the pre-built indexes from the data/ directory.
     The API is designed to run with pre-generated indexes and will not
     attempt to create them if they are missing.
+
+    Only the default manual is loaded here; other manuals registered in
+    MANUALS_CONFIG are loaded by the first request that targets them.
     """
-    global index, bm25, all_chunks
+    global registry, embedder, watcher
 
     print("Starting up the RAG system...")
-    print(f"Attempting to load indexes from: {FAISS_INDEX_PATH}")
-
-    loaded_index, loaded_bm25, loaded_chunks = load_indexes()
+    print(f"Attempting to load indexes from: {MANUALS_CONFIG or INDEX_DIR or FAISS_INDEX_PATH}")
 
-    if loaded_index is None or loaded_bm25 is None or loaded_chunks is None:
+    registry = IndexRegistry.from_config()
+    try:
+        default_manual = registry.get(registry.default_name)
+    except RuntimeError:
         # Provide a very clear error message to the user.
         error_message = (
             "FATAL: Could not load indexes. "
@@ -51,6 +128,7 @@ def startup_event():
             f"- {FAISS_INDEX_PATH}\n"
             f"- {BM25_INDEX_PATH}\n"
             f"- {CHUNKS_PATH}\n"
+            f"(or an index directory at INDEX_DIR={INDEX_DIR}, or the manuals listed in MANUALS_CONFIG={MANUALS_CONFIG})\n"
             "If you do not have these files, you must first run the document processing "
             "and indexing script to generate them."
         )
@@ -58,32 +136,318 @@ def startup_event():
         # Raising an exception will prevent the API from starting.
         raise RuntimeError(error_message)
 
-    print("✅ Indexes loaded successfully.")
-    index = loaded_index
-    bm25 = loaded_bm25
-    all_chunks = loaded_chunks
+    print(f"✅ Indexes loaded successfully ({len(registry.names())} manuals registered).")
+    # Page images are loaded lazily; chunks only keep a page reference.
+    set_page_image_store(default_manual.image_store)
+
+    # Load the embedding model once and share it with every request.
+    # Concurrent queries are micro-batched into a single forward pass, and the
+    # embeddings of repeated questions are cached. With QUERY_ENCODER_INT8 the
+    # model is quantized, as this service only embeds queries.
+    service = EmbeddingService(quantize=QUERY_ENCODER_INT8)
+    set_embedding_service(service)
+    embedder = CachedEmbedder(EmbeddingBatcher(service))
+    # Load the reranker (RERANKER) before the first request needs it.
+    get_reranker()
+
+    registry.swap_listeners.append(_on_swap)
+    if INDEX_WATCH_INTERVAL_S > 0:
+        watcher = IndexWatcher(registry).start()
+        print(f"Watching the index files for new versions every {INDEX_WATCH_INTERVAL_S:g}s.")
 
     print("RAG system is ready to accept queries.")
 
 
+@app.on_event("shutdown")
+def shutdown_event():
+    """Stops the index watcher, embedding batcher, reranker, retrieval, manual search and Gemini worker threads."""
+    if watcher is not None:
+        watcher.close()
+    if embedder is not None:
+        embedder.close()
+        get_reranker().close()
+    if registry is not None:
+        registry.close()
+    retrieval_executor.shutdown(wait=False)
+    get_llm_client().close()
+
+
 @app.get("/", tags=["General"])
 def read_root():
     """A simple root endpoint to check if the API is running."""
     return {"message": "Boeing 737 Manual RAG API is running. Access /docs for the API documentation."}
 
 
+@app.get("/manuals", tags=["General"])
+def list_manuals():
+    """Lists the registered manuals and which of them are currently loaded."""
+    if registry is None:
+        raise HTTPException(status_code=503, detail="RAG system is not initialized. Please check server logs.")
+    return {"default": registry.default_name, **registry.stats()}
+
+
+@app.get("/stats", tags=["General"])
+def read_stats():
+    """Admission queue depth, cache and Gemini client counters."""
+    stats = {"admission": admission.stats(), "answer_cache": answer_cache.stats(), "retrieval_cache": get_retrieval_cache().stats(), "llm": get_llm_client().stats()}
+    if embedder is not None:
+        stats["embedding_cache"] = embedder.cache.stats()
+        stats["reranker"] = get_reranker().stats()
+    if registry is not None:
+        stats["manuals"] = registry.stats()
+        stats["page_images"] = {manual.name: manual.image_store.stats() for manual in registry.loaded()}
+    return stats
+
+
+@app.get("/metrics", response_class=PlainTextResponse, tags=["General"])
+def read_metrics():
+    """Per-stage latency, request latency, token and image histograms in the Prometheus text format."""
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled (METRICS_ENABLED=false).")
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+def _on_swap(name: str, old: Optional[Manual], new: Manual) -> None:
+    """Drops what was cached for the replaced index version of a manual."""
+    answer_cache.invalidate(name)
+    if old is not None:
+        # Retrieval cache keys end with the index version.
+        dropped = get_retrieval_cache().discard(lambda key: key[-1] == old.version)
+        print(f" Dropped {dropped} cached search results of manual '{name}' (version {old.version})")
+    if name == registry.default_name:
+        set_page_image_store(new.image_store)
+
+
+def _check_request(request: Union[QuestionRequest, BatchRequest]) -> None:
+    if not all([registry, embedder]):
+        # This is a fallback check, should be caught by startup_event
+        raise HTTPException(status_code=503, detail="RAG system is not initialized. Please check server logs.")
+    unknown = [name for name in request.manuals or [] if name not in registry.specs]
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"Unknown manual(s): {', '.join(unknown)}. Available: {', '.join(registry.names())}")
+    try:
+        normalize_filters(request.filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _scope(request: QuestionRequest) -> Tuple[Any, ...]:
+    """Everything besides the question that changes the answer to a request."""
+    return (tuple(sorted(registry.resolve(request.manuals))), request.nprobe, request.ef_search, normalize_filters(request.filters))
+
+
+def _retrieve(request: QuestionRequest) -> Tuple[Optional[Union[CachedAnswer, TableAnswer]], Optional[str], Optional[RetrievedQuery], Optional[Prompt]]:
+    """
+    Runs on the retrieval executor: performance table lookup, answer cache
+    lookups, retrieval and prompt building. Returns (ready answer, tier,
+    retrieval, prompt), where tier is "table", "exact" or "semantic" for an
+    answer that needs no generation; the prompt is None then.
+
+    The request works on a snapshot of the manuals, so an index swap in the
+    middle of it does not mix versions.
+    """
+    with registry.snapshot() as manuals:
+        table_answer = lookup_tables(request.question, manuals, request.manuals)
+        if table_answer is not None:
+            return table_answer, "table", None, None
+        scope = _scope(request)
+        cached = answer_cache.get_exact(request.question, scope, manuals.versions(list(scope[0])))
+        if cached is not None:
+            return cached, "exact", None, None
+        retrieved = retrieve_query(request.question, manuals, request.manuals, embedder=embedder, nprobe=request.nprobe, ef_search=request.ef_search, filters=request.filters)
+        cached = answer_cache.get_similar(request.question, retrieved.query_embedding, retrieved.sources, scope, retrieved.versions)
+        if cached is not None:
+            return cached, "semantic", retrieved, None
+        return None, None, retrieved, retrieved.build_prompt()
+
+
+async def _prepare(request: QuestionRequest):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(retrieval_executor, in_context(_retrieve), request)
+
+
+def _remember(request: QuestionRequest, retrieved: RetrievedQuery, answer: str) -> None:
+    answer_cache.put(request.question, _scope(request), answer, retrieved.sources, retrieved.query_embedding, retrieved.versions)
+
+
+def _ready_response(ready: Union[CachedAnswer, TableAnswer], tier: str) -> Dict[str, Any]:
+    """The response for an answer read from a performance table or the answer cache."""
+    response = answer_response(ready.answer, ready.sources)
+    if isinstance(ready, TableAnswer):
+        return {**response, "table": ready.table}
+    return {**response, "cache": tier}
+
+
+def _batch(request: BatchRequest) -> List[Dict[str, Any]]:
+    with registry.snapshot() as manuals:
+        return batch_query(request.questions, manuals, request.manuals, embedder=embedder, nprobe=request.nprobe,
+                           ef_search=request.ef_search, filters=request.filters, generate=request.generate)
+
+
+def _busy(e: AdmissionRejected) -> HTTPException:
+    return HTTPException(status_code=429, detail=f"Server is busy ({e}). Please retry.", headers={"Retry-After": "1"})
+
+
+def _generation_status(e: Exception) -> int:
+    """
+    429 when no admission slot was free (a stream can pass the `is_full` check
+    and still lose its slot to a concurrent request), 504 when Gemini did not
+    answer within GEMINI_TIMEOUT_S, 502 when it kept failing; 500 otherwise.
+    """
+    if isinstance(e, AdmissionRejected):
+        return 429
+    if isinstance(e, TIMEOUT_ERRORS):
+        return 504
+    if isinstance(e, RETRYABLE_ERRORS):
+        return 502
+    return 500
+
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
 @app.post("/ask", response_model=AnswerResponse, tags=["Query"])
-def ask_question(request: QuestionRequest):
+async def ask_question(request: QuestionRequest):
     """
     Accepts a question about the Boeing 737 manual and returns an answer
     along with the page numbers used as references.
-    """
-    if not all([index, bm25, all_chunks]):
-        # This is a fallback check, should be caught by startup_event
-        raise HTTPException(status_code=503, detail="RAG system is not initialized. Please check server logs.")
 
+    Returns 429 when MAX_CONCURRENT_REQUESTS are being processed and
+    MAX_QUEUED_REQUESTS are already waiting, 504 when Gemini did not answer
+    within GEMINI_TIMEOUT_S and 502 when it kept failing (see `LLMClient`).
+    """
+    _check_request(request)
+    start = time.perf_counter()
+    timing = start_timing() if request.timing else None
     try:
-        response = query_boeing_manual(request.question, index, bm25, all_chunks)
+        async with admission:
+            cached, tier, retrieved, prompt = await _prepare(request)
+            if cached is not None:
+                response = _ready_response(cached, tier)
+            else:
+                answer = await generate_from_prompt_async(prompt)
+                response = answer_response(answer, retrieved.sources)
+        if cached is None:
+            _remember(request, retrieved, answer)
+        observe_request("/ask", time.perf_counter() - start)
+        if timing is not None:
+            response["timing"] = timing.as_dict()
         return response
+    except AdmissionRejected as e:
+        raise _busy(e)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"An error occurred during processing: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=_generation_status(e), detail=f"An error occurred during processing: {str(e)}")
+
+
+@app.post("/ask/batch", response_model=BatchResponse, tags=["Query"])
+async def ask_batch(request: BatchRequest):
+    """
+    Answers up to BATCH_MAX_QUESTIONS questions in one request, for offline
+    workloads. All questions are retrieved together (one embedding call, one
+    FAISS search and one BM25 pass per block of questions), then generated
+    on BATCH_WORKERS threads, at most BATCH_RATE_LIMIT Gemini calls per
+    second. Results come back in input order; a failed question carries an
+    "error" instead of failing the whole batch. The batch takes one
+    admission slot.
+    """
+    _check_request(request)
+    if len(request.questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_QUESTIONS} questions per batch, got {len(request.questions)}.")
+    start = time.perf_counter()
+    try:
+        async with admission:
+            loop = asyncio.get_running_loop()
+            results = await loop.run_in_executor(None, _batch, request)
+        observe_request("/ask/batch", time.perf_counter() - start)
+        return {"results": results}
+    except AdmissionRejected as e:
+        raise _busy(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"An error occurred during processing: {str(e)}")
+
+
+@app.post("/ask/stream", tags=["Query"])
+async def ask_question_stream(request: QuestionRequest):
+    """
+    Same as /ask, streamed as server-sent events. A `sources` event with the
+    retrieved pages and their scores is sent as soon as retrieval is done,
+    then `token` events as the answer is generated, and finally `done`
+    (with the timing breakdown when requested) or `error` (with the status
+    /ask would have returned).
+    """
+    _check_request(request)
+    if admission.is_full():
+        raise _busy(AdmissionRejected(f"{admission.in_flight} requests in flight and {admission.waiting} queued"))
+
+    async def events():
+        # The admission slot is held until the stream ends or the client goes away.
+        start = time.perf_counter()
+        timing = start_timing() if request.timing else None
+        try:
+            async with admission:
+                cached, tier, retrieved, prompt = await _prepare(request)
+                sources = cached.sources if cached is not None else retrieved.sources
+                table = cached.table if isinstance(cached, TableAnswer) else None
+                yield _sse("sources", {"pages": sorted({source["page"] for source in sources}), "sources": sources, "cache": None if table else tier, "table": table})
+                if cached is not None:
+                    yield _sse("token", {"text": cached.answer})
+                else:
+                    parts = []
+                    async for text in stream_from_prompt_async(prompt):
+                        parts.append(text)
+                        yield _sse("token", {"text": text})
+                    _remember(request, retrieved, "".join(parts))
+            observe_request("/ask/stream", time.perf_counter() - start)
+            yield _sse("done", {"timing": timing.as_dict()} if timing is not None else {})
+        except Exception as e:
+            yield _sse("error", {"status": _generation_status(e), "detail": f"An error occurred during processing: {str(e)}"})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+def _reload(names: List[str]) -> Dict[str, Any]:
+    """Swaps each manual to its current index files, one after the other (see `IndexRegistry.reload`)."""
+    loaded = {manual.name for manual in registry.loaded()}
+    report = {"swapped": {}, "unchanged": [], "not_loaded": [], "failed": {}}
+    for name in names:
+        if name not in loaded:
+            report["not_loaded"].append(name)
+            continue
+        try:
+            manual = registry.reload(name)
+        except Exception as e:
+            report["failed"][name] = str(e)
+            continue
+        if manual is None:
+            report["unchanged"].append(name)
+        else:
+            report["swapped"][name] = manual.version
+    return report
+
+
+@app.post("/admin/reload", tags=["Admin"])
+async def reload_indexes(request: Optional[ReloadRequest] = None, x_admin_token: Optional[str] = Header(None)):
+    """
+    Hot-swaps manuals to the current version of their index files, without
+    a restart. Each new version is loaded and validated off the event loop
+    while requests keep being served, then swapped in. Requests in flight
+    finish on the version they started with, and the caches of the replaced
+    version are dropped.
+
+    Requires the X-Admin-Token header to match ADMIN_TOKEN (404 when
+    ADMIN_TOKEN is not set). Manuals not loaded yet are reported as
+    "not_loaded"; they are loaded from the current files on first use.
+    """
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Admin endpoints are disabled (ADMIN_TOKEN is not set).")
+    if x_admin_token is None or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token.")
+    if registry is None:
+        raise HTTPException(status_code=503, detail="RAG system is not initialized. Please check server logs.")
+    names = request.manuals if request is not None and request.manuals else [manual.name for manual in registry.loaded()]
+    unknown = [name for name in names if name not in registry.specs]
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"Unknown manual(s): {', '.join(unknown)}. Available: {', '.join(registry.names())}")
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, _reload, names)
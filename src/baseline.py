@@ -0,0 +1,47 @@
+import json
+import os
+import platform
+import time
+from typing import List, Dict, Any, Sequence
+import numpy as np
+
+def latency_percentiles(values_ms: Sequence[float]) -> Dict[str, float]:
+    """p50/p95/p99 and mean of a list of latencies in milliseconds."""
+    if not values_ms:
+        return {"p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0, "mean_ms": 0.0}
+    p50, p95, p99 = np.percentile(values_ms, [50, 95, 99])
+    return {"p50_ms": float(p50), "p95_ms": float(p95), "p99_ms": float(p99), "mean_ms": float(np.mean(values_ms))}
+
+def save_baseline(metrics: Dict[str, float], path: str) -> None:
+    """Writes flat metrics (name -> value) with the machine they were measured on."""
+    baseline = {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count(), "metrics": metrics}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(baseline, f, indent=1)
+
+def compare_to_baseline(metrics: Dict[str, float], path: str, tolerance: float = 0.25) -> List[Dict[str, Any]]:
+    """
+    Compares metrics with a saved baseline. Latencies (`*_ms`) regress when
+    they grow by more than `tolerance`, throughputs (`*_rps`) when they drop
+    by more than `tolerance`. Returns one row per metric present in both.
+    """
+    with open(path, encoding="utf-8") as f:
+        baseline = json.load(f)["metrics"]
+    rows = []
+    for name, value in metrics.items():
+        if name not in baseline or not baseline[name]:
+            continue
+        change = value / baseline[name] - 1
+        regressed = change < -tolerance if name.endswith("_rps") else change > tolerance
+        rows.append({"metric": name, "baseline": baseline[name], "current": value, "change": change, "regressed": regressed})
+    return rows
+
+def print_baseline_comparison(rows: List[Dict[str, Any]], path: str) -> bool:
+    """Prints the comparison with a baseline. Returns True if anything regressed."""
+    print("\n" + "="*80)
+    print(f"COMPARISON WITH BASELINE {path}")
+    print("="*80)
+    for row in rows:
+        print(f"  {row['metric']:<45} {row['baseline']:10.3f} -> {row['current']:10.3f} ({row['change']:+7.1%}){'  REGRESSION' if row['regressed'] else ''}")
+    regressions = sum(row["regressed"] for row in rows)
+    print(f"{'❌' if regressions else '✅'} {regressions} regression(s) in {len(rows)} metrics")
+    return regressions > 0
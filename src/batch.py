@@ -0,0 +1,163 @@
+import json
+import sys
+import threading
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional
+from src.config import BATCH_WORKERS, BATCH_RATE_LIMIT, INFER_METADATA_FILTERS
+from src.embedding import Embedder, get_embedding_service
+from src.generator import generate_answer
+from src.indexer import MetadataFilters, search_parameters
+from src.registry import IndexRegistry, Manual, lookup_tables, merge_results
+from src.retriever import answer_response, batch_hybrid_search, build_context, hybrid_search, infer_filters, select_results
+
+
+class RateLimiter:
+    """Spaces calls at least `1 / rate` seconds apart across threads. A rate <= 0 disables it."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        time.sleep(max(0.0, slot - now))
+
+
+def batch_search_manuals(questions: List[str], manuals: List[Manual], query_embeddings: np.ndarray, top_k: int = 5, nprobe: Optional[int] = None, ef_search: Optional[int] = None, filters: Optional[MetadataFilters] = None) -> List[List[Dict[str, Any]]]:
+    """
+    `registry.search_manuals` for many questions: one `batch_hybrid_search`
+    per manual. Weight-limit questions with inferred filters (see
+    `retriever.infer_filters`) are searched one by one in their tables.
+
+    Returns:
+        The best `top_k` results of every question, in input order.
+    """
+    per_manual = []
+    for manual in manuals:
+        params = search_parameters(manual.index, nprobe=nprobe, ef_search=ef_search)
+        results: List[Optional[List[Dict[str, Any]]]] = [None] * len(questions)
+        if filters is None and INFER_METADATA_FILTERS:
+            for i, question in enumerate(questions):
+                inferred = infer_filters(question, manual.metadata)
+                if inferred:
+                    results[i] = hybrid_search(question, manual.index, manual.bm25, manual.chunks, top_k=top_k, page_index=manual.page_index, search_params=params, query_embedding=query_embeddings[i:i + 1], filters=inferred, metadata_index=manual.metadata) or None
+        rest = [i for i, result in enumerate(results) if result is None]
+        batch = batch_hybrid_search([questions[i] for i in rest], manual.index, manual.bm25, manual.chunks, top_k=top_k, page_index=manual.page_index, search_params=params, query_embeddings=query_embeddings[rest], filters=filters, metadata_index=manual.metadata)
+        for i, result in zip(rest, batch):
+            results[i] = result
+        per_manual.append(results)
+
+    if len(manuals) == 1:
+        return per_manual[0]
+    return [merge_results(manuals, [results[i] for results in per_manual], top_k) for i in range(len(questions))]
+
+
+def batch_query(questions: List[str], registry: IndexRegistry, names: Optional[List[str]] = None, top_k: int = 5, embedder: Optional[Embedder] = None, nprobe: Optional[int] = None, ef_search: Optional[int] = None, filters: Optional[MetadataFilters] = None, generate: bool = True, workers: int = BATCH_WORKERS, rate_limit: float = BATCH_RATE_LIMIT) -> List[Dict[str, Any]]:
+    """
+    Answers many questions for offline workloads (regression suites, analytics).
+
+    Questions the performance tables answer are answered directly. The rest
+    are embedded in one call and retrieved with `batch_search_manuals`.
+    Re-ranking, prompt building and generation then run on `workers` threads,
+    with at most `rate_limit` Gemini calls per second (0 = unlimited).
+
+    Args:
+        questions: The questions to answer.
+        registry: The index registry.
+        names: The manuals to search. Defaults to the registry's default manual.
+        top_k: The number of results used as context.
+        embedder: The shared embedding service. Defaults to the process-wide instance.
+        nprobe: IVF lists scanned per query, for approximate indexes.
+        ef_search: HNSW search depth, for approximate indexes.
+        filters: Metadata filters applied to every question (see `indexer.MetadataIndex`).
+        generate: If False, only retrieval is run and "answer" stays None.
+        workers: Threads re-ranking and generating in parallel.
+        rate_limit: Maximum Gemini calls per second (0 = unlimited).
+
+    Returns:
+        One dictionary per question, in input order, with "question",
+        "answer", "pages", "sources", "table" (the performance table type
+        for table answers) and "error" (None unless that question failed).
+    """
+    manuals = [registry.get(name) for name in registry.resolve(names)]
+    items = [{"question": question, "answer": None, "pages": [], "sources": [], "table": None, "error": None} for question in questions]
+
+    pending = []
+    for i, question in enumerate(questions):
+        try:
+            table_answer = lookup_tables(question, registry, names)
+        except Exception as e:
+            items[i]["error"] = f"Table lookup failed: {str(e)}"
+            continue
+        if table_answer is not None:
+            items[i].update(answer_response(table_answer.answer, table_answer.sources), table=table_answer.table)
+        else:
+            pending.append(i)
+    if not pending:
+        return items
+
+    pending_questions = [questions[i] for i in pending]
+    try:
+        query_embeddings = (embedder or get_embedding_service()).encode(pending_questions, batch_size=64)
+        retrieved = batch_search_manuals(pending_questions, manuals, query_embeddings, top_k=top_k * 2, nprobe=nprobe, ef_search=ef_search, filters=filters)
+    except Exception as e:
+        for i in pending:
+            items[i]["error"] = f"Retrieval failed: {str(e)}"
+        return items
+
+    limiter = RateLimiter(rate_limit)
+    image_stores = {manual.name: manual.image_store for manual in manuals}
+
+    def finish(position: int) -> None:
+        i = pending[position]
+        try:
+            context, visual_parts, sources = build_context(select_results(questions[i], retrieved[position], top_k))
+            for source in sources:
+                source.setdefault("manual", manuals[0].name)
+            answer = None
+            if generate:
+                limiter.wait()
+                try:
+                    answer = generate_answer(questions[i], context, visual_parts, image_store=manuals[0].image_store, image_stores=image_stores)
+                except Exception as e:
+                    items[i]["error"] = f"Generation failed: {str(e)}"
+            items[i].update(answer_response(answer, sources))
+        except Exception as e:
+            items[i]["error"] = str(e)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="batch") as pool:
+        list(pool.map(finish, range(len(pending))))
+    return items
+
+
+if __name__ == "__main__":
+    # Usage: python -m src.batch QUESTIONS_FILE [OUTPUT_JSONL] [--no-generate]
+    # QUESTIONS_FILE holds one question per line; results are written as JSON lines.
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    if not args:
+        print("Usage: python -m src.batch QUESTIONS_FILE [OUTPUT_JSONL] [--no-generate]")
+        sys.exit(1)
+    with open(args[0], encoding="utf-8") as f:
+        questions = [line.strip() for line in f if line.strip()]
+
+    registry = IndexRegistry.from_config()
+    start = time.perf_counter()
+    results = batch_query(questions, registry, generate="--no-generate" not in sys.argv)
+    elapsed = time.perf_counter() - start
+    registry.close()
+
+    output = open(args[1], "w", encoding="utf-8") if len(args) > 1 else sys.stdout
+    for item in results:
+        output.write(json.dumps(item) + "\n")
+    if output is not sys.stdout:
+        output.close()
+    failed = sum(1 for item in results if item["error"])
+    print(f"✅ Answered {len(results) - failed}/{len(results)} questions in {elapsed:.1f}s ({len(results) / elapsed:.1f} questions/s)", file=sys.stderr)
@@ -0,0 +1,521 @@
+import argparse
+import io
+import json
+import os
+import pickle
+import sys
+import tempfile
+import time
+import faiss
+import fitz
+import numpy as np
+import torch
+from typing import List, Dict, Any, Optional, Tuple, Callable
+from rank_bm25 import BM25Okapi
+from src.baseline import compare_to_baseline, print_baseline_comparison, save_baseline
+from src.config import FAISS_INDEX_PATH, BM25_INDEX_PATH
+from src.document_processor import process_pdf
+from src.embedding import EmbeddingService
+from src.evaluation import evaluate_rag_system, test_questions
+from src.index_store import EmbeddingMatrixIndex
+from src.indexer import (BM25Index, IdMappedIndex, RescoringIndex, build_faiss_index, build_page_index, chunk_vector_ids,
+                         id_mapped_index, load_indexes, save_index_dir, search_parameters, tokenize)
+from src.retriever import fuse_scores, hybrid_search, simple_rerank
+
+# --- Synthetic corpora ---
+
+def make_synthetic_chunks(num_chunks: int, max_chunks_per_page: int = 4, seed: int = 0) -> List[Dict[str, Any]]:
+    """Creates minimal chunk dictionaries spread over pages of 1..max_chunks_per_page chunks."""
+    rng = np.random.default_rng(seed)
+    chunks = []
+    page_num = 1
+    while len(chunks) < num_chunks:
+        for idx in range(int(rng.integers(1, max_chunks_per_page + 1))):
+            if len(chunks) == num_chunks:
+                break
+            chunks.append({"content": "", "page_number": page_num, "chunk_id": f"page_{page_num}_chunk_{idx}", "type": "text", "has_image": False, "metadata": {}})
+        page_num += 1
+    return chunks
+
+def make_synthetic_scores(num_chunks: int, num_semantic: int, seed: int = 0) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Creates FAISS-like (indices, distances) and a sparse BM25-like score vector."""
+    rng = np.random.default_rng(seed)
+    indices = rng.choice(num_chunks, size=num_semantic, replace=False)
+    distances = np.sort(rng.random(num_semantic).astype("float32"))[::-1]
+    bm25_scores = np.zeros(num_chunks)
+    matched = rng.choice(num_chunks, size=max(1, num_chunks // 20), replace=False)
+    bm25_scores[matched] = rng.random(len(matched)) * 20
+    return indices, distances, bm25_scores
+
+def make_synthetic_corpus(num_docs: int, vocab_size: int = 20_000, seed: int = 0) -> Tuple[List[List[str]], np.ndarray, np.ndarray]:
+    """Creates tokenized documents with a Zipf-like term distribution, plus the vocabulary and its probabilities."""
+    rng = np.random.default_rng(seed)
+    vocab = np.array([f"term{i}" for i in range(vocab_size)])
+    probs = 1 / np.arange(1, vocab_size + 1)
+    probs /= probs.sum()
+    lengths = rng.integers(20, 300, size=num_docs)
+    tokens = rng.choice(vocab, size=int(lengths.sum()), p=probs)
+    bounds = np.concatenate([[0], np.cumsum(lengths)])
+    corpus = [tokens[bounds[i]:bounds[i + 1]].tolist() for i in range(num_docs)]
+    return corpus, vocab, probs
+
+def make_synthetic_embeddings(num_vectors: int, dim: int = 384, num_clusters: int = 200, num_queries: int = 200, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """Creates clustered, L2-normalised vectors (like sentence embeddings of related chunks) and nearby queries."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((num_clusters, dim)).astype("float32")
+    vectors = centers[rng.integers(0, num_clusters, num_vectors)] + 0.6 * rng.standard_normal((num_vectors, dim)).astype("float32")
+    queries = vectors[rng.choice(num_vectors, num_queries, replace=False)] + 0.3 * rng.standard_normal((num_queries, dim)).astype("float32")
+    faiss.normalize_L2(vectors)
+    faiss.normalize_L2(queries)
+    return vectors, queries
+
+# --- Reference implementations ---
+
+def legacy_fuse_scores(semantic_indices: np.ndarray, semantic_distances: np.ndarray, bm25_scores: np.ndarray, all_chunks: List[Dict[str, Any]], top_k: int = 5, alpha: float = 0.5) -> List[Tuple[int, float]]:
+    """The original dict-based fusion from hybrid_search, kept as a correctness and speed baseline."""
+    semantic_scores = 1 / (1 + semantic_distances)
+    semantic_scores = semantic_scores / (semantic_scores.max() + 1e-6)
+    bm25_scores = bm25_scores / (bm25_scores.max() + 1e-6)
+
+    combined_scores = {}
+    for idx, score in zip(semantic_indices, semantic_scores):
+        combined_scores[idx] = alpha * score
+    for idx, score in enumerate(bm25_scores):
+        if idx in combined_scores:
+            combined_scores[idx] += (1 - alpha) * score
+        else:
+            combined_scores[idx] = (1 - alpha) * score
+
+    sorted_indices = sorted(combined_scores.items(), key=lambda x: x[1], reverse=True)
+
+    page_groups = {}
+    for idx, score in sorted_indices:
+        page_num = all_chunks[idx]["page_number"]
+        if page_num not in page_groups:
+            page_groups[page_num] = {"chunks": [], "max_score": score}
+        page_groups[page_num]["chunks"].append((int(idx), float(score)))
+        if score > page_groups[page_num]["max_score"]:
+            page_groups[page_num]["max_score"] = score
+
+    sorted_pages = sorted(page_groups.values(), key=lambda x: x["max_score"], reverse=True)
+    return [max(group["chunks"], key=lambda x: x[1]) for group in sorted_pages[:top_k]]
+
+# --- Timing helpers ---
+
+def time_call(fn: Callable[[], Any], repeats: int = 5) -> Dict[str, float]:
+    """Runs `fn` `repeats` times and returns min/median wall time in milliseconds."""
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {"min_ms": float(np.min(timings)), "median_ms": float(np.median(timings))}
+
+# --- Benchmarks ---
+
+def benchmark_fusion(num_chunks: int = 100_000, top_k: int = 10, alpha: float = 0.5, repeats: int = 5) -> Dict[str, Any]:
+    """
+    Compares the vectorized `fuse_scores` with the legacy dict-based fusion on a
+    synthetic corpus, checking that both return the same chunks.
+    """
+    chunks = make_synthetic_chunks(num_chunks)
+    page_index = build_page_index(chunks)
+    indices, distances, bm25_scores = make_synthetic_scores(num_chunks, top_k * 3)
+
+    legacy = legacy_fuse_scores(indices, distances, bm25_scores, chunks, top_k=top_k, alpha=alpha)
+    fused = fuse_scores(indices, distances, bm25_scores, page_index, top_k=top_k, alpha=alpha)
+    if [idx for idx, _ in legacy] != [idx for idx, _ in fused] or not np.allclose([s for _, s in legacy], [s for _, s in fused]):
+        raise AssertionError(f"Vectorized fusion diverged from legacy fusion:\n{legacy}\n{fused}")
+
+    legacy_time = time_call(lambda: legacy_fuse_scores(indices, distances, bm25_scores, chunks, top_k=top_k, alpha=alpha), repeats)
+    fused_time = time_call(lambda: fuse_scores(indices, distances, bm25_scores, page_index, top_k=top_k, alpha=alpha), repeats)
+    return {
+        "num_chunks": num_chunks,
+        "num_pages": len(page_index.page_numbers),
+        "legacy": legacy_time,
+        "vectorized": fused_time,
+        "speedup": legacy_time["median_ms"] / fused_time["median_ms"],
+    }
+
+def benchmark_bm25(num_docs: int = 20_000, num_queries: int = 20, query_len: int = 6, top_k: int = 10) -> Dict[str, Any]:
+    """
+    Compares rank_bm25.BM25Okapi full scans with the postings-based BM25Index
+    (dense scores and MaxScore top-k), checking that the scores match.
+    """
+    corpus, vocab, probs = make_synthetic_corpus(num_docs)
+    okapi = BM25Okapi(corpus)
+    index = BM25Index.from_corpus(corpus)
+    rng = np.random.default_rng(1)
+    queries = [rng.choice(vocab, size=query_len, p=probs).tolist() for _ in range(num_queries)]
+
+    for query in queries:
+        reference = okapi.get_scores(query)
+        if not np.allclose(reference, index.get_scores(query)):
+            raise AssertionError(f"BM25Index scores diverged from BM25Okapi for {query}")
+        _, top_scores = index.get_top_k(query, top_k)
+        if not np.allclose(top_scores, np.sort(reference)[::-1][:top_k]):
+            raise AssertionError(f"BM25Index top-k diverged from BM25Okapi for {query}")
+
+    okapi_time = time_call(lambda: [okapi.get_scores(q) for q in queries], repeats=3)
+    scores_time = time_call(lambda: [index.get_scores(q) for q in queries], repeats=3)
+    top_k_time = time_call(lambda: [index.get_top_k(q, top_k) for q in queries], repeats=3)
+    per_query = lambda t: t["median_ms"] / num_queries
+    return {
+        "num_docs": num_docs,
+        "okapi_ms_per_query": per_query(okapi_time),
+        "postings_ms_per_query": per_query(scores_time),
+        "top_k_ms_per_query": per_query(top_k_time),
+    }
+
+def benchmark_ann(num_vectors: int = 100_000, dim: int = 384, k: int = 10, num_queries: int = 200) -> List[Dict[str, Any]]:
+    """
+    Measures recall@k against exact IndexFlatIP search and per-query latency
+    for each approximate index type over a sweep of nprobe / efSearch values.
+    """
+    vectors, queries = make_synthetic_embeddings(num_vectors, dim, num_queries=num_queries)
+    ids = np.arange(num_vectors, dtype=np.int64)
+    flat = build_faiss_index(vectors, ids, kind="flat")
+    _, truth = flat.search(queries, k)
+    flat_time = time_call(lambda: flat.search(queries, k), repeats=3)
+    reports = [{"kind": "flat", "param": "-", "recall": 1.0, "build_s": 0.0, "ms_per_query": flat_time["median_ms"] / num_queries}]
+
+    sweeps = {"hnsw": ("ef_search", (16, 32, 64, 128, 256)), "ivf_flat": ("nprobe", (1, 4, 16, 64)), "ivf_pq": ("nprobe", (1, 4, 16, 64))}
+    for kind, (param, values) in sweeps.items():
+        start = time.perf_counter()
+        index = build_faiss_index(vectors, ids, kind=kind)
+        build_s = time.perf_counter() - start
+        for value in values:
+            params = search_parameters(index, **{param: value})
+            _, found = index.search(queries, k, params=params)
+            recall = np.mean([len(np.intersect1d(found[i], truth[i])) / k for i in range(num_queries)])
+            search_time = time_call(lambda: index.search(queries, k, params=params), repeats=3)
+            reports.append({"kind": kind, "param": f"{param}={value}", "recall": float(recall), "build_s": build_s, "ms_per_query": search_time["median_ms"] / num_queries})
+    return reports
+
+def faiss_index_bytes(index: faiss.Index) -> int:
+    """Size of the serialized index: the memory its codes, ids and quantizers take."""
+    return len(faiss.serialize_index(index))
+
+def benchmark_quantization(num_vectors: int = 100_000, dim: int = 384, k: int = 10, num_queries: int = 200, factor: int = 4) -> List[Dict[str, Any]]:
+    """
+    Compares flat float32 storage with SQ8 and PQ codes, with and without
+    re-scoring `k * factor` candidates against the exact vectors: index
+    memory, latency and recall@k against exact search.
+    """
+    vectors, queries = make_synthetic_embeddings(num_vectors, dim, num_queries=num_queries)
+    ids = np.arange(num_vectors, dtype=np.int64)
+    _, truth = EmbeddingMatrixIndex(vectors).search(queries, k)
+    reports = []
+    for kind in ("flat", "sq8", "pq"):
+        start = time.perf_counter()
+        index = build_faiss_index(vectors, ids, kind=kind)
+        build_s = time.perf_counter() - start
+        variants = [("-", IdMappedIndex(index, ids))]
+        if kind != "flat":
+            variants.append((f"rescore x{factor}", RescoringIndex(index, ids, vectors, factor=factor)))
+        for rescoring, searcher in variants:
+            _, found = searcher.search(queries, k)
+            recall = np.mean([len(np.intersect1d(found[i], truth[i])) / k for i in range(num_queries)])
+            search_time = time_call(lambda: searcher.search(queries, k), repeats=3)
+            reports.append({"kind": kind, "rescoring": rescoring, "index_mb": faiss_index_bytes(index) / 2**20, "recall": float(recall), "build_s": build_s, "ms_per_query": search_time["median_ms"] / num_queries})
+    return reports
+
+def model_bytes(model: torch.nn.Module) -> int:
+    """Size of the saved weights (int8 layers store packed weights)."""
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell()
+
+def benchmark_query_encoder(questions: List[str], repeats: int = 3) -> List[Dict[str, Any]]:
+    """
+    Compares the float32 and the int8 (dynamically quantized) query encoder:
+    weight size, single-query encode latency, and the cosine similarity of
+    their embeddings. Returns both services as well, for retrieval runs.
+    """
+    reports = []
+    reference = None
+    for quantize in (False, True):
+        service = EmbeddingService(device="cpu", quantize=quantize)
+        latencies = []
+        for _ in range(repeats):
+            for question in questions:
+                start = time.perf_counter()
+                service.encode_query(question)
+                latencies.append((time.perf_counter() - start) * 1000)
+        embeddings = service.encode(questions)
+        faiss.normalize_L2(embeddings)
+        if reference is None:
+            reference = embeddings
+        reports.append({
+            "encoder": "int8" if service.quantized else "float32",
+            "model_mb": model_bytes(service.model) / 2**20,
+            "encode_p50_ms": float(np.percentile(latencies, 50)),
+            "encode_p95_ms": float(np.percentile(latencies, 95)),
+            "cosine_to_float32": float(np.mean(np.sum(embeddings * reference, axis=1))),
+            "service": service,
+        })
+    return reports
+
+def index_vectors(index: Any, chunks: List[Dict[str, Any]]) -> np.ndarray:
+    """The exact float32 vectors of a loaded index, in chunk order."""
+    if isinstance(index, RescoringIndex):
+        return np.asarray(index.exact_vectors, dtype=np.float32)
+    if isinstance(index, IdMappedIndex):
+        return index.embeddings(chunk_vector_ids(chunks))
+    if isinstance(index, EmbeddingMatrixIndex):
+        return np.asarray(index.embeddings, dtype=np.float32)
+    return index.reconstruct_n(0, index.ntotal)
+
+def benchmark_manual(questions: List[Tuple[str, List[int]]], kinds: Tuple[str, ...] = ("sq8", "pq"), use_reranking: bool = False) -> List[Dict[str, Any]]:
+    """
+    Retrieval-only evaluation (Recall@5, MRR, search latency, see
+    `evaluation.evaluate_rag_system`) of the configured manual: the current
+    index with the float32 and int8 query encoders, and quantized copies of
+    its vectors with re-scoring.
+    """
+    index, bm25, chunks = load_indexes()
+    if index is None:
+        raise RuntimeError("No indexes found; build them first (python -m src.indexer).")
+    chunk_ids = chunk_vector_ids(chunks)
+    vectors = index_vectors(index, chunks)
+    page_index = build_page_index(chunks)
+    encoders = benchmark_query_encoder([question for question, _ in questions])
+
+    def evaluate(label: str, searcher: Any, encoder: Dict[str, Any], memory_bytes: int) -> Dict[str, Any]:
+        metrics = evaluate_rag_system(questions, searcher, bm25, chunks, use_reranking=use_reranking, embedder=encoder["service"], page_index=page_index, verbose=False)["summary_metrics"]
+        return {"index": label, "encoder": encoder["encoder"], "vectors_mb": memory_bytes / 2**20, "encode_p50_ms": encoder["encode_p50_ms"],
+                "recall_at_5": metrics["mean_recall_at_5"], "mrr": metrics["mean_reciprocal_rank"], "search_p50_ms": metrics["latency"]["search"]["p50_ms"]}
+
+    reports = [evaluate("current", index, encoder, vectors.nbytes) for encoder in encoders]
+    for kind in kinds:
+        quantized = build_faiss_index(vectors, chunk_ids, kind=kind)
+        searcher = id_mapped_index(quantized, chunk_ids, vectors)
+        reports.extend(evaluate(kind, searcher, encoder, faiss_index_bytes(quantized)) for encoder in encoders)
+    return reports
+
+# --- Query pipeline on the shipped manual and scaled copies ---
+
+def load_shipped_corpus(faiss_index_path: str = FAISS_INDEX_PATH, bm25_index_path: str = BM25_INDEX_PATH) -> Optional[Tuple[List[Dict[str, Any]], np.ndarray]]:
+    """
+    The configured manual as (chunks, vectors in chunk order), or None if
+    its indexes are missing. The chunk pickle is not shipped: without it,
+    each chunk's text is rebuilt from the term frequencies of the
+    `rank_bm25` model (word order is lost, BM25 scores are not) and chunks
+    are spread two per page.
+    """
+    index, _, chunks = load_indexes()
+    if index is not None:
+        return list(chunks), index_vectors(index, chunks)
+    if not (faiss_index_path and bm25_index_path and os.path.exists(faiss_index_path) and os.path.exists(bm25_index_path)):
+        return None
+    index = faiss.read_index(faiss_index_path)
+    with open(bm25_index_path, "rb") as f:
+        bm25 = pickle.load(f)
+    if not isinstance(bm25, BM25Okapi) or len(bm25.doc_freqs) != index.ntotal:
+        return None
+    chunks = []
+    for i, term_freqs in enumerate(bm25.doc_freqs):
+        content = " ".join(" ".join([term] * freq) for term, freq in term_freqs.items())
+        chunks.append({"content": content, "page_number": i // 2 + 1, "chunk_id": f"page_{i // 2 + 1}_chunk_{i % 2}", "type": "text", "has_image": False, "metadata": {}})
+    return chunks, index.reconstruct_n(0, index.ntotal)
+
+def scale_corpus(chunks: List[Dict[str, Any]], vectors: np.ndarray, scale: int, seed: int = 0) -> Tuple[List[Dict[str, Any]], np.ndarray]:
+    """
+    Replicates a corpus `scale` times into one larger manual. Copy i of a
+    page becomes page `page + i * num_pages`, and each copy's vectors are
+    perturbed and re-normalised, so copies are near neighbours, not ties.
+    """
+    if scale <= 1:
+        return chunks, vectors
+    rng = np.random.default_rng(seed)
+    num_pages = max(chunk["page_number"] for chunk in chunks)
+    scaled_chunks = []
+    for copy in range(scale):
+        for chunk in chunks:
+            page_number = chunk["page_number"] + copy * num_pages
+            scaled_chunks.append({**chunk, "page_number": page_number, "chunk_id": f"{chunk['chunk_id']}_copy_{copy}"})
+    scaled_vectors = np.tile(vectors, (scale, 1)) + 0.05 * rng.standard_normal((scale * len(vectors), vectors.shape[1])).astype("float32")
+    scaled_vectors[:len(vectors)] = vectors
+    faiss.normalize_L2(scaled_vectors)
+    return scaled_chunks, scaled_vectors
+
+def benchmark_pipeline(chunks: List[Dict[str, Any]], vectors: np.ndarray, top_k: int = 5, num_queries: int = 50, seed: int = 0) -> Dict[str, Any]:
+    """
+    Per-call latency of the query pipeline stages over a corpus served as an
+    exact embedding matrix (the index directory format): FAISS search, BM25
+    scoring (dense scores and MaxScore top-k), the full `hybrid_search`
+    (2 * `top_k` candidates, as `/ask`) and `simple_rerank`. Queries are
+    noisy copies of random chunks (first words and vector), so the
+    embedding model is not timed. Also times `load_indexes` of the corpus
+    written as an index directory.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    index = EmbeddingMatrixIndex(vectors)
+    bm25 = BM25Index.from_corpus([tokenize(chunk["content"]) for chunk in chunks])
+    page_index = build_page_index(chunks)
+
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(chunks), size=num_queries)
+    query_embeddings = vectors[picks] + 0.1 * rng.standard_normal((num_queries, vectors.shape[1])).astype("float32")
+    faiss.normalize_L2(query_embeddings)
+    queries = [" ".join(chunks[i]["content"].split()[:8]) or "takeoff" for i in picks]
+    query_tokens = [tokenize(query) for query in queries]
+    k = top_k * 2
+
+    search = lambda i: hybrid_search(queries[i], index, bm25, chunks, top_k=k, page_index=page_index, query_embedding=query_embeddings[i:i + 1])
+    candidates = [search(i) for i in range(num_queries)]
+    per_call = lambda fn: time_call(lambda: [fn(i) for i in range(num_queries)], repeats=3)["median_ms"] / num_queries
+    report = {
+        "num_chunks": len(chunks),
+        "faiss_search_ms": per_call(lambda i: index.search(query_embeddings[i:i + 1], k)),
+        "bm25_scores_ms": per_call(lambda i: bm25.get_scores(query_tokens[i])),
+        "bm25_top_k_ms": per_call(lambda i: bm25.get_top_k(query_tokens[i], k)),
+        "hybrid_search_ms": per_call(search),
+        "simple_rerank_ms": per_call(lambda i: simple_rerank(queries[i], candidates[i])),
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "index")
+        save_index_dir(path, vectors, bm25, chunks)
+        report["load_indexes_ms"] = time_call(lambda: load_indexes(None, None, None, index_dir=path), repeats=3)["median_ms"]
+    return report
+
+def make_synthetic_pdf(path: str, num_pages: int = 20, lines_per_page: int = 40, seed: int = 0) -> None:
+    """Writes a text-only PDF of manual-like pages (numbered procedure lines)."""
+    rng = np.random.default_rng(seed)
+    words = ["flaps", "thrust", "check", "set", "verify", "engine", "start", "lever", "switch", "annunciator", "takeoff", "climb", "altitude", "speed", "runway", "weight"]
+    doc = fitz.open()
+    for page_number in range(1, num_pages + 1):
+        page = doc.new_page()
+        for line in range(lines_per_page):
+            text = f"{page_number}.{line + 1} " + " ".join(rng.choice(words, size=10))
+            page.insert_text((50, 50 + line * 17), text, fontsize=10)
+    doc.save(path)
+    doc.close()
+
+def benchmark_process_pdf(pdf_path: Optional[str] = None, num_pages: int = 20, workers: int = 1) -> Dict[str, Any]:
+    """
+    Per-page time of `process_pdf` (extraction, classification, table
+    detection and chunking) on `pdf_path`, or on a synthetic text PDF.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        if pdf_path is None:
+            pdf_path = os.path.join(tmp, "synthetic.pdf")
+            make_synthetic_pdf(pdf_path, num_pages)
+        with fitz.open(pdf_path) as doc:
+            num_pages = doc.page_count
+        start = time.perf_counter()
+        chunks = process_pdf(pdf_path, workers=workers)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+    return {"pdf": os.path.basename(pdf_path), "num_pages": num_pages, "num_chunks": len(chunks), "ms_per_page": elapsed_ms / num_pages}
+
+# --- Baselines ---
+
+SUITES = ("fusion", "bm25", "ann", "quantization", "pipeline")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Retrieval micro-benchmarks")
+    parser.add_argument("--suites", nargs="+", choices=SUITES, default=list(SUITES), help="benchmarks to run (default: all)")
+    parser.add_argument("--scales", type=int, nargs="+", default=[10, 100], help="pipeline: sizes of the scaled copies of the manual")
+    parser.add_argument("--pdf", help="pipeline: time process_pdf on this PDF instead of a synthetic one")
+    parser.add_argument("--manual", nargs="?", const="", metavar="QUESTIONS_JSON", help="also evaluate quantized storage and the int8 query encoder on the configured manual")
+    parser.add_argument("--save-baseline", metavar="PATH", help="write the measured latencies to PATH (JSON)")
+    parser.add_argument("--baseline", metavar="PATH", help="compare with a saved baseline; exits with 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="relative slowdown counted as a regression")
+    args = parser.parse_args()
+    # Flat name -> value metrics for baselines.
+    metrics: Dict[str, float] = {}
+
+    if "fusion" in args.suites:
+        print("="*80)
+        print("HYBRID SCORE FUSION: LEGACY vs VECTORIZED")
+        print("="*80)
+        for n in (1_000, 10_000, 100_000):
+            report = benchmark_fusion(num_chunks=n)
+            metrics[f"fusion/{n}/vectorized_ms"] = report["vectorized"]["median_ms"]
+            print(f"{report['num_chunks']:>8} chunks / {report['num_pages']:>6} pages | "
+                  f"legacy {report['legacy']['median_ms']:9.2f} ms | "
+                  f"vectorized {report['vectorized']['median_ms']:7.2f} ms | "
+                  f"speedup x{report['speedup']:.1f}")
+
+    if "bm25" in args.suites:
+        print("\n" + "="*80)
+        print("BM25: rank_bm25 FULL SCAN vs POSTINGS INDEX")
+        print("="*80)
+        for n in (2_000, 20_000):
+            report = benchmark_bm25(num_docs=n)
+            metrics[f"bm25/{n}/postings_ms"] = report["postings_ms_per_query"]
+            metrics[f"bm25/{n}/top_k_ms"] = report["top_k_ms_per_query"]
+            print(f"{report['num_docs']:>8} docs | "
+                  f"BM25Okapi {report['okapi_ms_per_query']:8.2f} ms | "
+                  f"postings {report['postings_ms_per_query']:6.2f} ms | "
+                  f"MaxScore top-k {report['top_k_ms_per_query']:6.2f} ms")
+
+    if "ann" in args.suites:
+        print("\n" + "="*80)
+        print("FAISS: RECALL@10 vs LATENCY (exact IndexFlatIP is the ground truth)")
+        print("="*80)
+        for n in (10_000, 50_000):
+            print(f"{n} vectors")
+            for report in benchmark_ann(num_vectors=n):
+                print(f"  {report['kind']:>8} {report['param']:>14} | "
+                      f"recall {report['recall']:.3f} | "
+                      f"{report['ms_per_query']:6.3f} ms/query | "
+                      f"build {report['build_s']:6.1f} s")
+
+    if "quantization" in args.suites:
+        print("\n" + "="*80)
+        print("QUANTIZED STORAGE: MEMORY vs RECALL@10 (exact search is the ground truth)")
+        print("="*80)
+        for report in benchmark_quantization(num_vectors=50_000):
+            print(f"  {report['kind']:>5} {report['rescoring']:>11} | "
+                  f"index {report['index_mb']:7.1f} MB | "
+                  f"recall {report['recall']:.3f} | "
+                  f"{report['ms_per_query']:6.3f} ms/query | "
+                  f"build {report['build_s']:6.1f} s")
+
+    if "pipeline" in args.suites:
+        print("\n" + "="*80)
+        print("QUERY PIPELINE: SHIPPED MANUAL AND SCALED COPIES (ms per call)")
+        print("="*80)
+        shipped = load_shipped_corpus()
+        if shipped is None:
+            print("No shipped indexes found; using a synthetic corpus of 200 chunks as the base.")
+            vectors, _ = make_synthetic_embeddings(200, num_queries=1)
+            corpus, _, _ = make_synthetic_corpus(200)
+            chunks = make_synthetic_chunks(200)
+            for chunk, tokens in zip(chunks, corpus):
+                chunk["content"] = " ".join(tokens)
+            shipped = (chunks, vectors)
+        for scale in [1] + args.scales:
+            report = benchmark_pipeline(*scale_corpus(*shipped, scale))
+            label = "shipped" if scale == 1 else f"x{scale}"
+            stages = [key for key in report if key.endswith("_ms")]
+            metrics.update({f"pipeline/{label}/{key}": report[key] for key in stages})
+            print(f"{label:>8} ({report['num_chunks']:>6} chunks) | " + " | ".join(f"{key[:-3]} {report[key]:7.3f}" for key in stages))
+        report = benchmark_process_pdf(args.pdf)
+        metrics["pipeline/process_pdf/ms_per_page"] = report["ms_per_page"]
+        print(f"process_pdf: {report['ms_per_page']:.1f} ms/page ({report['pdf']}, {report['num_pages']} pages, {report['num_chunks']} chunks, 1 worker)")
+
+    if args.manual is not None:
+        questions = test_questions
+        if args.manual:
+            with open(args.manual, encoding="utf-8") as f:
+                questions = [(question, pages) for question, pages in json.load(f)]
+        print("\n" + "="*80)
+        print(f"MANUAL: QUANTIZED STORAGE AND INT8 QUERY ENCODER ({len(questions)} questions, retrieval only)")
+        print("="*80)
+        for report in benchmark_manual(questions):
+            print(f"  {report['index']:>7} / {report['encoder']:>7} | "
+                  f"vectors {report['vectors_mb']:7.2f} MB | "
+                  f"encode p50 {report['encode_p50_ms']:6.1f} ms | "
+                  f"R@5 {report['recall_at_5']:.3f} | MRR {report['mrr']:.3f} | "
+                  f"search p50 {report['search_p50_ms']:6.1f} ms")
+
+    if args.save_baseline:
+        save_baseline(metrics, args.save_baseline)
+        print(f"\n✅ Baseline of {len(metrics)} metrics written to {args.save_baseline}")
+    if args.baseline:
+        if print_baseline_comparison(compare_to_baseline(metrics, args.baseline, args.tolerance), args.baseline):
+            sys.exit(1)
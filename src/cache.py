@@ -0,0 +1,258 @@
+import re
+import threading
+import time
+import numpy as np
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Dict, Any, Optional, Tuple, Callable, Hashable
+from src.config import ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL_S, ANSWER_CACHE_SIMILARITY, RETRIEVAL_CACHE_MB
+
+def normalize_question(question: str) -> str:
+    """Lower-cases, collapses whitespace and drops trailing punctuation."""
+    return re.sub(r"\s+", " ", question.lower()).strip().rstrip("?.! ")
+
+# A number, with the unit that follows it if any: "2,000 ft", "50°C", "-5 c", "15".
+_QUANTITY = re.compile(r"(?<![\w.])(-?\d+(?:,\d{3})*(?:\.\d+)?)\s*(°\s*[cf]\b|(?:ft|feet|m|kg|lbs?|kts?|knots|nm|hpa|inhg|c|f)\b|%)?")
+_UNIT_ALIASES = {"feet": "ft", "lbs": "lb", "kt": "kts", "knots": "kts"}
+
+def question_quantities(question: str) -> Tuple[str, ...]:
+    """
+    The numbers of a question with their units, e.g. ("2000ft", "50c"), in
+    sorted order. Questions that differ only in a value embed almost the same,
+    so the semantic cache tier also requires these to match.
+    """
+    quantities = []
+    for number, unit in _QUANTITY.findall(normalize_question(question)):
+        unit = re.sub(r"[°\s]", "", unit)
+        quantities.append(f"{float(number.replace(',', '')):g}{_UNIT_ALIASES.get(unit, unit)}")
+    return tuple(sorted(quantities))
+
+
+class LRUCache:
+    """
+    A thread-safe LRU cache bounded by the (estimated) size of its values in
+    bytes. `sizeof` estimates the size of a value.
+    """
+
+    def __init__(self, max_bytes: int, sizeof: Callable[[Any], int]):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self._entries: "OrderedDict[Hashable, Tuple[Any, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def discard(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Drops the entries whose key matches `predicate`. Returns how many were dropped."""
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                self._bytes -= self._entries.pop(key)[1]
+            return len(keys)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and memory use for monitoring."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes,
+                "hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+
+def _results_size(results: Tuple[Dict[str, Any], ...]) -> int:
+    # Chunk text dominates; the rest of each result is a few hundred bytes.
+    return sum(len(result["content"]) + 300 for result in results)
+
+_retrieval_cache: Optional[LRUCache] = None
+_retrieval_cache_lock = threading.Lock()
+
+def get_retrieval_cache() -> LRUCache:
+    """
+    Returns the process-wide cache of hybrid search results, keyed by query,
+    search settings and index version (see `retriever.hybrid_search`).
+    """
+    global _retrieval_cache
+    if _retrieval_cache is None:
+        with _retrieval_cache_lock:
+            if _retrieval_cache is None:
+                _retrieval_cache = LRUCache(RETRIEVAL_CACHE_MB * 1024 * 1024, _results_size)
+    return _retrieval_cache
+
+
+@dataclass
+class CachedAnswer:
+    answer: str
+    sources: List[Dict[str, Any]]
+    query_embedding: np.ndarray
+    page_set: frozenset
+    quantities: Tuple[str, ...]
+    versions: Dict[str, str]
+    created: float
+
+
+class AnswerCache:
+    """
+    Two-tier cache of generated answers.
+
+    The exact tier is keyed by the normalized question (plus the request
+    scope: manuals and search settings) and is checked before retrieval. The
+    semantic tier is checked after retrieval: an answer is reused when the new
+    query's embedding has a cosine similarity above `threshold` with a cached
+    query, retrieval picked the same set of pages AND both questions name the
+    same numbers (`question_quantities`), so "... at 50°C" never reuses the
+    answer to "... at 40°C".
+
+    Entries expire after `ttl_s`, the least recently used are evicted beyond
+    `max_entries`, and entries built from an older version of a manual's
+    index are dropped.
+    """
+
+    def __init__(self, max_entries: int = ANSWER_CACHE_SIZE, ttl_s: float = ANSWER_CACHE_TTL_S, threshold: float = ANSWER_CACHE_SIMILARITY):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.threshold = threshold
+        self._entries: "OrderedDict[Tuple[str, Any], CachedAnswer]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Embedding matrix of the entries, rebuilt lazily after changes.
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_keys: List[Tuple[str, Any]] = []
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _valid(self, entry: CachedAnswer, versions: Dict[str, str], now: float) -> bool:
+        return now - entry.created <= self.ttl_s and entry.versions == versions
+
+    def _drop(self, key: Tuple[str, Any]) -> None:
+        del self._entries[key]
+        self._matrix = None
+
+    def get_exact(self, question: str, scope: Any, versions: Dict[str, str]) -> Optional[CachedAnswer]:
+        """Looks up the normalized question. `versions` maps each manual to its current index version."""
+        if not self.enabled:
+            return None
+        key = (normalize_question(question), scope)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if not self._valid(entry, versions, now):
+                self._drop(key)
+                self.expirations += 1
+                return None
+            self._entries.move_to_end(key)
+            self.exact_hits += 1
+            return entry
+
+    def get_similar(self, question: str, query_embedding: np.ndarray, sources: List[Dict[str, Any]], scope: Any, versions: Dict[str, str]) -> Optional[CachedAnswer]:
+        """
+        Looks for a cached answer to a similar question (cosine >= threshold)
+        with the same numbers, built from the same pages. Counts a miss when
+        nothing matches.
+        """
+        if not self.enabled:
+            return None
+        query = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+        query = query / (np.linalg.norm(query) + 1e-12)
+        page_set = frozenset((source.get("manual"), source["page"]) for source in sources)
+        quantities = question_quantities(question)
+        now = time.time()
+        with self._lock:
+            if self._entries:
+                if self._matrix is None:
+                    self._matrix_keys = list(self._entries)
+                    self._matrix = np.stack([self._entries[key].query_embedding for key in self._matrix_keys])
+                similarities = self._matrix @ query
+                for pos in np.argsort(-similarities):
+                    if similarities[pos] < self.threshold:
+                        break
+                    key = self._matrix_keys[pos]
+                    entry = self._entries[key]
+                    if key[1] == scope and entry.page_set == page_set and entry.quantities == quantities and self._valid(entry, versions, now):
+                        self._entries.move_to_end(key)
+                        self.semantic_hits += 1
+                        return entry
+            self.misses += 1
+            return None
+
+    def put(self, question: str, scope: Any, answer: str, sources: List[Dict[str, Any]], query_embedding: np.ndarray, versions: Dict[str, str]) -> None:
+        """Caches a generated answer."""
+        if not self.enabled:
+            return
+        query = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+        entry = CachedAnswer(
+            answer=answer, sources=sources, query_embedding=query / (np.linalg.norm(query) + 1e-12),
+            page_set=frozenset((source.get("manual"), source["page"]) for source in sources),
+            quantities=question_quantities(question), versions=dict(versions), created=time.time(),
+        )
+        key = (normalize_question(question), scope)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = entry
+            self._matrix = None
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, manual: Optional[str] = None) -> None:
+        """Drops every entry, or only those built from `manual`."""
+        with self._lock:
+            keys = [key for key, entry in self._entries.items() if manual is None or manual in entry.versions]
+            for key in keys:
+                del self._entries[key]
+            self._matrix = None
+            self.invalidations += len(keys)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for monitoring."""
+        with self._lock:
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            return {
+                "entries": len(self._entries), "max_entries": self.max_entries,
+                "exact_hits": self.exact_hits, "semantic_hits": self.semantic_hits, "misses": self.misses,
+                "hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+                "evictions": self.evictions, "expirations": self.expirations, "invalidations": self.invalidations,
+            }
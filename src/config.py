@@ -6,12 +6,107 @@ load_dotenv()
 
 # Get configuration from environment
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-#PDF_PATH = os.getenv("PDF_PATH")
+PDF_PATH = os.getenv("PDF_PATH")  # optional; used to render page images on demand
 FAISS_INDEX_PATH = os.getenv("FAISS_INDEX_PATH")
 BM25_INDEX_PATH = os.getenv("BM25_INDEX_PATH")
 CHUNKS_PATH = os.getenv("CHUNKS_PATH")
+# Optional compact, memory-mapped index directory (see src/index_store.py).
+# When it exists it is loaded instead of the three files above.
+INDEX_DIR = os.getenv("INDEX_DIR")
+
+# Gemini settings (optional). GEMINI_API_ENDPOINT points the client at another
+# REST endpoint, e.g. the local stub server (python -m src.stub_llm).
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-pro")
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT")
+# Generation client (see src/llm_client.py)
+GEMINI_FALLBACK_MODEL = os.getenv("GEMINI_FALLBACK_MODEL", "")  # cheaper model for text-only prompts when GEMINI_MODEL fails ("" = none)
+GEMINI_TIMEOUT_S = float(os.getenv("GEMINI_TIMEOUT_S", "60"))  # deadline of one answer, retries and fallback included
+GEMINI_RETRIES = int(os.getenv("GEMINI_RETRIES", "2"))  # retries of rate-limited or transiently failed calls
+GEMINI_BACKOFF_S = float(os.getenv("GEMINI_BACKOFF_S", "0.5"))  # base of the jittered exponential backoff
+GEMINI_HEDGE = os.getenv("GEMINI_HEDGE", "false").lower() in ("1", "true", "yes")  # send a second request when the first is slow
+GEMINI_HEDGE_QUANTILE = float(os.getenv("GEMINI_HEDGE_QUANTILE", "0.95"))  # latency quantile after which to hedge
+
+# Request handling (optional)
+RETRIEVAL_WORKERS = int(os.getenv("RETRIEVAL_WORKERS", "0"))  # retrieval threads (0 = CPU count)
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", "32"))  # /ask requests processed at once
+MAX_QUEUED_REQUESTS = int(os.getenv("MAX_QUEUED_REQUESTS", "64"))  # requests allowed to wait; beyond that 429
+
+# Metrics (optional). Per-stage latency histograms on GET /metrics; when
+# disabled, only requests asking for a timing breakdown are timed.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Batch queries (optional; see src/batch.py and POST /ask/batch)
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "8"))  # threads re-ranking and generating
+BATCH_RATE_LIMIT = float(os.getenv("BATCH_RATE_LIMIT", "0"))  # Gemini calls per second (0 = unlimited)
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "1000"))  # per /ask/batch request
+
+# Answer cache (optional). ANSWER_CACHE_SIZE=0 disables it.
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))  # cached answers (LRU)
+ANSWER_CACHE_TTL_S = float(os.getenv("ANSWER_CACHE_TTL_S", "3600"))
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))  # cosine threshold of the semantic tier
+
+# Retrieval caches (optional). 0 disables a cache.
+RETRIEVAL_CACHE_MB = int(os.getenv("RETRIEVAL_CACHE_MB", "32"))  # hybrid search results (LRU)
+EMBEDDING_CACHE_MB = int(os.getenv("EMBEDDING_CACHE_MB", "16"))  # query embeddings (LRU)
+
+# Multi-manual registry (optional). MANUALS_CONFIG is a JSON file mapping manual
+# names to their index paths; without it the manual above is served as DEFAULT_MANUAL.
+MANUALS_CONFIG = os.getenv("MANUALS_CONFIG")
+DEFAULT_MANUAL = os.getenv("DEFAULT_MANUAL", "default")
+MANUALS_MEMORY_MB = int(os.getenv("MANUALS_MEMORY_MB", "4096"))  # budget for loaded manuals (LRU)
+MANUAL_SEARCH_WORKERS = int(os.getenv("MANUAL_SEARCH_WORKERS", "4"))  # parallel cross-manual searches
+
+# Index hot-swap (optional). New index versions are loaded, validated and swapped in
+# without a restart, by POST /admin/reload or by watching the index files.
+INDEX_WATCH_INTERVAL_S = float(os.getenv("INDEX_WATCH_INTERVAL_S", "0"))  # seconds between file checks (0 = no watch)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")  # X-Admin-Token of the /admin endpoints; unset disables them
+
+# Embedding model settings (optional)
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+EMBEDDING_DEVICE = os.getenv("EMBEDDING_DEVICE", "cpu")
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))  # 0 = let torch decide
+# Serve queries with a dynamically quantized int8 copy of the model (CPU only; indexing stays float32)
+QUERY_ENCODER_INT8 = os.getenv("QUERY_ENCODER_INT8", "false").lower() in ("1", "true", "yes")
+EMBEDDING_BATCH_WINDOW_MS = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "5"))
+EMBEDDING_MAX_BATCH = int(os.getenv("EMBEDDING_MAX_BATCH", "32"))
+
+# Performance table lookup (optional). Weight-limit questions that the parsed
+# table grids answer are answered directly, without the LLM (see src/tables.py).
+# Off by default until the lookups are validated against the manual's table pages.
+TABLE_LOOKUP = os.getenv("TABLE_LOOKUP", "false").lower() in ("1", "true", "yes")
+
+# Metadata filters (optional). Restrict retrieval of weight-limit questions to
+# the matching performance tables (table type, altitude, runway, flaps).
+# Off by default until an evaluation shows they do not drop relevant pages.
+INFER_METADATA_FILTERS = os.getenv("INFER_METADATA_FILTERS", "false").lower() in ("1", "true", "yes")
+
+# Reranker settings (optional). RERANKER is "heuristic" (keyword boosts) or "cross-encoder".
+RERANKER = os.getenv("RERANKER", "heuristic")
+RERANKER_MODEL = os.getenv("RERANKER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_MAX_TOKENS = int(os.getenv("RERANK_MAX_TOKENS", "256"))  # query + passage tokens per pair
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "200"))  # beyond that, fall back to the heuristic order
+RERANK_BATCH_WINDOW_MS = float(os.getenv("RERANK_BATCH_WINDOW_MS", "2"))
+RERANK_MAX_PAIRS = int(os.getenv("RERANK_MAX_PAIRS", "256"))  # pairs per shared forward pass
+
+# FAISS index settings (optional). FAISS_INDEX_TYPE is one of: flat, hnsw, ivf_flat, ivf_pq,
+# sq8 (8-bit scalar quantization) or pq (product quantization)
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "flat")
+FAISS_NLIST = int(os.getenv("FAISS_NLIST", "0"))  # IVF lists (0 = about 4 * sqrt(N))
+FAISS_HNSW_M = int(os.getenv("FAISS_HNSW_M", "32"))
+FAISS_PQ_M = int(os.getenv("FAISS_PQ_M", "48"))  # PQ sub-quantizers (must divide the embedding dim)
+FAISS_TRAIN_SIZE = int(os.getenv("FAISS_TRAIN_SIZE", "50000"))  # vectors sampled for IVF/PQ training
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", "16"))  # default IVF lists scanned per query
+FAISS_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", "64"))  # default HNSW candidate list size
+FAISS_RESCORE_FACTOR = int(os.getenv("FAISS_RESCORE_FACTOR", "4"))  # quantized indexes: re-score k * factor candidates with exact vectors (0 = off)
+
+# Page image settings (optional)
+PAGE_IMAGE_DPI = int(os.getenv("PAGE_IMAGE_DPI", "150"))
+PAGE_IMAGE_CACHE_MB = int(os.getenv("PAGE_IMAGE_CACHE_MB", "64"))  # decoded-image LRU budget
+
+# Prompt context budget (optional; see src/context.py)
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "8000"))  # estimated text + image tokens per prompt
+CONTEXT_IMAGE_MAX_SIDE = int(os.getenv("CONTEXT_IMAGE_MAX_SIDE", "1536"))  # page images are cropped and downscaled to fit
 
 # Validate that all required environment variables are set
 if not all([GEMINI_API_KEY, FAISS_INDEX_PATH, BM25_INDEX_PATH, CHUNKS_PATH]):
     raise ValueError("Missing one or more required environment variables. Please check your .env file.")
-
@@ -0,0 +1,126 @@
+import math
+from typing import List, Dict, Any, Tuple
+from src.config import CONTEXT_MAX_TOKENS, CONTEXT_IMAGE_MAX_SIDE
+
+# Characters of a visual page's extracted text sent along with its image.
+VISUAL_TEXT_CHARS = 1000
+# Gemini counts an image of at most 384x384 px as 258 tokens; larger images
+# are tiled into 768x768 crops of 258 tokens each.
+IMAGE_TILE_TOKENS = 258
+IMAGE_SMALL_SIDE = 384
+IMAGE_TILE_SIDE = 768
+# Manual pages are US Letter (8.5 x 11 in) portrait.
+PAGE_ASPECT = 8.5 / 11
+# Overlaps shorter than this are treated as chance matches.
+MIN_OVERLAP_CHARS = 20
+# The splitter overlaps chunks by 300 characters, moved to the nearest separator.
+MAX_OVERLAP_CHARS = 600
+# Text truncated to fewer tokens than this is left out instead.
+MIN_BLOCK_TOKENS = 64
+
+def estimate_tokens(text: str) -> int:
+    """Estimates the tokens of a text at about 4 characters per token."""
+    return (len(text) + 3) // 4
+
+def image_tokens(width: int, height: int) -> int:
+    """The tokens Gemini counts for an image of `width` x `height` pixels."""
+    if width <= IMAGE_SMALL_SIDE and height <= IMAGE_SMALL_SIDE:
+        return IMAGE_TILE_TOKENS
+    return math.ceil(width / IMAGE_TILE_SIDE) * math.ceil(height / IMAGE_TILE_SIDE) * IMAGE_TILE_TOKENS
+
+def page_image_tokens(max_side: int = CONTEXT_IMAGE_MAX_SIDE) -> int:
+    """Upper bound of the tokens of a page image downscaled to `max_side` (before margin cropping)."""
+    if not max_side:
+        return image_tokens(1275, 1650)  # 150 DPI
+    return image_tokens(int(max_side * PAGE_ASPECT), max_side)
+
+def _normalize(text: str) -> str:
+    return " ".join(text.split())
+
+def overlap_length(first: str, second: str) -> int:
+    """
+    Length of the longest end of `first` that `second` starts with, e.g. the
+    overlap `RecursiveCharacterTextSplitter` leaves between neighbouring
+    chunks. Overlaps shorter than MIN_OVERLAP_CHARS count as 0.
+    """
+    tail = first[-min(len(first), len(second), MAX_OVERLAP_CHARS):]
+    probe = second[:MIN_OVERLAP_CHARS]
+    if len(probe) < MIN_OVERLAP_CHARS:
+        return 0
+    # The earliest match in the tail is the longest overlap.
+    position = tail.find(probe)
+    while position != -1:
+        if second.startswith(tail[position:]):
+            return len(tail) - position
+        position = tail.find(probe, position + 1)
+    return 0
+
+def trim_overlaps(text: str, earlier: List[str]) -> str:
+    """Cuts the start of `text` that repeats the end of an earlier block, and its end that repeats the start of one."""
+    for block in earlier:
+        text = text[overlap_length(block, text):]
+        text = text[:len(text) - overlap_length(text, block)]
+    return text
+
+def assemble_context(results: List[Dict[str, Any]], max_tokens: int = CONTEXT_MAX_TOKENS, image_max_side: int = CONTEXT_IMAGE_MAX_SIDE) -> Tuple[str, List[Dict[str, Any]], List[Dict[str, Any]], int]:
+    """
+    Builds the prompt context from ranked results within a token budget.
+
+    Text already in the context is dropped: chunks contained in an earlier
+    block are left out, and a start or end repeating an earlier block (the
+    splitter's overlap between neighbouring chunks) is trimmed. Results are
+    added best first: visual pages cost their downscaled image
+    (`page_image_tokens`) plus `VISUAL_TEXT_CHARS` of text, and the last text
+    block is truncated to the remaining budget. The best result is always
+    included, truncated if needed.
+
+    Returns:
+        (context, visual_parts, sources, estimated tokens), where sources are
+        every retrieved (manual, page), in rank order, whether or not its text
+        was needed in the context.
+    """
+    per_image = page_image_tokens(image_max_side)
+    used = 0
+    seen: List[str] = []
+    blocks: List[str] = []
+    text_parts: List[str] = []
+    visual_parts: List[Dict[str, Any]] = []
+    sources: List[Dict[str, Any]] = []
+    cited = set()
+
+    for r in results:
+        manual, page_number = r.get("manual"), r["page_number"]
+        if (manual, page_number) not in cited:
+            cited.add((manual, page_number))
+            source = {"page": page_number, "score": r.get("rerank_score", r["score"])}
+            if manual is not None:
+                source["manual"] = manual
+            sources.append(source)
+
+        first = not (text_parts or visual_parts)
+        if r["type"] == "visual" and r["has_image"]:
+            cost = per_image + estimate_tokens(r["content"][:VISUAL_TEXT_CHARS])
+            if used + cost <= max_tokens or first:
+                visual_parts.append(r)
+                seen.append(_normalize(r["content"][:VISUAL_TEXT_CHARS]))
+                used += cost
+            continue
+
+        normalized = _normalize(r["content"])
+        if not normalized or any(normalized in earlier for earlier in seen):
+            continue
+        label = f"[Page {page_number}]" if manual is None else f"[{manual}, Page {page_number}]"
+        text = trim_overlaps(r["content"], blocks)
+        if not text.strip():
+            continue
+        remaining = max_tokens - used - estimate_tokens(label) - 2
+        if estimate_tokens(text) > remaining:
+            if remaining < MIN_BLOCK_TOKENS and not first:
+                continue
+            text = text[:max(remaining, MIN_BLOCK_TOKENS) * 4]
+        text_parts.append(f"{label}\n{text}")
+        blocks.append(text)
+        seen.append(normalized)
+        used += estimate_tokens(label) + 2 + estimate_tokens(text)
+
+    return "\n\n---\n\n".join(text_parts), visual_parts, sources, used
@@ -1,173 +1,253 @@
+import hashlib
+import os
 import fitz
-from PIL import Image
-import io
 import numpy as np
 import re
-from collections import defaultdict
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Optional
+from src.tables import GRID_TABLE_TYPES, WordRow, parse_table_grid
 
-def process_pdf(pdf_path: str) -> List[Dict[str, Any]]:
+PAGES_PER_TASK = 16  # pages handed to a worker process at a time
+ROW_TOLERANCE = 3.0  # points; words whose vertical centers are closer share a table row
+
+def ink_density(pix: fitz.Pixmap) -> float:
+    """
+    Fraction of non-white pixels in an RGB pixmap.
+
+    Reads the raw samples as a NumPy buffer and converts them to grayscale
+    with the same integer formula as PIL's `convert('L')`, so no PNG
+    encode/decode round trip is needed.
+    """
+    samples = np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.stride)
+    rgb = samples[:, :pix.width * pix.n].reshape(pix.height, pix.width, pix.n)[..., :3].astype(np.uint32)
+    gray = (rgb[..., 0] * 19595 + rgb[..., 1] * 38470 + rgb[..., 2] * 7471 + 0x8000) >> 16
+    non_white_pixels = np.count_nonzero(gray < 240)
+    return non_white_pixels / gray.size
+
+def word_rows(page: fitz.Page, tolerance: float = ROW_TOLERANCE) -> List[WordRow]:
+    """Groups the words of a page into visual rows of (x center, word), top to bottom."""
+    words = sorted(((y0 + y1) / 2, (x0 + x1) / 2, text) for x0, y0, x1, y1, text, *_ in page.get_text("words"))
+    rows: List[WordRow] = []
+    row_y = None
+    for y, x, text in words:
+        if row_y is None or y - row_y > tolerance:
+            rows.append([])
+            row_y = y
+        rows[-1].append((x, text))
+    return [sorted(row) for row in rows]
+
+def analyze_page(page: fitz.Page, page_number: int) -> Dict[str, Any]:
+    """Extracts the text of a page and classifies it as text or diagram."""
+    text = page.get_text()
+    text_length = len(text.strip())
+    images = page.get_images()
+
+    # Render page at low res to analyze visual density
+    density = ink_density(page.get_pixmap(dpi=72))
+
+    # Check for intentionally blank
+    is_blank = "intentionally blank" in text.lower()
+
+    # Classification: Diagram if high ink density or has images
+    is_diagram = (
+        len(images) > 0 or
+        (density > 0.14 and not is_blank)
+    )
+
+    result = {
+        "page_number": page_number,
+        "text": text.strip(),
+        "char_count": text_length,
+        "has_images": len(images) > 0,
+        "ink_density": density,
+        "is_blank": is_blank,
+        "is_diagram": is_diagram
+    }
+    # Keep the word layout of table pages, so their grids can be parsed (see src/tables.py).
+    table_info = detect_performance_table(result)
+    if table_info is not None and table_info["type"] in GRID_TABLE_TYPES:
+        result["table_rows"] = word_rows(page)
+    return result
+
+def page_content_hash(doc: fitz.Document, page: fitz.Page) -> str:
+    """
+    Hashes the raw content stream and embedded images of a page. This is much
+    cheaper than extracting text or rendering, so every page of a revised
+    manual can be checked to find the few that actually changed.
+    """
+    digest = hashlib.sha1(page.read_contents())
+    for image in page.get_images(full=True):
+        digest.update(doc.xref_stream_raw(image[0]) or b"")
+    return digest.hexdigest()
+
+def page_content_hashes(pdf_path: str) -> Dict[int, str]:
+    """Returns the content hash of every (1-based) page of a PDF."""
+    with fitz.open(pdf_path) as doc:
+        return {i + 1: page_content_hash(doc, page) for i, page in enumerate(doc)}
+
+def analyze_pages(pdf_path: str, page_numbers: List[int]) -> List[Dict[str, Any]]:
+    """Analyzes only the given (1-based) pages of a PDF."""
+    with fitz.open(pdf_path) as doc:
+        return [analyze_page(doc[page_number - 1], page_number) for page_number in page_numbers]
+
+def _analyze_page_range(pdf_path: str, start: int, end: int) -> List[Dict[str, Any]]:
+    """Worker task: opens its own document and analyzes pages [start, end)."""
+    with fitz.open(pdf_path) as doc:
+        return [analyze_page(doc[i], i + 1) for i in range(start, end)]
+
+def iter_pages(pdf_path: str, workers: Optional[int] = None, pages_per_task: int = PAGES_PER_TASK) -> Iterator[Dict[str, Any]]:
+    """
+    Yields analyzed pages in page order, spreading page ranges over a process pool.
+
+    Only a bounded window of page ranges is in flight at any time, so the
+    caller can consume pages as a stream without every page being held in memory.
+
+    Args:
+        pdf_path: The path to the PDF file.
+        workers: Number of worker processes (defaults to the CPU count; 1 runs in-process).
+        pages_per_task: Number of consecutive pages per worker task.
+    """
+    with fitz.open(pdf_path) as doc:
+        page_count = doc.page_count
+    ranges = iter([(start, min(start + pages_per_task, page_count)) for start in range(0, page_count, pages_per_task)])
+    workers = workers or os.cpu_count() or 1
+
+    if workers == 1:
+        for start, end in ranges:
+            yield from _analyze_page_range(pdf_path, start, end)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for start, end in ranges:
+            pending.append(executor.submit(_analyze_page_range, pdf_path, start, end))
+            if len(pending) >= 2 * workers:
+                break
+        while pending:
+            pages = pending.popleft().result()
+            next_range = next(ranges, None)
+            if next_range is not None:
+                pending.append(executor.submit(_analyze_page_range, pdf_path, *next_range))
+            yield from pages
+
+def detect_performance_table(page: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Returns the table info of a performance table page, or None for other pages."""
+    content = page['text']
+    content_lower = content.lower()
+
+    if (('field limit weight' in content_lower or 'climb limit' in content_lower) and
+        'pressure altitude' in content_lower and
+        ('1000 kg' in content_lower or 'corr' in content_lower)):
+        alt_match = re.search(r'(\d+)\s*FT\s*Pressure\s*Altitude', content, re.IGNORECASE)
+        if alt_match:
+            altitude = alt_match.group(1)
+            runway_condition = "wet" if "wet runway" in content_lower else "dry"
+            flap_match = re.search(r'Flaps?\s*(\d+)', content, re.IGNORECASE)
+            flap_setting = flap_match.group(1) if flap_match else None
+            return {"type": "field_climb_limits", "altitude": altitude, "runway_condition": runway_condition, "flap_setting": flap_setting}
+    elif ('flap' in content_lower and 'retraction' in content_lower and 'speed' in content_lower and 't/o' in content_lower):
+        return {"type": "flap_retraction", "altitude": None, "runway_condition": None}
+    elif ('landing field limit' in content_lower and 'wind corr' in content_lower):
+        return {"type": "landing_limits", "altitude": None, "runway_condition": None}
+    return None
+
+def enhance_performance_table_content(page: Dict[str, Any], table_info: Dict[str, Any]) -> str:
+    """Prepends structured, keyword-rich headers to a performance table page."""
+    table_type = table_info['type']
+    altitude = table_info.get('altitude') or 'unknown'
+    runway = table_info.get('runway_condition') or 'unknown'
+    flap = table_info.get('flap_setting') or 'all'
+    if table_type == 'field_climb_limits':
+        enhancement = f"PERFORMANCE TABLE: FIELD AND CLIMB LIMIT WEIGHTS\nAltitude: {altitude} FT | Runway: {runway.upper()} | Flaps: {flap}\nKeywords: field limit weight, climb limit weight, {altitude} feet, pressure altitude, {runway} runway, corrected field length, OAT\nTABLE DATA:\n"
+    elif table_type == 'flap_retraction':
+        enhancement = f"PERFORMANCE TABLE: FLAP RETRACTION SPEEDS\nKeywords: flap retraction, takeoff, speed, flaps\n"
+    elif table_type == 'landing_limits':
+        enhancement = f"PERFORMANCE TABLE: LANDING FIELD LIMIT WEIGHTS\nKeywords: landing field limit, wind correction, landing weight\n"
+    else:
+        enhancement = f"PERFORMANCE TABLE: {table_type}\n"
+    return enhancement + page['text']
+
+def chunk_page(page: Dict[str, Any], table_info: Optional[Dict[str, Any]], splitter: RecursiveCharacterTextSplitter) -> List[Dict[str, Any]]:
+    """Turns one analyzed page into chunks according to its classification."""
+    if page["char_count"] < 20:
+        return []
+    page_num = page["page_number"]
+
+    if table_info is not None:
+        metadata = {"source": "Boeing B737 Manual", "page": page_num, "table_type": table_info['type'], "altitude": table_info.get('altitude'), "runway_condition": table_info.get('runway_condition'), "flap_setting": table_info.get('flap_setting')}
+        grid = parse_table_grid(table_info['type'], page["table_rows"]) if page.get("table_rows") else None
+        if grid is not None:
+            metadata["table_grid"] = grid
+        return [{
+            "content": enhance_performance_table_content(page, table_info), "page_number": page_num, "chunk_id": f"page_{page_num}_enhanced",
+            "type": "performance_table", "has_image": page["is_diagram"],
+            "metadata": metadata
+        }]
+    if page["is_diagram"]:
+        return [{
+            "content": page["text"], "page_number": page_num, "chunk_id": f"page_{page_num}_visual",
+            "type": "visual", "has_image": True,
+            "metadata": {"source": "Boeing B737 Manual", "page": page_num, "requires_vision": True, "ink_density": page["ink_density"]}
+        }]
+    text_chunks = splitter.split_text(page["text"])
+    return [{
+        "content": chunk, "page_number": page_num, "chunk_id": f"page_{page_num}_chunk_{idx}",
+        "type": "text", "has_image": False,
+        "metadata": {"source": "Boeing B737 Manual", "page": page_num, "requires_vision": False, "chunk_index": idx, "total_chunks": len(text_chunks)}
+    } for idx, chunk in enumerate(text_chunks)]
+
+def make_splitter() -> RecursiveCharacterTextSplitter:
+    """The text splitter used for standard text pages."""
+    return RecursiveCharacterTextSplitter(chunk_size=1500, chunk_overlap=300, separators=["\n\n", "\n", " "])
+
+def process_pdf(pdf_path: str, workers: Optional[int] = None) -> List[Dict[str, Any]]:
     """
     Extracts and classifies pages from a PDF, identifies performance tables,
     and chunks the content.
 
+    Pages are extracted in parallel (see `iter_pages`) and chunked as they
+    arrive, so pages are never all held in memory at once.
+
     Args:
         pdf_path: The path to the PDF file.
+        workers: Number of extraction processes (defaults to the CPU count).
 
     Returns:
-        A list of chunk dictionaries, each containing content, metadata, and
-        optionally, a page image.
+        A list of chunk dictionaries, each containing content and metadata.
+        Chunks only reference their page (`has_image`); the page images
+        themselves are rendered separately with `page_images.render_page_images`
+        or on demand by the PageImageStore.
     """
     print("="*80)
-    print("STEP 1: EXTRACTING AND CLASSIFYING PAGES")
-    print("="*80)
-
-    doc = fitz.open(pdf_path)
-    pages = []
-
-    for i, page in enumerate(doc):
-        text = page.get_text()
-        text_length = len(text.strip())
-        images = page.get_images()
-
-        # Render page at low res to analyze visual density
-        pix = page.get_pixmap(dpi=72)
-        img_bytes = pix.tobytes("png")
-        img = Image.open(io.BytesIO(img_bytes))
-        gray = img.convert('L')
-        pixels = np.array(gray)
-
-        # Calculate "ink density"
-        non_white_pixels = np.sum(pixels < 240)
-        total_pixels = pixels.size
-        ink_density = non_white_pixels / total_pixels
-
-        # Check for intentionally blank
-        is_blank = "intentionally blank" in text.lower()
-
-        # Classification: Diagram if high ink density or has images
-        is_diagram = (
-            len(images) > 0 or
-            (ink_density > 0.14 and not is_blank)
-        )
-
-        page_data = {
-            "page_number": i + 1,
-            "text": text.strip(),
-            "char_count": text_length,
-            "has_images": len(images) > 0,
-            "ink_density": ink_density,
-            "is_blank": is_blank,
-            "is_diagram": is_diagram,
-            "page_image": None
-        }
-        pages.append(page_data)
-
-    # Render only diagram pages at high resolution
-    for i, page_data in enumerate(pages):
-        if page_data["is_diagram"]:
-            page = doc[i]
-            pix = page.get_pixmap(dpi=150)
-            page_data["page_image"] = pix.tobytes("png")
-
-    doc.close()
-
-    print(f" Total pages: {len(pages)}")
-
-    # ============================================================================
-    # STEP 2: IDENTIFY PERFORMANCE TABLE PAGES
-    # ============================================================================
-    print("\n" + "="*80)
-    print("STEP 2: IDENTIFYING PERFORMANCE TABLE PAGES")
-    print("="*80)
-
-    performance_table_pages = {}
-    for page in pages:
-        content = page['text']
-        content_lower = content.lower()
-        is_perf_table = False
-        table_info = {}
-
-        if (('field limit weight' in content_lower or 'climb limit' in content_lower) and
-            'pressure altitude' in content_lower and
-            ('1000 kg' in content_lower or 'corr' in content_lower)):
-            alt_match = re.search(r'(\d+)\s*FT\s*Pressure\s*Altitude', content, re.IGNORECASE)
-            if alt_match:
-                altitude = alt_match.group(1)
-                runway_condition = "wet" if "wet runway" in content_lower else "dry"
-                flap_match = re.search(r'Flaps?\s*(\d+)', content, re.IGNORECASE)
-                flap_setting = flap_match.group(1) if flap_match else None
-                table_info = {"type": "field_climb_limits", "altitude": altitude, "runway_condition": runway_condition, "flap_setting": flap_setting}
-                is_perf_table = True
-        elif ('flap' in content_lower and 'retraction' in content_lower and 'speed' in content_lower and 't/o' in content_lower):
-            table_info = {"type": "flap_retraction", "altitude": None, "runway_condition": None}
-            is_perf_table = True
-        elif ('landing field limit' in content_lower and 'wind corr' in content_lower):
-            table_info = {"type": "landing_limits", "altitude": None, "runway_condition": None}
-            is_perf_table = True
-
-        if is_perf_table:
-            performance_table_pages[page['page_number']] = table_info
-
-    print(f"✅ Found {len(performance_table_pages)} performance table pages")
-
-    # ============================================================================
-    # STEP 3: CHUNKING STRATEGY
-    # ============================================================================
-    print("\n" + "="*80)
-    print("STEP 3: CHUNKING STRATEGY")
+    print("EXTRACTING, CLASSIFYING AND CHUNKING PAGES")
     print("="*80)
 
-    splitter = RecursiveCharacterTextSplitter(chunk_size=1500, chunk_overlap=300, separators=["\n\n", "\n", " "])
+    splitter = make_splitter()
     all_chunks = []
+    page_count = 0
+    performance_table_count = 0
     enhanced_count = 0
-
-    def enhance_performance_table_content(page, table_info):
-        table_type = table_info['type']
-        altitude = table_info.get('altitude') or 'unknown'
-        runway = table_info.get('runway_condition') or 'unknown'
-        flap = table_info.get('flap_setting') or 'all'
-        if table_type == 'field_climb_limits':
-            enhancement = f"PERFORMANCE TABLE: FIELD AND CLIMB LIMIT WEIGHTS\nAltitude: {altitude} FT | Runway: {runway.upper()} | Flaps: {flap}\nKeywords: field limit weight, climb limit weight, {altitude} feet, pressure altitude, {runway} runway, corrected field length, OAT\nTABLE DATA:\n"
-        elif table_type == 'flap_retraction':
-            enhancement = f"PERFORMANCE TABLE: FLAP RETRACTION SPEEDS\nKeywords: flap retraction, takeoff, speed, flaps\n"
-        elif table_type == 'landing_limits':
-            enhancement = f"PERFORMANCE TABLE: LANDING FIELD LIMIT WEIGHTS\nKeywords: landing field limit, wind correction, landing weight\n"
-        else:
-            enhancement = f"PERFORMANCE TABLE: {table_type}\n"
-        return enhancement + page['text']
-
-    for page in pages:
-        if page["char_count"] < 20: continue
-        content = page["text"]
-        page_num = page["page_number"]
-
-        if page_num in performance_table_pages:
-            table_info = performance_table_pages[page_num]
-            enhanced_content = enhance_performance_table_content(page, table_info)
-            enhanced_count += 1
-            all_chunks.append({
-                "content": enhanced_content, "page_number": page_num, "chunk_id": f"page_{page_num}_enhanced",
-                "type": "performance_table", "page_image": page.get("page_image"),
-                "metadata": {"source": "Boeing B737 Manual", "page": page_num, "table_type": table_info['type'], "altitude": table_info.get('altitude'), "runway_condition": table_info.get('runway_condition'), "flap_setting": table_info.get('flap_setting')}
-            })
-        elif page["is_diagram"]:
-            all_chunks.append({
-                "content": page["text"], "page_number": page_num, "chunk_id": f"page_{page_num}_visual",
-                "type": "visual", "page_image": page["page_image"],
-                "metadata": {"source": "Boeing B737 Manual", "page": page_num, "requires_vision": True, "ink_density": page["ink_density"]}
-            })
-        else:
-            text_chunks = splitter.split_text(page["text"])
-            for idx, chunk in enumerate(text_chunks):
-                all_chunks.append({
-                    "content": chunk, "page_number": page_num, "chunk_id": f"page_{page_num}_chunk_{idx}",
-                    "type": "text", "page_image": None,
-                    "metadata": {"source": "Boeing B737 Manual", "page": page_num, "requires_vision": False, "chunk_index": idx, "total_chunks": len(text_chunks)}
-                })
-
+    grid_count = 0
+
+    for page in iter_pages(pdf_path, workers=workers):
+        page_count += 1
+        table_info = detect_performance_table(page)
+        if table_info is not None:
+            performance_table_count += 1
+        page_chunks = chunk_page(page, table_info, splitter)
+        enhanced_count += sum(1 for chunk in page_chunks if chunk["type"] == "performance_table")
+        grid_count += sum(1 for chunk in page_chunks if "table_grid" in chunk["metadata"])
+        all_chunks.extend(page_chunks)
+
+    print(f" Total pages: {page_count}")
+    print(f"✅ Found {performance_table_count} performance table pages ({grid_count} parsed into lookup grids)")
     print(f" Chunking Complete!")
     print(f"   Total chunks: {len(all_chunks)}")
     print(f"   Enhanced performance table chunks: {enhanced_count}")
-    return all_chunks
\ No newline at end of file
+    return all_chunks
+
+def diagram_pages(chunks: List[Dict[str, Any]]) -> List[int]:
+    """Returns the page numbers whose chunks need a rendered page image."""
+    return sorted({chunk["page_number"] for chunk in chunks if chunk.get("has_image")})
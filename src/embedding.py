@@ -0,0 +1,175 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+import numpy as np
+import torch
+from sentence_transformers import SentenceTransformer
+from typing import List, Optional, Tuple, Union
+from src.cache import LRUCache
+from src.config import EMBEDDING_MODEL, EMBEDDING_DEVICE, EMBEDDING_THREADS, EMBEDDING_BATCH_WINDOW_MS, EMBEDDING_MAX_BATCH, EMBEDDING_CACHE_MB
+
+class EmbeddingService:
+    """
+    Holds a single, warmed-up SentenceTransformer that is shared by indexing
+    and retrieval, so the model weights are loaded once per process instead of
+    once per query.
+    """
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL, device: str = EMBEDDING_DEVICE, num_threads: int = EMBEDDING_THREADS, quantize: bool = False):
+        """
+        Args:
+            model_name: The sentence-transformers model to load.
+            device: The torch device to run the model on (e.g. "cpu", "cuda").
+            num_threads: Number of intra-op CPU threads for torch (0 keeps the torch default).
+            quantize: Dynamically quantize the Linear layers to int8 (CPU only).
+                Meant for query encoding; index with a float32 service.
+        """
+        if num_threads > 0:
+            torch.set_num_threads(num_threads)
+
+        print(f"Loading embedding model '{model_name}' on {device}...")
+        self.model_name = model_name
+        self.device = device
+        self.model = SentenceTransformer(model_name, device=device)
+        self.dimension = self.model.get_sentence_embedding_dimension()
+        self.quantized = False
+        if quantize:
+            if device != "cpu":
+                print(f" int8 query encoding needs the CPU; keeping float32 weights on {device}")
+            else:
+                # int8 weights, activations quantized on the fly: smaller and faster on CPU,
+                # with embeddings close enough to the float32 index vectors for retrieval.
+                torch.ao.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+                self.quantized = True
+
+        # Run one forward pass so the first real query does not pay for lazy initialisation.
+        self.model.encode(["warm up"])
+        print(f"✅ Embedding model ready (dim={self.dimension}{', int8' if self.quantized else ''})")
+
+    def encode(self, texts: List[str], batch_size: int = 32, show_progress_bar: bool = False) -> np.ndarray:
+        """Encodes a list of texts into a float32 matrix of shape (len(texts), dimension)."""
+        embeddings = self.model.encode(texts, batch_size=batch_size, show_progress_bar=show_progress_bar)
+        return np.asarray(embeddings, dtype="float32")
+
+    def encode_query(self, query: str) -> np.ndarray:
+        """Encodes a single query into a float32 matrix of shape (1, dimension)."""
+        return self.encode([query])
+
+
+class EmbeddingBatcher:
+    """
+    Micro-batching front end for an EmbeddingService.
+
+    Queries submitted from concurrent threads are collected for up to
+    `window_ms` (or until `max_batch` queries are waiting) and encoded in a
+    single forward pass. Each caller blocks only until its own row is ready.
+    Exposes the same `encode` / `encode_query` interface as EmbeddingService.
+    """
+
+    def __init__(self, service: EmbeddingService, window_ms: float = EMBEDDING_BATCH_WINDOW_MS, max_batch: int = EMBEDDING_MAX_BATCH):
+        self.service = service
+        self.dimension = service.dimension
+        self.window = window_ms / 1000.0
+        self.max_batch = max(1, max_batch)
+        self._queue: "queue.Queue[Optional[Tuple[str, Future]]]" = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._worker.start()
+
+    def encode(self, texts: List[str], batch_size: int = 32, show_progress_bar: bool = False) -> np.ndarray:
+        """Bulk encoding bypasses the queue; it is already batched."""
+        return self.service.encode(texts, batch_size=batch_size, show_progress_bar=show_progress_bar)
+
+    def encode_query(self, query: str) -> np.ndarray:
+        """Queues a single query and waits for its (1, dimension) embedding."""
+        future: Future = Future()
+        self._queue.put((query, future))
+        return future.result()
+
+    def close(self) -> None:
+        """Stops the worker thread after the queries already queued are served."""
+        self._queue.put(None)
+        self._worker.join()
+
+    def _collect_batch(self, first: Tuple[str, Future]) -> Tuple[List[Tuple[str, Future]], bool]:
+        batch = [first]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch, stop = self._collect_batch(first)
+            queries = [query for query, _ in batch]
+            try:
+                embeddings = self.service.encode(queries, batch_size=len(queries))
+                for i, (_, future) in enumerate(batch):
+                    future.set_result(embeddings[i:i + 1])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+            if stop:
+                return
+
+
+class CachedEmbedder:
+    """
+    Memoizes query embeddings of an EmbeddingService or EmbeddingBatcher in an
+    LRU cache bounded in bytes. Repeated questions skip the model entirely.
+    """
+
+    def __init__(self, embedder: Union[EmbeddingService, EmbeddingBatcher], max_bytes: int = EMBEDDING_CACHE_MB * 1024 * 1024):
+        self.embedder = embedder
+        self.dimension = embedder.dimension
+        # Key and array object overhead come on top of the float32 row.
+        self.cache = LRUCache(max_bytes, lambda embedding: embedding.nbytes + 200)
+
+    def encode(self, texts: List[str], batch_size: int = 32, show_progress_bar: bool = False) -> np.ndarray:
+        return self.embedder.encode(texts, batch_size=batch_size, show_progress_bar=show_progress_bar)
+
+    def encode_query(self, query: str) -> np.ndarray:
+        """Returns the cached (1, dimension) embedding, computing it on a miss. Do not modify it."""
+        embedding = self.cache.get(query)
+        if embedding is None:
+            embedding = self.embedder.encode_query(query)
+            embedding.flags.writeable = False
+            self.cache.put(query, embedding)
+        return embedding
+
+    def close(self) -> None:
+        if hasattr(self.embedder, "close"):
+            self.embedder.close()
+
+
+# Anything that can embed queries for retrieval.
+Embedder = Union[EmbeddingService, EmbeddingBatcher, CachedEmbedder]
+
+_default_service: Optional[EmbeddingService] = None
+_default_service_lock = threading.Lock()
+
+def get_embedding_service() -> EmbeddingService:
+    """Returns the process-wide embedding service, creating it on first use."""
+    global _default_service
+    if _default_service is None:
+        with _default_service_lock:
+            if _default_service is None:
+                _default_service = EmbeddingService()
+    return _default_service
+
+def set_embedding_service(service: EmbeddingService) -> None:
+    """Registers an already-created service as the process-wide default."""
+    global _default_service
+    _default_service = service
@@ -1,96 +1,205 @@
+import argparse
+import csv
+import json
 import sys
 import os
+import time
+import itertools
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
 
 sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
 
-from src.config import FAISS_INDEX_PATH, BM25_INDEX_PATH, CHUNKS_PATH
-from src.indexer import load_indexes
-from src.retriever import query_boeing_manual
+from src.baseline import latency_percentiles
+from src.config import INFER_METADATA_FILTERS, TABLE_LOOKUP
+from src.embedding import Embedder, get_embedding_service
+from src.generator import generate_answer
+from src.indexer import MetadataIndex, PageIndex, build_page_index, load_indexes
+from src.page_images import PageImageStore, set_page_image_store
+from src.retriever import build_context, get_reranker, hybrid_search, infer_filters
+from src.tables import TableIndex
 
 #  Test Questions and Evaluation Code ---
 
 test_questions = [
     ("I'm calculating our takeoff weight for a dry runway. We're at 2,000 feet pressure altitude, and the OAT is 50°C. What's the climb limit weight ?", [83]),
     ("We're doing a Flaps 15 takeoff. Remind me, what is the first flap selection we make during retraction, and at what speed?", [41]),
-    
+
 ]
 
-def evaluate_rag_system(test_questions, index, bm25, all_chunks, top_k=15, alpha=0.5, use_reranking=True):
+# Stages timed for every question; "embed" is one batched call for all questions.
+STAGES = ("search", "rerank", "generate", "total")
+
+def score_retrieval(retrieved_pages: List[int], expected_pages: List[int]) -> Dict[str, Any]:
+    """Computes the @5 metrics, reciprocal rank and average precision of one ranked page list."""
+    correct_ranks = [rank for rank, page_num in enumerate(retrieved_pages, 1) if page_num in expected_pages]
+    num_total_relevant = len(expected_pages)
+    num_relevant_in_top_5 = len([p for p in retrieved_pages[:5] if p in expected_pages])
+
+    recall_at_5 = num_relevant_in_top_5 / num_total_relevant if num_total_relevant > 0 else 0
+    precision_at_5 = num_relevant_in_top_5 / 5
+
+    if (precision_at_5 + recall_at_5) > 0:
+        f1_score = 2 * (precision_at_5 * recall_at_5) / (precision_at_5 + recall_at_5)
+    else:
+        f1_score = 0
+
+    first_correct_rank = correct_ranks[0] if correct_ranks else None
+
+    precisions_at_correct_docs = []
+    for rank in correct_ranks:
+        num_correct_up_to_this_rank = len([r for r in correct_ranks if r <= rank])
+        precisions_at_correct_docs.append(num_correct_up_to_this_rank / rank)
+
+    avg_precision = sum(precisions_at_correct_docs) / len(precisions_at_correct_docs) if precisions_at_correct_docs else 0
+    return {
+        "correct_ranks": correct_ranks,
+        "recall_at_5": recall_at_5,
+        "precision_at_5": precision_at_5,
+        "f1_score": f1_score,
+        "mrr": 1 / first_correct_rank if first_correct_rank else 0,
+        "map_score": avg_precision
+    }
+
+def embed_questions(test_questions, embedder: Optional[Embedder] = None) -> Tuple[np.ndarray, float]:
+    """Embeds every question in one call. Returns the (n, d) embeddings and the time taken in ms."""
+    start = time.perf_counter()
+    embeddings = (embedder or get_embedding_service()).encode([question for question, _ in test_questions], batch_size=64)
+    return embeddings, (time.perf_counter() - start) * 1000
+
+def retrieve_questions(test_questions, index, bm25, all_chunks, query_embeddings: np.ndarray, top_k: int = 15, alpha: float = 0.5, page_index: Optional[PageIndex] = None, index_version: Optional[str] = None, workers: int = 8, metadata_index: Optional[MetadataIndex] = None) -> List[Tuple[List[Dict[str, Any]], float]]:
+    """
+    Runs the hybrid search of every question (2 * `top_k` candidates, as
+    `query_boeing_manual` does) on `workers` threads.
+
+    With a `metadata_index`, weight-limit questions are searched in the tables
+    `retriever.infer_filters` picks, falling back to the whole manual, as
+    `registry.search_manuals` does with INFER_METADATA_FILTERS. Without one,
+    that filtering is bypassed.
+
+    Returns:
+        (results, search_ms) per question, in input order.
+    """
+    page_index = page_index or build_page_index(all_chunks)
+
+    def search(i: int) -> Tuple[List[Dict[str, Any]], float]:
+        start = time.perf_counter()
+        question = test_questions[i][0]
+        filters = infer_filters(question, metadata_index) if metadata_index is not None else None
+        results = []
+        if filters:
+            results = hybrid_search(question, index, bm25, all_chunks, top_k=top_k * 2, alpha=alpha, page_index=page_index, query_embedding=query_embeddings[i:i + 1], index_version=index_version, filters=filters, metadata_index=metadata_index)
+        if not results:
+            results = hybrid_search(question, index, bm25, all_chunks, top_k=top_k * 2, alpha=alpha, page_index=page_index, query_embedding=query_embeddings[i:i + 1], index_version=index_version)
+        return results, (time.perf_counter() - start) * 1000
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        return list(pool.map(search, range(len(test_questions))))
+
+def evaluate_rag_system(test_questions, index, bm25, all_chunks, top_k=15, alpha=0.5, use_reranking=True, index_version=None, generate=False, workers=8, embedder=None, page_index=None, query_embeddings=None, search_results=None, reranker=None, verbose=True, metadata_index=None, tables=None):
     """
     Evaluates the RAG system with a focus on user-centric metrics, all computed @5.
     Note: This version is stateless and requires indexes to be passed in.
+
+    By default only retrieval is evaluated: questions are searched and
+    re-ranked on `workers` threads and Gemini is never called. Set
+    `generate=True` to also generate (and time) the answers.
+
+    Sweeps pass `query_embeddings` (see `embed_questions`) and `search_results`
+    (see `retrieve_questions`, for the same `top_k` and `alpha`) to reuse them
+    across configurations. Pass `index_version` to reuse cached retrieval
+    results across runs in one process.
+
+    Inferred metadata filters and table lookups, which the API applies with
+    INFER_METADATA_FILTERS and TABLE_LOOKUP, are only evaluated when
+    `metadata_index` (see `retrieve_questions`) and `tables` are passed.
+    Questions the `tables` answer are scored on the table pages, as the API
+    returns them, with the lookup timed as their search.
+
+    Pages are scored in rank order (the order of the response "sources").
     """
-    evaluation_results = []
-    recall_at_5_list = []
-    precision_at_5_list = []
-    f1_score_list = []
-    mrr_list = []
-    map_score_list = []
-
-    print(f"Evaluating {len(test_questions)} questions (retrieving top {top_k} results)...")
-
-    for i, (question, expected_pages) in enumerate(test_questions, 1):
-        print(f"\n--- Evaluating Question {i}/{len(test_questions)} ---")
-
-        response = query_boeing_manual(
-            question,
-            index=index,
-            bm25=bm25,
-            all_chunks=all_chunks,
-            top_k=top_k,
-            alpha=alpha,
-            use_reranking=use_reranking
-        )
-
-        retrieved_pages = response['pages']
-        correct_ranks = [rank for rank, page_num in enumerate(retrieved_pages, 1) if page_num in expected_pages]
-        num_total_relevant = len(expected_pages)
-        num_relevant_in_top_5 = len([p for p in retrieved_pages[:5] if p in expected_pages])
-
-        recall_at_5 = num_relevant_in_top_5 / num_total_relevant if num_total_relevant > 0 else 0
-        recall_at_5_list.append(recall_at_5)
-        precision_at_5 = num_relevant_in_top_5 / 5
-        precision_at_5_list.append(precision_at_5)
-
-        if (precision_at_5 + recall_at_5) > 0:
-            f1_score = 2 * (precision_at_5 * recall_at_5) / (precision_at_5 + recall_at_5)
-        else:
-            f1_score = 0
-        f1_score_list.append(f1_score)
-
-        first_correct_rank = correct_ranks[0] if correct_ranks else None
-        mrr_list.append(1 / first_correct_rank if first_correct_rank else 0)
-
-        precisions_at_correct_docs = []
-        for rank in correct_ranks:
-            num_correct_up_to_this_rank = len([r for r in correct_ranks if r <= rank])
-            precisions_at_correct_docs.append(num_correct_up_to_this_rank / rank)
-
-        avg_precision = sum(precisions_at_correct_docs) / len(precisions_at_correct_docs) if precisions_at_correct_docs else 0
-        map_score_list.append(avg_precision)
-
-        evaluation_results.append({
-            "question": question,
-            "expected_pages": expected_pages,
-            "retrieved_pages": retrieved_pages,
-            "correct_ranks": correct_ranks,
-            "recall_at_5": recall_at_5,
-            "precision_at_5": precision_at_5,
-            "f1_score": f1_score,
-            "mrr": 1 / first_correct_rank if first_correct_rank else 0,
-            "map_score": avg_precision
-        })
-        print(f"Expected: {expected_pages} | Retrieved Top 5: {retrieved_pages[:5]}")
-        print(f"Recall@5: {recall_at_5:.2f} | Precision@5: {precision_at_5:.2f} | F1@5: {f1_score:.2f}")
+    embed_ms = None
+    if query_embeddings is None and search_results is None:
+        query_embeddings, embed_ms = embed_questions(test_questions, embedder)
+    if search_results is None:
+        search_results = retrieve_questions(test_questions, index, bm25, all_chunks, query_embeddings, top_k=top_k, alpha=alpha, page_index=page_index, index_version=index_version, workers=workers, metadata_index=metadata_index)
+    reranker = reranker or get_reranker()
+
+    if verbose:
+        print(f"Evaluating {len(test_questions)} questions (retrieving top {top_k} results, alpha={alpha}, reranking {'on' if use_reranking else 'off'}, "
+              f"inferred filters {'on' if metadata_index is not None else 'off'}, table lookup {'on' if tables is not None else 'off'}, generation {'on' if generate else 'off'})...")
+
+    def evaluate(i: int) -> Dict[str, Any]:
+        question, expected_pages = test_questions[i]
+        if tables is not None:
+            start = time.perf_counter()
+            table_answer = tables.answer(question)
+            if table_answer is not None:
+                latency = {"search": (time.perf_counter() - start) * 1000, "rerank": 0.0, "generate": 0.0}
+                latency["total"] = latency["search"]
+                retrieved_pages = [source["page"] for source in table_answer.sources]
+                result = {"question": question, "expected_pages": expected_pages, "retrieved_pages": retrieved_pages, "table": table_answer.table}
+                result.update(score_retrieval(retrieved_pages, expected_pages))
+                if generate:
+                    result["answer"] = table_answer.answer
+                    result["error"] = None
+                result["latency_ms"] = latency
+                return result
+
+        results, search_ms = search_results[i]
+        latency = {"search": search_ms, "rerank": 0.0, "generate": 0.0}
+
+        # Re-ranking sorts in place, so each configuration works on its own copies.
+        results = [dict(result) for result in results]
+        start = time.perf_counter()
+        results = reranker.rerank(question, results)[:top_k] if use_reranking else results[:top_k]
+        latency["rerank"] = (time.perf_counter() - start) * 1000
+
+        context, visual_parts, sources = build_context(results)
+        answer, error = None, None
+        if generate:
+            start = time.perf_counter()
+            try:
+                answer = generate_answer(question, context, visual_parts)
+            except Exception as e:
+                error = f"Generation failed: {str(e)}"
+            latency["generate"] = (time.perf_counter() - start) * 1000
+        latency["total"] = latency["search"] + latency["rerank"] + latency["generate"]
+
+        retrieved_pages = [source["page"] for source in sources]
+        result = {"question": question, "expected_pages": expected_pages, "retrieved_pages": retrieved_pages}
+        result.update(score_retrieval(retrieved_pages, expected_pages))
+        if generate:
+            result["answer"] = answer
+            result["error"] = error
+        result["latency_ms"] = latency
+        return result
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        evaluation_results = list(pool.map(evaluate, range(len(test_questions))))
+
+    if verbose:
+        for i, result in enumerate(evaluation_results, 1):
+            print(f"\n--- Question {i}/{len(test_questions)} ---")
+            print(f"Expected: {result['expected_pages']} | Retrieved Top 5: {result['retrieved_pages'][:5]}")
+            print(f"Recall@5: {result['recall_at_5']:.2f} | Precision@5: {result['precision_at_5']:.2f} | F1@5: {result['f1_score']:.2f}")
 
     num_questions = len(test_questions)
     summary_metrics = {
         "total_questions": num_questions,
-        "mean_recall_at_5": sum(recall_at_5_list) / num_questions,
-        "mean_precision_at_5": sum(precision_at_5_list) / num_questions,
-        "mean_f1_score": sum(f1_score_list) / num_questions,
-        "mean_reciprocal_rank": sum(mrr_list) / num_questions,
-        "map_score": sum(map_score_list) / num_questions
+        "top_k": top_k,
+        "alpha": alpha,
+        "use_reranking": use_reranking,
+        "infer_filters": metadata_index is not None,
+        "table_lookup": tables is not None,
+        "table_answers": sum("table" in r for r in evaluation_results),
+        "generate": generate,
+        "mean_recall_at_5": sum(r["recall_at_5"] for r in evaluation_results) / num_questions,
+        "mean_precision_at_5": sum(r["precision_at_5"] for r in evaluation_results) / num_questions,
+        "mean_f1_score": sum(r["f1_score"] for r in evaluation_results) / num_questions,
+        "mean_reciprocal_rank": sum(r["mrr"] for r in evaluation_results) / num_questions,
+        "map_score": sum(r["map_score"] for r in evaluation_results) / num_questions
     }
 
     f1_weight = 0.4
@@ -103,8 +212,57 @@ def evaluate_rag_system(test_questions, index, bm25, all_chunks, top_k=15, alpha
     )
     summary_metrics['final_retrieval_score'] = final_retrieval_score
     summary_metrics['score_weights'] = {'f1': f1_weight, 'mrr': mrr_weight, 'map': map_weight}
+    summary_metrics['latency'] = {stage: latency_percentiles([r["latency_ms"][stage] for r in evaluation_results]) for stage in STAGES}
+    if embed_ms is not None:
+        summary_metrics['embed_ms'] = embed_ms
     return {"detailed_results": evaluation_results, "summary_metrics": summary_metrics}
 
+def sweep_rag_system(test_questions, index, bm25, all_chunks, alphas=(0.5,), top_ks=(15,), rerank_options=(True,), generate=False, workers=8, embedder=None, page_index=None, metadata_index=None, tables=None):
+    """
+    Evaluates every combination of `alphas`, `top_ks` and `rerank_options`.
+    Questions are embedded once for the whole sweep, and each (alpha, top_k)
+    is searched once for both reranking settings. `metadata_index` and
+    `tables` are passed on to `evaluate_rag_system`.
+
+    Returns:
+        One `evaluate_rag_system` result per configuration.
+    """
+    query_embeddings, embed_ms = embed_questions(test_questions, embedder)
+    page_index = page_index or build_page_index(all_chunks)
+    runs = []
+    for alpha, top_k in itertools.product(alphas, top_ks):
+        search_results = retrieve_questions(test_questions, index, bm25, all_chunks, query_embeddings, top_k=top_k, alpha=alpha, page_index=page_index, workers=workers, metadata_index=metadata_index)
+        for use_reranking in rerank_options:
+            run = evaluate_rag_system(test_questions, index, bm25, all_chunks, top_k=top_k, alpha=alpha, use_reranking=use_reranking, generate=generate, workers=workers, search_results=search_results, verbose=False, metadata_index=metadata_index, tables=tables)
+            run["summary_metrics"]["embed_ms"] = embed_ms
+            runs.append(run)
+    return runs
+
+def write_report(runs: List[Dict[str, Any]], path: str) -> Tuple[str, str]:
+    """
+    Writes `<path>.json` (every run, with per-question results) and
+    `<path>.csv` (one row per run: configuration, metrics and stage latency
+    percentiles). Returns the two file paths.
+    """
+    json_path, csv_path = f"{path}.json", f"{path}.csv"
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(runs, f, indent=2)
+
+    rows = []
+    for run in runs:
+        metrics = run["summary_metrics"]
+        row = {key: value for key, value in metrics.items() if key not in ("score_weights", "latency")}
+        for stage, percentiles in metrics["latency"].items():
+            for name, value in percentiles.items():
+                row[f"{stage}_{name}"] = value
+        rows.append(row)
+    fieldnames = list(dict.fromkeys(key for row in rows for key in row))
+    with open(csv_path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+    return json_path, csv_path
+
 def print_evaluation_report(evaluation_results):
     """Prints a formatted report with the new user-centric metrics."""
     print("\n" + "="*80)
@@ -123,19 +281,52 @@ def print_evaluation_report(evaluation_results):
     print("\n--- Final Composite Retrieval Score ---")
     print(f"Formula: {weights['f1']}*F1 + {weights['mrr']}*MRR + {weights['map']}*MAP")
     print(f"Final Score: {metrics['final_retrieval_score']:.4f}")
+    print("\n--- Latency per Question ---")
+    if "embed_ms" in metrics:
+        print(f"Embedding (all questions, one call):        {metrics['embed_ms']:.1f} ms")
+    for stage, percentiles in metrics['latency'].items():
+        print(f"{stage:<10} p50 {percentiles['p50_ms']:9.1f} ms | p95 {percentiles['p95_ms']:9.1f} ms | p99 {percentiles['p99_ms']:9.1f} ms")
     print("\n--- Detailed Question-by-Question Analysis ---")
     for result in evaluation_results['detailed_results']:
         print(f"\nQuestion: {result['question'][:80]}...")
         print(f"  Expected: {result['expected_pages']} | Retrieved Top 5: {result['retrieved_pages'][:5]}")
         print(f"  Recall@5: {result['recall_at_5']:.2f} | Precision@5: {result['precision_at_5']:.2f}")
 
+def print_sweep_report(runs):
+    """Prints one line per configuration of a sweep, best final score first."""
+    print("\n" + "="*80)
+    print("PARAMETER SWEEP")
+    print("="*80)
+    for run in sorted(runs, key=lambda run: -run["summary_metrics"]["final_retrieval_score"]):
+        metrics = run["summary_metrics"]
+        print(f"alpha {metrics['alpha']:.2f} | top_k {metrics['top_k']:>3} | rerank {'on ' if metrics['use_reranking'] else 'off'} | "
+              f"R@5 {metrics['mean_recall_at_5']:.3f} | MRR {metrics['mean_reciprocal_rank']:.3f} | MAP {metrics['map_score']:.3f} | "
+              f"score {metrics['final_retrieval_score']:.4f} | "
+              f"search p95 {metrics['latency']['search']['p95_ms']:.1f} ms | rerank p95 {metrics['latency']['rerank']['p95_ms']:.1f} ms")
+
 
 # --- Main execution block to run the evaluation ---
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate retrieval quality and latency")
+    parser.add_argument("--questions", help="JSON file of [question, [expected pages]] pairs (defaults to the built-in test questions)")
+    parser.add_argument("--alpha", type=float, nargs="+", default=[0.5], help="semantic weights to sweep")
+    parser.add_argument("--top-k", type=int, nargs="+", default=[10], help="context sizes to sweep")
+    parser.add_argument("--rerank", choices=["on", "off"], nargs="+", default=["on"], help="reranking settings to sweep")
+    parser.add_argument("--generate", action="store_true", help="also generate answers with Gemini (slow)")
+    parser.add_argument("--infer-filters", choices=["on", "off"], default="on" if INFER_METADATA_FILTERS else "off", help="restrict weight-limit questions to their tables (default: INFER_METADATA_FILTERS)")
+    parser.add_argument("--table-lookup", choices=["on", "off"], default="on" if TABLE_LOOKUP else "off", help="answer weight-limit questions from the parsed tables (default: TABLE_LOOKUP)")
+    parser.add_argument("--workers", type=int, default=8, help="questions evaluated in parallel")
+    parser.add_argument("--report", help="write the report to REPORT.json and REPORT.csv")
+    args = parser.parse_args()
+
     print("="*80)
     print("STARTING RAG SYSTEM EVALUATION")
     print("="*80)
 
+    if args.questions:
+        with open(args.questions, encoding="utf-8") as f:
+            test_questions = [(question, pages) for question, pages in json.load(f)]
+
     # Load the necessary indexes from disk
     index, bm25, all_chunks = load_indexes()
 
@@ -143,18 +334,32 @@ if __name__ == "__main__":
         print("FATAL: Could not load indexes. Make sure they exist in the 'data/' directory.")
         sys.exit(1) # Exit with an error code
 
+    set_page_image_store(PageImageStore.for_chunks(all_chunks))
     print("✅ Indexes loaded successfully. Starting evaluation...")
 
     # Run the evaluation
-    evaluation_results = evaluate_rag_system(
+    start = time.perf_counter()
+    runs = sweep_rag_system(
         test_questions,
         index=index,
         bm25=bm25,
         all_chunks=all_chunks,
-        top_k=10,
-        alpha=0.5,
-        use_reranking=True
+        alphas=args.alpha,
+        top_ks=args.top_k,
+        rerank_options=[option == "on" for option in args.rerank],
+        generate=args.generate,
+        workers=args.workers,
+        metadata_index=MetadataIndex.from_chunks(all_chunks) if args.infer_filters == "on" else None,
+        tables=TableIndex.from_chunks(all_chunks) if args.table_lookup == "on" else None
     )
+    elapsed = time.perf_counter() - start
 
     # Print the comprehensive report
-    print_evaluation_report(evaluation_results)
\ No newline at end of file
+    if len(runs) == 1:
+        print_evaluation_report(runs[0])
+    else:
+        print_sweep_report(runs)
+    print(f"\n✅ Evaluated {len(runs)} configuration(s) x {len(test_questions)} questions in {elapsed:.1f}s")
+    if args.report:
+        json_path, csv_path = write_report(runs, args.report)
+        print(f"✅ Report written to {json_path} and {csv_path}")
@@ -1,30 +1,28 @@
-import io
-from PIL import Image
-import google.generativeai as genai
-from typing import List, Dict, Any, Optional
-from src.config import GEMINI_API_KEY
+from typing import List, Dict, Any, Optional, Iterator, AsyncIterator
+from src.config import CONTEXT_IMAGE_MAX_SIDE
+from src.context import VISUAL_TEXT_CHARS
+from src.llm_client import Prompt, get_llm_client
+from src.metrics import record_count, span
+from src.page_images import PageImageStore, get_page_image_store
 
-# Configure Gemini API
-genai.configure(api_key=GEMINI_API_KEY)
-
-def generate_answer(question: str, context: str, visual_parts: List[Dict[str, Any]]) -> str:
+def build_prompt(question: str, context: str, visual_parts: List[Dict[str, Any]], image_store: Optional[PageImageStore] = None, image_stores: Optional[Dict[str, PageImageStore]] = None) -> Prompt:
     """
-    Generates an answer using the Gemini model based on text context and visual parts.
+    Builds the Gemini prompt from the text context and visual parts. Page
+    images are loaded here, so this is the blocking part of generation.
 
     Args:
         question: The user's question.
         context: The concatenated text from relevant chunks.
-        visual_parts: A list of chunks that contain images.
+        visual_parts: A list of results for pages that have an image.
+        image_store: Where page images are loaded from. Defaults to the process-wide store.
+        image_stores: Per-manual image stores, used for visual parts that carry a "manual".
 
     Returns:
-        The generated answer as a string.
+        A text prompt, or a list of text and image parts when there are visual parts.
     """
-    try:
-        model = genai.GenerativeModel('gemini-2.5-pro')
-
-        if visual_parts:
-            parts = [
-                f"""Answer this question about the Boeing 737 Operations Manual.
+    if visual_parts:
+        parts = [
+            f"""Answer this question about the Boeing 737 Operations Manual.
 
                 CRITICAL INSTRUCTIONS FOR READING TABLES:
                 - Look at the VISUAL table image carefully.
@@ -40,16 +38,23 @@ def generate_answer(question: str, context: str, visual_parts: List[Dict[str, An
 
                 IMPORTANT: Visual tables below are the PRIMARY source. Read them carefully:
                 """
-            ]
-            for vp in visual_parts:
-                img = Image.open(io.BytesIO(vp["page_image"]))
-                parts.append(f"\n[Page {vp['page_number']}]")
+        ]
+        image_store = image_store or get_page_image_store()
+        for vp in visual_parts:
+            manual = vp.get("manual")
+            store = image_stores[manual] if image_stores and manual in image_stores else image_store
+            with span("image_decode"):
+                img = store.get(vp["page_number"], max_side=CONTEXT_IMAGE_MAX_SIDE or None, crop=True)
+            parts.append(f"\n[Page {vp['page_number']}]" if manual is None else f"\n[{manual}, Page {vp['page_number']}]")
+            if img is not None:
                 parts.append(img)
-                parts.append(f"\nExtracted text (may have OCR errors, use image if unclear):\n{vp['content'][:1000]}")
-            response = model.generate_content(parts)
-            return response.text
-        else:
-            prompt = f"""Answer this question about the Boeing 737 Operations Manual.
+            parts.append(f"\nExtracted text (may have OCR errors, use image if unclear):\n{vp['content'][:VISUAL_TEXT_CHARS]}")
+        record_count("images", sum(1 for part in parts if not isinstance(part, str)))
+        return parts
+
+    record_count("images", 0)
+
+    return f"""Answer this question about the Boeing 737 Operations Manual.
 
             CRITICAL FOR TABLES:
             - Find the EXACT row mentioned (e.g., "1600 meters").
@@ -63,7 +68,68 @@ def generate_answer(question: str, context: str, visual_parts: List[Dict[str, An
             {context}
 
             Read the table precisely and provide the exact value:"""
-            response = model.generate_content(prompt)
-            return response.text
-    except Exception as e:
-        return f"Error generating answer: {str(e)}"
\ No newline at end of file
+
+def _record_usage(response: Any) -> None:
+    """Records the prompt and answer token counts Gemini reports, if any."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage:
+        record_count("prompt_tokens", usage.prompt_token_count)
+        record_count("output_tokens", usage.candidates_token_count)
+
+def generate_from_prompt(prompt: Prompt) -> str:
+    """
+    Sends a prompt built by `build_prompt` to Gemini (see `LLMClient`) and
+    returns the answer text. Errors are raised: the `llm_client.TIMEOUT_ERRORS`
+    when the deadline passed, the `llm_client.RETRYABLE_ERRORS` when retries
+    and fallback were exhausted.
+    """
+    with span("generate"):
+        response = get_llm_client().generate(prompt)
+    _record_usage(response)
+    return response.text
+
+async def generate_from_prompt_async(prompt: Prompt) -> str:
+    """Async variant of `generate_from_prompt`: awaits Gemini without holding a thread."""
+    with span("generate"):
+        response = await get_llm_client().generate_async(prompt)
+    _record_usage(response)
+    return response.text
+
+def stream_from_prompt(prompt: Prompt) -> Iterator[str]:
+    """Streams the answer text of a prompt chunk by chunk, as Gemini produces it."""
+    chunk = None
+    with span("generate"):
+        for chunk in get_llm_client().stream(prompt):
+            if chunk.parts:
+                yield chunk.text
+    # The last chunk carries the token counts of the whole exchange.
+    _record_usage(chunk)
+
+async def stream_from_prompt_async(prompt: Prompt) -> AsyncIterator[str]:
+    """
+    Async variant of `stream_from_prompt`. Errors are raised to the caller,
+    which has already sent part of its response.
+    """
+    chunk = None
+    with span("generate"):
+        async for chunk in get_llm_client().stream_async(prompt):
+            if chunk.parts:
+                yield chunk.text
+    _record_usage(chunk)
+
+def generate_answer(question: str, context: str, visual_parts: List[Dict[str, Any]], image_store: Optional[PageImageStore] = None, image_stores: Optional[Dict[str, PageImageStore]] = None) -> str:
+    """
+    Generates an answer using the Gemini model based on text context and visual parts.
+
+    Args:
+        question: The user's question.
+        context: The concatenated text from relevant chunks.
+        visual_parts: A list of results for pages that have an image.
+        image_store: Where page images are loaded from. Defaults to the process-wide store.
+        image_stores: Per-manual image stores, used for visual parts that carry a "manual".
+
+    Returns:
+        The generated answer as a string. Errors are raised (see `generate_from_prompt`).
+    """
+    prompt = build_prompt(question, context, visual_parts, image_store=image_store, image_stores=image_stores)
+    return generate_from_prompt(prompt)
@@ -0,0 +1,280 @@
+import json
+import mmap
+import os
+import shutil
+import time
+import numpy as np
+from collections.abc import Sequence
+from typing import List, Dict, Any, Tuple, Optional, Mapping
+
+# On-disk index directory layout (format version 1):
+#
+#   manifest.json           format version, sizes and BM25 parameters
+#   embeddings.npy          float32 (N, d), L2-normalised chunk embeddings
+#   bm25_terms.txt          vocabulary, one term per line, in term-id order
+#   bm25_<name>.npy         BM25 postings arrays (offsets, docs, tfs, impacts, ...)
+#   chunks_text.bin         all chunk contents as one contiguous UTF-8 blob
+#   chunks_offsets.npy      int64 (N + 1,) byte offsets into chunks_text.bin
+#   chunks_page.npy         int32 (N,) page number of every chunk
+#   chunks_columns.json     chunk ids, types and metadata stored column by column
+#   page_images.bin         PNG bytes of every page that has an image, back to back
+#   page_images.npy         int64 (P, 3) rows of (page_number, offset, length)
+#   chunk_ids.npy           int64 (N,) stable vector id of every chunk
+#   faiss.index             optional approximate (HNSW/IVF) FAISS index keyed by chunk id
+#
+# Every array and blob is opened with mmap, so several worker processes
+# serving the same directory share one copy through the OS page cache.
+
+INDEX_FORMAT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+BM25_ARRAYS = ["postings_offsets", "postings_docs", "postings_tfs", "postings_impacts", "term_max_impacts", "doc_len", "idf"]
+
+
+class MappedBlob:
+    """A read-only, memory-mapped file that is sliced by byte offsets."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+
+    def read(self, start: int, end: int) -> bytes:
+        return self._mmap[start:end] if self._mmap is not None else b""
+
+    def close(self) -> None:
+        if self._mmap is not None:
+            self._mmap.close()
+        self._file.close()
+
+
+class PageImageBlob:
+    """Page number -> PNG bytes lookup over `page_images.bin`."""
+
+    def __init__(self, blob: MappedBlob, table: np.ndarray):
+        self.blob = blob
+        self._locations = {int(page): (int(offset), int(offset + length)) for page, offset, length in table}
+
+    def __contains__(self, page_number: int) -> bool:
+        return page_number in self._locations
+
+    def pages(self) -> List[int]:
+        return sorted(self._locations)
+
+    def get(self, page_number: int) -> Optional[bytes]:
+        location = self._locations.get(page_number)
+        return self.blob.read(*location) if location else None
+
+
+class ChunkStore(Sequence):
+    """
+    Read-only, list-like view over the chunks of an index directory.
+
+    Chunk dictionaries are assembled on access from the memory-mapped text
+    blob and the columnar metadata, so they have the same keys as the chunks
+    produced by `process_pdf`. `page_numbers` exposes the page column directly
+    for vectorised consumers.
+    """
+
+    def __init__(self, texts: MappedBlob, text_offsets: np.ndarray, page_numbers: np.ndarray, columns: Dict[str, Any], page_images: Optional[PageImageBlob] = None):
+        self.texts = texts
+        self.text_offsets = text_offsets
+        self.page_numbers = page_numbers
+        self.chunk_ids: List[str] = columns["chunk_id"]
+        self.types: List[str] = columns["type"]
+        self.metadata_columns: Dict[str, Dict[str, list]] = columns["metadata"]
+        self.page_images = page_images
+
+    def __len__(self) -> int:
+        return len(self.chunk_ids)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("chunk index out of range")
+        page_number = int(self.page_numbers[i])
+        content = self.texts.read(int(self.text_offsets[i]), int(self.text_offsets[i + 1])).decode("utf-8")
+        metadata = {key: column["values"][i] for key, column in self.metadata_columns.items() if column["present"][i]}
+        has_image = self.page_images is not None and self.types[i] != "text" and page_number in self.page_images
+        return {
+            "content": content, "page_number": page_number, "chunk_id": self.chunk_ids[i],
+            "type": self.types[i], "has_image": has_image, "metadata": metadata,
+        }
+
+    def close(self) -> None:
+        self.texts.close()
+        if self.page_images is not None:
+            self.page_images.blob.close()
+
+
+class EmbeddingMatrixIndex:
+    """
+    Exact inner-product search over a (possibly memory-mapped) embedding matrix.
+
+    Mirrors the `ntotal` / `d` / `search` interface of `faiss.IndexFlatIP`
+    without copying the vectors into FAISS-owned memory.
+    """
+
+    def __init__(self, embeddings: np.ndarray):
+        self.embeddings = embeddings
+        self.ntotal, self.d = embeddings.shape
+
+    def search(self, queries: np.ndarray, k: int, params: Any = None, subset: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Same contract as `faiss.Index.search`; `params` is accepted for compatibility and ignored.
+        With `subset` (row positions), only those rows are scored.
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        if subset is not None:
+            distances, indices = EmbeddingMatrixIndex(self.embeddings[subset]).search(queries, k)
+            return distances, np.where(indices >= 0, subset[np.maximum(indices, 0)], -1)
+        scores = queries @ self.embeddings.T
+        n = min(k, self.ntotal)
+        distances = np.full((len(queries), k), np.finfo(np.float32).min, dtype=np.float32)
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        if n == 0:
+            return distances, indices
+        top = np.argpartition(-scores, n - 1, axis=1)[:, :n]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        indices[:, :n] = np.take_along_axis(top, order, axis=1)
+        distances[:, :n] = np.take_along_axis(top_scores, order, axis=1)
+        return distances, indices
+
+
+def _to_json_value(value: Any) -> Any:
+    return value.item() if isinstance(value, np.generic) else value
+
+def _chunk_columns(chunks: List[Dict[str, Any]]) -> Dict[str, Any]:
+    metadata_keys: List[str] = []
+    for chunk in chunks:
+        for key in chunk.get("metadata", {}):
+            if key not in metadata_keys:
+                metadata_keys.append(key)
+    metadata_columns = {}
+    for key in metadata_keys:
+        present = [key in chunk.get("metadata", {}) for chunk in chunks]
+        values = [_to_json_value(chunk.get("metadata", {}).get(key)) for chunk in chunks]
+        metadata_columns[key] = {"present": present, "values": values}
+    return {
+        "chunk_id": [chunk["chunk_id"] for chunk in chunks],
+        "type": [chunk.get("type", "text") for chunk in chunks],
+        "metadata": metadata_columns,
+    }
+
+def write_index_dir(path: str, embeddings: np.ndarray, bm25_terms: List[str], bm25_arrays: Dict[str, np.ndarray], bm25_params: Dict[str, float], chunks: List[Dict[str, Any]], page_images: Optional[Mapping[int, bytes]] = None, chunk_ids: Optional[np.ndarray] = None, ann_index: Optional[bytes] = None) -> None:
+    """
+    Writes a complete index directory. The directory is assembled next to
+    `path` and renamed into place, so readers never observe a partial write.
+
+    Page images are taken from `page_images` (page number -> PNG bytes) and,
+    for chunks pickled before images were split out, from `chunk["page_image"]`.
+    `ann_index` is a serialized FAISS index whose ids are `chunk_ids`.
+    """
+    if len(embeddings) != len(chunks):
+        raise ValueError(f"Got {len(embeddings)} embeddings for {len(chunks)} chunks")
+
+    staging = f"{path.rstrip(os.sep)}.tmp-{os.getpid()}"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    np.save(os.path.join(staging, "embeddings.npy"), np.ascontiguousarray(embeddings, dtype=np.float32))
+
+    with open(os.path.join(staging, "bm25_terms.txt"), "w", encoding="utf-8") as f:
+        f.write("\n".join(bm25_terms))
+    for name in BM25_ARRAYS:
+        np.save(os.path.join(staging, f"bm25_{name}.npy"), np.asarray(bm25_arrays[name]))
+
+    text_offsets = np.zeros(len(chunks) + 1, dtype=np.int64)
+    with open(os.path.join(staging, "chunks_text.bin"), "wb") as f:
+        for i, chunk in enumerate(chunks):
+            encoded = chunk["content"].encode("utf-8")
+            f.write(encoded)
+            text_offsets[i + 1] = text_offsets[i] + len(encoded)
+    np.save(os.path.join(staging, "chunks_offsets.npy"), text_offsets)
+    np.save(os.path.join(staging, "chunks_page.npy"), np.array([chunk["page_number"] for chunk in chunks], dtype=np.int32))
+    with open(os.path.join(staging, "chunks_columns.json"), "w", encoding="utf-8") as f:
+        json.dump(_chunk_columns(chunks), f)
+
+    # One copy of each page image, however many chunks point at the page.
+    images = dict(page_images or {})
+    for chunk in chunks:
+        if chunk.get("page_image") is not None:
+            images.setdefault(chunk["page_number"], chunk["page_image"])
+    image_rows = []
+    offset = 0
+    with open(os.path.join(staging, "page_images.bin"), "wb") as f:
+        for page_number in sorted(images):
+            f.write(images[page_number])
+            image_rows.append((page_number, offset, len(images[page_number])))
+            offset += len(images[page_number])
+    np.save(os.path.join(staging, "page_images.npy"), np.array(image_rows, dtype=np.int64).reshape(-1, 3))
+
+    if chunk_ids is not None:
+        np.save(os.path.join(staging, "chunk_ids.npy"), np.asarray(chunk_ids, dtype=np.int64))
+    if ann_index is not None:
+        with open(os.path.join(staging, "faiss.index"), "wb") as f:
+            f.write(ann_index)
+
+    manifest = {
+        "format_version": INDEX_FORMAT_VERSION,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "num_chunks": len(chunks),
+        "dimension": int(embeddings.shape[1]),
+        "num_terms": len(bm25_terms),
+        "num_page_images": len(image_rows),
+        "ann_index": ann_index is not None,
+        "bm25_params": bm25_params,
+    }
+    with open(os.path.join(staging, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    previous = f"{path.rstrip(os.sep)}.old-{os.getpid()}"
+    if os.path.exists(path):
+        os.rename(path, previous)
+    os.rename(staging, path)
+    shutil.rmtree(previous, ignore_errors=True)
+
+def is_index_dir(path: Optional[str]) -> bool:
+    """True if `path` holds an index directory written by `write_index_dir`."""
+    return bool(path) and os.path.isfile(os.path.join(path, MANIFEST_FILE))
+
+def read_index_dir(path: str) -> Dict[str, Any]:
+    """
+    Opens an index directory with every array memory-mapped.
+
+    Returns:
+        A dictionary with the manifest, the embedding matrix, the chunk ids,
+        the path of the approximate FAISS index (or None), the BM25 terms,
+        arrays and parameters, and a ChunkStore over the chunks.
+    """
+    with open(os.path.join(path, MANIFEST_FILE), encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format_version") != INDEX_FORMAT_VERSION:
+        raise ValueError(f"Unsupported index format version {manifest.get('format_version')} in {path}")
+
+    load = lambda name: np.load(os.path.join(path, name), mmap_mode="r")
+
+    with open(os.path.join(path, "bm25_terms.txt"), encoding="utf-8") as f:
+        bm25_terms = f.read().split("\n") if manifest["num_terms"] else []
+    bm25_arrays = {name: load(f"bm25_{name}.npy") for name in BM25_ARRAYS}
+
+    with open(os.path.join(path, "chunks_columns.json"), encoding="utf-8") as f:
+        columns = json.load(f)
+    page_images = PageImageBlob(MappedBlob(os.path.join(path, "page_images.bin")), load("page_images.npy"))
+    chunks = ChunkStore(MappedBlob(os.path.join(path, "chunks_text.bin")), load("chunks_offsets.npy"), load("chunks_page.npy"), columns, page_images)
+
+    chunk_ids_path = os.path.join(path, "chunk_ids.npy")
+    return {
+        "manifest": manifest,
+        "embeddings": load("embeddings.npy"),
+        "chunk_ids": load("chunk_ids.npy") if os.path.exists(chunk_ids_path) else None,
+        "ann_index_path": os.path.join(path, "faiss.index") if manifest.get("ann_index") else None,
+        "bm25_terms": bm25_terms,
+        "bm25_arrays": bm25_arrays,
+        "bm25_params": manifest["bm25_params"],
+        "chunks": chunks,
+    }
@@ -1,17 +1,561 @@
+import hashlib
+import json
+import math
+import os
 import pickle
+import sys
 import numpy as np
-from sentence_transformers import SentenceTransformer
+from collections import Counter
+from dataclasses import dataclass
 import faiss
 from rank_bm25 import BM25Okapi
-from typing import List, Dict, Any, Tuple, Optional
-from src.config import FAISS_INDEX_PATH, BM25_INDEX_PATH, CHUNKS_PATH
+from typing import List, Dict, Any, Tuple, Optional, Mapping, Sequence, Union
+from src.config import (FAISS_INDEX_PATH, BM25_INDEX_PATH, CHUNKS_PATH, INDEX_DIR, FAISS_INDEX_TYPE, FAISS_NLIST,
+                        FAISS_HNSW_M, FAISS_PQ_M, FAISS_TRAIN_SIZE, FAISS_NPROBE, FAISS_EF_SEARCH, FAISS_RESCORE_FACTOR)
+from src.index_store import EmbeddingMatrixIndex, is_index_dir, read_index_dir, write_index_dir
+from src.embedding import EmbeddingService, get_embedding_service
 
-def create_indexes(chunks_to_index: List[Dict[str, Any]]) -> Tuple[faiss.IndexFlatIP, BM25Okapi, List[Dict[str, Any]]]:
+@dataclass
+class PageIndex:
+    """
+    Precomputed chunk -> page mapping used to group fused scores by page
+    without touching the chunk dictionaries.
+
+    Attributes:
+        page_numbers: Sorted unique page numbers, shape (P,).
+        chunk_page: For every chunk, the position of its page in `page_numbers`, shape (N,).
+        page_chunks: Chunk indices ordered by page, shape (N,).
+        page_offsets: Slice boundaries into `page_chunks` for each page, shape (P + 1,).
+    """
+    page_numbers: np.ndarray
+    chunk_page: np.ndarray
+    page_chunks: np.ndarray
+    page_offsets: np.ndarray
+
+    def chunks_for_page(self, page_pos: int) -> np.ndarray:
+        """Returns the chunk indices belonging to the page at position `page_pos`."""
+        return self.page_chunks[self.page_offsets[page_pos]:self.page_offsets[page_pos + 1]]
+
+def build_page_index(chunks: List[Dict[str, Any]]) -> PageIndex:
+    """Builds the chunk -> page arrays for a list of chunks (or a ChunkStore)."""
+    chunk_page_numbers = getattr(chunks, "page_numbers", None)
+    if chunk_page_numbers is None:
+        chunk_page_numbers = np.fromiter((chunk["page_number"] for chunk in chunks), dtype=np.int64, count=len(chunks))
+    page_numbers, chunk_page = np.unique(chunk_page_numbers, return_inverse=True)
+    page_chunks = np.argsort(chunk_page, kind="stable")
+    page_offsets = np.zeros(len(page_numbers) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(chunk_page, minlength=len(page_numbers)), out=page_offsets[1:])
+    return PageIndex(page_numbers, chunk_page, page_chunks, page_offsets)
+
+# Chunk metadata fields that retrieval can be restricted to (see `MetadataIndex`).
+METADATA_FILTER_FIELDS = ("table_type", "altitude", "runway_condition", "flap_setting")
+
+# Filters map a metadata field to the allowed value or values, e.g.
+# {"table_type": "field_climb_limits", "altitude": ["1000", "2000"]}.
+MetadataFilters = Mapping[str, Union[str, int, float, Sequence[Union[str, int, float]]]]
+
+def normalize_filters(filters: Optional[MetadataFilters]) -> Optional[Tuple[Tuple[str, Tuple[str, ...]], ...]]:
+    """A canonical, hashable form of metadata filters: sorted (field, sorted string values) pairs."""
+    if not filters:
+        return None
+    normalized = []
+    for field, values in sorted(filters.items()):
+        if field not in METADATA_FILTER_FIELDS:
+            raise ValueError(f"Unknown metadata filter '{field}' (expected one of: {', '.join(METADATA_FILTER_FIELDS)})")
+        values = [values] if isinstance(values, (str, int, float)) else list(values)
+        normalized.append((field, tuple(sorted({str(value).lower() for value in values}))))
+    return tuple(normalized)
+
+class MetadataIndex:
+    """
+    Bitmaps (packed bit arrays over the chunk list) of the chunks that have
+    each value of the filterable metadata fields. Filters are resolved with
+    bitwise operations: OR across the values of a field, AND across fields.
+    Chunks without a field never match a filter on it.
+    """
+
+    def __init__(self, num_chunks: int, bitmaps: Dict[str, Dict[str, np.ndarray]]):
+        self.num_chunks = num_chunks
+        self.bitmaps = bitmaps
+
+    @classmethod
+    def from_chunks(cls, chunks: List[Dict[str, Any]]) -> "MetadataIndex":
+        """Builds the bitmaps of a list of chunks (or a ChunkStore, read column by column)."""
+        columns = getattr(chunks, "metadata_columns", None)
+        positions: Dict[str, Dict[str, List[int]]] = {field: {} for field in METADATA_FILTER_FIELDS}
+        for field in METADATA_FILTER_FIELDS:
+            if columns is not None:
+                column = columns.get(field, {"present": [], "values": []})
+                values = (value if present else None for present, value in zip(column["present"], column["values"]))
+            else:
+                values = (chunk.get("metadata", {}).get(field) for chunk in chunks)
+            for i, value in enumerate(values):
+                if value is not None:
+                    positions[field].setdefault(str(value).lower(), []).append(i)
+
+        bitmaps: Dict[str, Dict[str, np.ndarray]] = {}
+        for field, by_value in positions.items():
+            bitmaps[field] = {}
+            for value, members in by_value.items():
+                mask = np.zeros(len(chunks), dtype=bool)
+                mask[members] = True
+                bitmaps[field][value] = np.packbits(mask)
+        return cls(len(chunks), bitmaps)
+
+    def values(self, field: str) -> List[str]:
+        """The distinct values of a field."""
+        return sorted(self.bitmaps.get(field, {}))
+
+    def mask(self, filters: Optional[MetadataFilters]) -> Optional[np.ndarray]:
+        """Boolean mask of the chunks matching `filters`, or None when there are no filters."""
+        normalized = normalize_filters(filters)
+        if normalized is None:
+            return None
+        result = None
+        for field, values in normalized:
+            field_bits = np.zeros((self.num_chunks + 7) // 8, dtype=np.uint8)
+            for value in values:
+                bits = self.bitmaps[field].get(value)
+                if bits is not None:
+                    field_bits |= bits
+            result = field_bits if result is None else result & field_bits
+        return np.unpackbits(result, count=self.num_chunks).astype(bool)
+
+def tokenize(text: str) -> List[str]:
+    """The tokenizer shared by BM25 indexing and querying."""
+    return text.lower().split()
+
+class BM25Index:
+    """
+    Okapi BM25 over a term -> postings CSR layout.
+
+    Postings for term `t` live in `postings_docs[postings_offsets[t]:postings_offsets[t + 1]]`
+    (sorted doc ids), with the matching term frequencies and precomputed BM25
+    impacts (`idf * tf-saturation`) alongside. Scoring a query only touches
+    the postings of its terms.
+
+    Uses the same formula, parameters and IDF floor as `rank_bm25.BM25Okapi`,
+    and `get_scores` returns the same values.
+    """
+
+    def __init__(self, vocab: Dict[str, int], postings_offsets: np.ndarray, postings_docs: np.ndarray, postings_tfs: np.ndarray, doc_len: np.ndarray, idf: np.ndarray, k1: float = 1.5, b: float = 0.75, epsilon: float = 0.25, postings_impacts: Optional[np.ndarray] = None, term_max_impacts: Optional[np.ndarray] = None):
+        self.vocab = vocab
+        self.postings_offsets = postings_offsets
+        self.postings_docs = postings_docs
+        self.postings_tfs = postings_tfs
+        self.doc_len = doc_len
+        self.idf = idf
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+        self.corpus_size = len(doc_len)
+        self.avgdl = float(doc_len.sum()) / self.corpus_size
+
+        if postings_impacts is None:
+            # Per-posting contribution, written exactly as in BM25Okapi.get_scores.
+            posting_terms = np.repeat(np.arange(len(idf)), np.diff(postings_offsets))
+            tf = postings_tfs.astype(np.float64)
+            dl = doc_len[postings_docs]
+            postings_impacts = idf[posting_terms] * (tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / self.avgdl)))
+        self.postings_impacts = postings_impacts
+
+        if term_max_impacts is None:
+            # Upper bound of each term's contribution, used for MaxScore pruning.
+            term_max_impacts = np.zeros(len(idf))
+            nonempty = np.diff(postings_offsets) > 0
+            term_max_impacts[nonempty] = np.maximum.reduceat(postings_impacts, postings_offsets[:-1][nonempty])
+        self.term_max_impacts = term_max_impacts
+        # Impacts have the sign of their term's IDF (the tf part is positive);
+        # negative ones (possible on tiny corpora) break MaxScore's bounds.
+        self.has_negative_impacts = bool((idf < 0).any())
+
+    def to_arrays(self) -> Tuple[List[str], Dict[str, np.ndarray], Dict[str, float]]:
+        """Returns (terms in id order, postings arrays, parameters) for on-disk storage."""
+        terms = sorted(self.vocab, key=self.vocab.get)
+        arrays = {
+            "postings_offsets": self.postings_offsets, "postings_docs": self.postings_docs,
+            "postings_tfs": self.postings_tfs, "postings_impacts": self.postings_impacts,
+            "term_max_impacts": self.term_max_impacts, "doc_len": self.doc_len, "idf": self.idf,
+        }
+        return terms, arrays, {"k1": self.k1, "b": self.b, "epsilon": self.epsilon}
+
+    @classmethod
+    def from_arrays(cls, terms: List[str], arrays: Dict[str, np.ndarray], params: Dict[str, float]) -> "BM25Index":
+        """Rebuilds the index from `to_arrays` output (arrays may be memory-mapped)."""
+        vocab = {term: term_id for term_id, term in enumerate(terms)}
+        return cls(vocab, arrays["postings_offsets"], arrays["postings_docs"], arrays["postings_tfs"], arrays["doc_len"], arrays["idf"],
+                   params["k1"], params["b"], params["epsilon"], postings_impacts=arrays["postings_impacts"], term_max_impacts=arrays["term_max_impacts"])
+
+    @classmethod
+    def from_corpus(cls, tokenized_corpus: List[List[str]], k1: float = 1.5, b: float = 0.75, epsilon: float = 0.25) -> "BM25Index":
+        """Builds the index from tokenized documents."""
+        vocab: Dict[str, int] = {}
+        doc_ids, term_ids, tfs = [], [], []
+        for doc_id, document in enumerate(tokenized_corpus):
+            for term, tf in Counter(document).items():
+                doc_ids.append(doc_id)
+                term_ids.append(vocab.setdefault(term, len(vocab)))
+                tfs.append(tf)
+        doc_len = np.array([len(document) for document in tokenized_corpus], dtype=np.int64)
+        return cls._from_triples(vocab, np.array(doc_ids, dtype=np.int64), np.array(term_ids, dtype=np.int64), np.array(tfs, dtype=np.int64), doc_len, k1, b, epsilon)
+
+    @classmethod
+    def from_bm25okapi(cls, bm25: BM25Okapi) -> "BM25Index":
+        """Converts a pickled rank_bm25.BM25Okapi model without re-tokenizing the corpus."""
+        vocab: Dict[str, int] = {}
+        doc_ids, term_ids, tfs = [], [], []
+        for doc_id, frequencies in enumerate(bm25.doc_freqs):
+            for term, tf in frequencies.items():
+                doc_ids.append(doc_id)
+                term_ids.append(vocab.setdefault(term, len(vocab)))
+                tfs.append(tf)
+        doc_len = np.array(bm25.doc_len, dtype=np.int64)
+        idf = np.array([bm25.idf[term] for term in vocab], dtype=np.float64)
+        return cls._from_triples(vocab, np.array(doc_ids, dtype=np.int64), np.array(term_ids, dtype=np.int64), np.array(tfs, dtype=np.int64), doc_len, bm25.k1, bm25.b, bm25.epsilon, idf=idf)
+
+    @classmethod
+    def _from_triples(cls, vocab: Dict[str, int], doc_ids: np.ndarray, term_ids: np.ndarray, tfs: np.ndarray, doc_len: np.ndarray, k1: float, b: float, epsilon: float, idf: Optional[np.ndarray] = None) -> "BM25Index":
+        order = np.lexsort((doc_ids, term_ids))
+        postings_offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        document_frequency = np.bincount(term_ids, minlength=len(vocab))
+        np.cumsum(document_frequency, out=postings_offsets[1:])
+
+        if idf is None:
+            # Same IDF and epsilon floor as BM25Okapi._calc_idf (math.log, vocabulary order).
+            corpus_size = len(doc_len)
+            idf_values = [math.log(corpus_size - int(freq) + 0.5) - math.log(int(freq) + 0.5) for freq in document_frequency]
+            average_idf = sum(idf_values) / len(idf_values)
+            eps = epsilon * average_idf
+            idf = np.array([value if value >= 0 else eps for value in idf_values], dtype=np.float64)
+
+        return cls(vocab, postings_offsets, doc_ids[order].astype(np.int32), tfs[order].astype(np.int32), doc_len, idf, k1, b, epsilon)
+
+    def _postings(self, term_id: int) -> slice:
+        return slice(self.postings_offsets[term_id], self.postings_offsets[term_id + 1])
+
+    def get_scores(self, query: List[str], allowed: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Returns the BM25 score of every document for a tokenized query. With
+        an `allowed` boolean mask, only those documents are scored; the others
+        get 0.
+        """
+        scores = np.zeros(self.corpus_size)
+        for term in query:
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                continue
+            postings = self._postings(term_id)
+            docs = self.postings_docs[postings]
+            if allowed is None:
+                scores[docs] += self.postings_impacts[postings]
+            else:
+                keep = allowed[docs]
+                scores[docs[keep]] += self.postings_impacts[postings][keep]
+        return scores
+
+    def get_scores_batch(self, queries: List[List[str]], allowed: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Returns the (len(queries), corpus_size) BM25 scores of several tokenized
+        queries, equal row by row to `get_scores`. The postings of each distinct
+        term are read once and added to the rows of every query containing it.
+        """
+        scores = np.zeros((len(queries), self.corpus_size))
+        term_rows: Dict[int, List[Tuple[int, int]]] = {}
+        for row, query in enumerate(queries):
+            for term, count in Counter(query).items():
+                term_id = self.vocab.get(term)
+                if term_id is not None:
+                    term_rows.setdefault(term_id, []).append((row, count))
+        for term_id, rows_counts in term_rows.items():
+            postings = self._postings(term_id)
+            docs = self.postings_docs[postings]
+            impacts = self.postings_impacts[postings]
+            if allowed is not None:
+                keep = allowed[docs]
+                docs, impacts = docs[keep], impacts[keep]
+            rows = np.array([row for row, _ in rows_counts])
+            counts = np.array([count for _, count in rows_counts], dtype=np.float64)
+            scores[rows[:, None], docs[None, :]] += counts[:, None] * impacts[None, :]
+        return scores
+
+    def get_batch_scores(self, query: List[str], doc_ids: List[int]) -> List[float]:
+        """Returns the BM25 scores of a subset of documents."""
+        return self.get_scores(query)[np.asarray(doc_ids, dtype=np.int64)].tolist()
+
+    def get_top_k(self, query: List[str], k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the `k` best (doc_ids, scores), best first, using MaxScore pruning.
+
+        Terms are visited in decreasing order of their best possible contribution.
+        Once the k-th best partial score beats everything the remaining terms
+        could add, documents that have not been seen yet cannot enter the top-k,
+        so the remaining postings are only used to complete known candidates.
+        """
+        term_counts = Counter(self.vocab[term] for term in query if term in self.vocab)
+        if not term_counts or k <= 0:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float64)
+
+        terms = sorted(term_counts, key=lambda t: term_counts[t] * self.term_max_impacts[t], reverse=True)
+        upper_bounds = np.array([term_counts[t] * self.term_max_impacts[t] for t in terms])
+        if self.has_negative_impacts:
+            # Negative IDFs break the pruning bound; score exhaustively instead.
+            scores = self.get_scores(query)
+            top = np.argsort(-scores, kind="stable")[:k]
+            return top, scores[top]
+        remaining_bounds = np.concatenate([np.cumsum(upper_bounds[::-1])[::-1], [0.0]])
+
+        scores = np.zeros(self.corpus_size)
+        seen = np.zeros(self.corpus_size, dtype=bool)
+        num_seen = 0
+        threshold = 0.0
+        for i, term_id in enumerate(terms):
+            postings = self._postings(term_id)
+            docs = self.postings_docs[postings]
+            impacts = self.postings_impacts[postings] * term_counts[term_id]
+            if num_seen >= k and threshold >= remaining_bounds[i]:
+                # Non-essential term: only refine documents already in the candidate set.
+                known = seen[docs]
+                scores[docs[known]] += impacts[known]
+            else:
+                scores[docs] += impacts
+                num_seen += int((~seen[docs]).sum())
+                seen[docs] = True
+                if num_seen >= k:
+                    candidate_scores = scores[seen]
+                    threshold = np.partition(candidate_scores, len(candidate_scores) - k)[len(candidate_scores) - k]
+
+        candidates = np.flatnonzero(seen)
+        k = min(k, len(candidates))
+        top = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return top, scores[top]
+
+def chunk_content_hash(chunk: Dict[str, Any]) -> str:
+    """Content hash of a chunk: its id, type, text and metadata."""
+    payload = json.dumps([chunk["chunk_id"], chunk.get("type", "text"), chunk["content"], chunk.get("metadata", {})], sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+def chunk_vector_id(chunk: Dict[str, Any]) -> int:
+    """Stable 63-bit FAISS id of a chunk, derived from its content hash."""
+    return int(chunk_content_hash(chunk)[:16], 16) & 0x7FFF_FFFF_FFFF_FFFF
+
+def chunk_vector_ids(chunks: List[Dict[str, Any]]) -> np.ndarray:
+    return np.array([chunk_vector_id(chunk) for chunk in chunks], dtype=np.int64)
+
+class IdMappedIndex:
+    """
+    Wraps a FAISS `IndexIDMap2` whose vectors are keyed by stable chunk ids
+    (so they can be removed and re-added individually) and translates search
+    results back to positions in the chunk list.
+    """
+
+    def __init__(self, index: faiss.IndexIDMap2, chunk_ids: np.ndarray):
+        """
+        Args:
+            index: The id-mapped FAISS index.
+            chunk_ids: The vector id of every chunk, in chunk-list order.
+        """
+        self.index = index
+        self.ntotal = index.ntotal
+        self.d = index.d
+        self.chunk_ids = chunk_ids
+        self._order = np.argsort(chunk_ids, kind="stable")
+        self._sorted_ids = chunk_ids[self._order]
+
+    def search(self, queries: np.ndarray, k: int, params: Optional[faiss.SearchParameters] = None, subset: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Same contract as `faiss.Index.search`, returning chunk positions.
+        `subset` (chunk positions) restricts the search with a FAISS ID selector.
+        """
+        selector = None
+        if subset is not None:
+            selector = faiss.IDSelectorBatch(self.chunk_ids[subset])
+            params = with_selector(self.index, params, selector)
+        distances, ids = self.index.search(queries, k, params=params)
+        slots = np.clip(np.searchsorted(self._sorted_ids, ids), 0, max(len(self._sorted_ids) - 1, 0))
+        found = (ids >= 0) & (len(self._sorted_ids) > 0) & (self._sorted_ids[slots] == ids)
+        return distances, np.where(found, self._order[slots], -1)
+
+    def embeddings(self, chunk_ids: np.ndarray) -> np.ndarray:
+        """Returns the stored vectors for the given chunk ids."""
+        return self.index.reconstruct_batch(np.asarray(chunk_ids, dtype=np.int64))
+
+class RescoringIndex(IdMappedIndex):
+    """
+    An IdMappedIndex over quantized vectors (SQ8, PQ, IVF-PQ) that re-scores
+    a shortlist of `k * factor` candidates with the exact float32 vectors.
+    Only the codes are held in memory; the exact vectors are usually the
+    memory-mapped embedding matrix, of which only the shortlisted rows are read.
+    """
+
+    def __init__(self, index: faiss.IndexIDMap2, chunk_ids: np.ndarray, exact_vectors: np.ndarray, factor: int = FAISS_RESCORE_FACTOR):
+        """
+        Args:
+            index: The id-mapped quantized FAISS index.
+            chunk_ids: The vector id of every chunk, in chunk-list order.
+            exact_vectors: The normalised float32 vectors, in chunk-list order.
+            factor: Candidates fetched from the quantized index per result.
+        """
+        super().__init__(index, chunk_ids)
+        self.exact_vectors = exact_vectors
+        self.factor = max(1, factor)
+
+    def search(self, queries: np.ndarray, k: int, params: Optional[faiss.SearchParameters] = None, subset: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Same contract as `IdMappedIndex.search`, with exact inner products as distances."""
+        queries = np.asarray(queries, dtype=np.float32)
+        _, positions = super().search(queries, k * self.factor, params=params, subset=subset)
+        distances = np.full((len(queries), k), np.finfo(np.float32).min, dtype=np.float32)
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        # Sorted unique rows: one gather from the (memory-mapped) matrix, in file order.
+        rows = np.unique(positions[positions >= 0])
+        if not len(rows):
+            return distances, indices
+        scores = queries @ np.asarray(self.exact_vectors[rows], dtype=np.float32).T
+        candidate_scores = np.take_along_axis(scores, np.searchsorted(rows, np.maximum(positions, 0)), axis=1)
+        candidate_scores[positions < 0] = np.finfo(np.float32).min
+        order = np.argsort(-candidate_scores, axis=1, kind="stable")[:, :k]
+        n = order.shape[1]
+        distances[:, :n] = np.take_along_axis(candidate_scores, order, axis=1)
+        indices[:, :n] = np.take_along_axis(positions, order, axis=1)
+        return distances, indices
+
+FAISS_INDEX_KINDS = ("flat", "hnsw", "ivf_flat", "ivf_pq", "sq8", "pq")
+
+def with_selector(index: Any, params: Optional[faiss.SearchParameters], selector: faiss.IDSelector) -> faiss.SearchParameters:
+    """
+    Search parameters that restrict `index` to `selector`, keeping the
+    nprobe/efSearch of `params`. The caller must keep `selector` alive.
+    """
+    base = base_faiss_index(index)
+    if isinstance(base, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=params.nprobe if params is not None else base.nprobe)
+    if isinstance(base, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=params.efSearch if params is not None else base.hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
+
+def search_subset(index: Any, queries: np.ndarray, k: int, subset: np.ndarray, params: Optional[faiss.SearchParameters] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Searches only the chunks at positions `subset` (int64), so vectors
+    outside it are never scored. Works for IdMappedIndex, EmbeddingMatrixIndex
+    and plain FAISS indexes whose ids are chunk positions.
+    """
+    subset = np.asarray(subset, dtype=np.int64)
+    if isinstance(index, (IdMappedIndex, EmbeddingMatrixIndex)):
+        return index.search(queries, k, params=params, subset=subset)
+    selector = faiss.IDSelectorBatch(subset)
+    return index.search(queries, k, params=with_selector(index, params, selector))
+
+def faiss_index_description(kind: str, num_vectors: int, dim: int, nlist: int = FAISS_NLIST, hnsw_m: int = FAISS_HNSW_M, pq_m: int = FAISS_PQ_M) -> str:
+    """Returns the `faiss.index_factory` string for an index kind and corpus size."""
+    if kind == "flat":
+        return "Flat"
+    if kind == "hnsw":
+        return f"HNSW{hnsw_m},Flat"
+    if kind == "sq8":
+        return "SQ8"
+    if kind in ("pq", "ivf_pq"):
+        if dim % pq_m:
+            raise ValueError(f"FAISS_PQ_M={pq_m} must divide the embedding dimension {dim}")
+        # 2^bits centroids per sub-quantizer, again with ~39 training points each
+        # (FAISS's SIMD distance tables need at least 16 centroids on small corpora).
+        pq_bits = max(4, min(8, int(math.log2(max(2, num_vectors // 39)))))
+        if kind == "pq":
+            return f"PQ{pq_m}x{pq_bits}"
+    # Keep at least ~39 training points per centroid, as FAISS recommends.
+    nlist = nlist or int(4 * math.sqrt(num_vectors))
+    nlist = max(1, min(nlist, num_vectors // 39))
+    if kind == "ivf_flat":
+        return f"IVF{nlist},Flat"
+    if kind == "ivf_pq":
+        return f"IVF{nlist},PQ{pq_m}x{pq_bits}"
+    raise ValueError(f"Unknown FAISS index type '{kind}'. Expected one of {FAISS_INDEX_KINDS}")
+
+def build_faiss_index(embeddings: np.ndarray, chunk_ids: np.ndarray, kind: str = FAISS_INDEX_TYPE, nlist: int = FAISS_NLIST, hnsw_m: int = FAISS_HNSW_M, pq_m: int = FAISS_PQ_M, train_size: int = FAISS_TRAIN_SIZE) -> faiss.IndexIDMap2:
+    """
+    Builds an inner-product index of the requested kind, keyed by chunk id.
+
+    Args:
+        embeddings: Normalised float32 vectors, shape (N, d).
+        chunk_ids: The vector id of each row.
+        kind: "flat" (exact), "hnsw", "ivf_flat", "ivf_pq", "sq8" or "pq".
+        nlist: Number of IVF lists (0 picks about 4 * sqrt(N)).
+        hnsw_m: HNSW graph degree.
+        pq_m: Number of PQ sub-quantizers.
+        train_size: IVF/PQ/SQ training uses a random sample of at most this many vectors.
+
+    Returns:
+        The trained and populated index, wrapped in an IndexIDMap2.
+    """
+    num_vectors, dim = embeddings.shape
+    description = faiss_index_description(kind, num_vectors, dim, nlist, hnsw_m, pq_m)
+    index = faiss.index_factory(dim, description, faiss.METRIC_INNER_PRODUCT)
+    if isinstance(index, faiss.IndexPQ):
+        # Polysemous codes only serve Hamming-distance search, and are slow to train.
+        index.do_polysemous_training = False
+
+    if not index.is_trained:
+        rng = np.random.default_rng(0)
+        sample = embeddings[np.sort(rng.choice(num_vectors, size=min(num_vectors, train_size), replace=False))]
+        print(f"Training {description} on {len(sample)} vectors...")
+        index.train(np.ascontiguousarray(sample, dtype=np.float32))
+
+    base = faiss.downcast_index(index)
+    if isinstance(base, faiss.IndexIVF):
+        base.nprobe = FAISS_NPROBE
+    elif isinstance(base, faiss.IndexHNSW):
+        base.hnsw.efSearch = FAISS_EF_SEARCH
+
+    id_map = faiss.IndexIDMap2(index)
+    id_map.add_with_ids(embeddings, chunk_ids)
+    return id_map
+
+def base_faiss_index(index: Any) -> Any:
+    """Unwraps IdMappedIndex / IndexIDMap down to the index that does the searching."""
+    if isinstance(index, IdMappedIndex):
+        index = index.index
+    if isinstance(index, faiss.IndexIDMap):
+        index = faiss.downcast_index(index.index)
+    return index
+
+def is_quantized(index: Any) -> bool:
+    """True if `index` stores lossy codes instead of the float32 vectors."""
+    return isinstance(base_faiss_index(index), (faiss.IndexScalarQuantizer, faiss.IndexPQ, faiss.IndexIVFScalarQuantizer, faiss.IndexIVFPQ))
+
+def id_mapped_index(index: faiss.IndexIDMap2, chunk_ids: np.ndarray, exact_vectors: Optional[np.ndarray] = None) -> IdMappedIndex:
+    """
+    Wraps an id-mapped FAISS index for search. Quantized indexes are
+    re-scored with `exact_vectors` (in chunk order) when they are given and
+    FAISS_RESCORE_FACTOR is not 0.
+    """
+    if exact_vectors is not None and FAISS_RESCORE_FACTOR > 0 and is_quantized(index):
+        return RescoringIndex(index, chunk_ids, exact_vectors)
+    return IdMappedIndex(index, chunk_ids)
+
+def exact_vectors_path(faiss_index_path: str = FAISS_INDEX_PATH) -> str:
+    """Where the float32 vectors of a quantized legacy FAISS index are kept."""
+    return f"{faiss_index_path}.f32.npy"
+
+def search_parameters(index: Any, nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> Optional[faiss.SearchParameters]:
+    """
+    Builds per-query FAISS search parameters for IVF (`nprobe`) or HNSW
+    (`efSearch`) indexes. Returns None when nothing applies, so the
+    defaults set at build time are used.
+    """
+    base = base_faiss_index(index)
+    if nprobe and isinstance(base, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(nprobe=nprobe)
+    if ef_search and isinstance(base, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(efSearch=ef_search)
+    return None
+
+def create_indexes(chunks_to_index: List[Dict[str, Any]], embedder: Optional[EmbeddingService] = None, page_images: Optional[Mapping[int, bytes]] = None) -> Tuple[IdMappedIndex, BM25Index, List[Dict[str, Any]]]:
     """
     Creates and saves FAISS and BM25 indexes from a list of chunks.
 
     Args:
         chunks_to_index: A list of chunk dictionaries.
+        embedder: The shared embedding service. Defaults to the process-wide instance.
+        page_images: Page number -> PNG bytes, stored in the index directory (if INDEX_DIR is set).
 
     Returns:
         A tuple containing the FAISS index, BM25 index, and the original chunks.
@@ -20,48 +564,95 @@ def create_indexes(chunks_to_index: List[Dict[str, Any]]) -> Tuple[faiss.IndexFl
         raise ValueError("No chunks provided for indexing!")
 
     print("Creating embeddings...")
-    embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+    embedder = embedder or get_embedding_service()
     chunk_texts = [chunk["content"] for chunk in chunks_to_index]
-    chunk_embeddings = embedding_model.encode(chunk_texts, show_progress_bar=True)
+    chunk_embeddings = embedder.encode(chunk_texts, show_progress_bar=True)
 
-    print("Creating FAISS index...")
-    embedding_dim = chunk_embeddings.shape[1]
-    index = faiss.IndexFlatIP(embedding_dim)
+    print(f"Creating FAISS index ({FAISS_INDEX_TYPE})...")
     faiss.normalize_L2(chunk_embeddings)
-    index.add(chunk_embeddings)
+    chunk_ids = chunk_vector_ids(chunks_to_index)
+    index = build_faiss_index(chunk_embeddings, chunk_ids)
 
     print("Creating BM25 index...")
-    tokenized_chunks = [chunk.lower().split() for chunk in chunk_texts]
-    bm25 = BM25Okapi(tokenized_chunks)
+    tokenized_chunks = [tokenize(chunk) for chunk in chunk_texts]
+    bm25 = BM25Index.from_corpus(tokenized_chunks)
 
     print(f" Created FAISS index with {index.ntotal} embeddings")
     print(f"Created BM25 index with {len(tokenized_chunks)} documents")
 
+    save_indexes(index, bm25, chunks_to_index, chunk_embeddings, page_images)
+    return id_mapped_index(index, chunk_ids, chunk_embeddings), bm25, chunks_to_index
+
+def save_indexes(index: faiss.Index, bm25: BM25Index, chunks: List[Dict[str, Any]], embeddings: np.ndarray, page_images: Optional[Mapping[int, bytes]] = None) -> None:
+    """
+    Writes the FAISS index, BM25 index and chunks to their configured paths,
+    and the compact index directory as well when INDEX_DIR is set. For
+    quantized indexes the exact embeddings are written next to the FAISS
+    index, for re-scoring.
+
+    Args:
+        index: The raw FAISS index to write.
+        bm25: The BM25 index.
+        chunks: The chunk list, in the order the BM25 documents were indexed.
+        embeddings: The normalised chunk embeddings, in chunk-list order.
+        page_images: Page number -> PNG bytes for the index directory.
+    """
     print("Saving indexes and chunks to disk...")
     faiss.write_index(index, FAISS_INDEX_PATH)
+    if is_quantized(index):
+        np.save(exact_vectors_path(FAISS_INDEX_PATH), np.ascontiguousarray(embeddings, dtype=np.float32))
     with open(BM25_INDEX_PATH, "wb") as f:
         pickle.dump(bm25, f)
     with open(CHUNKS_PATH, "wb") as f:
-        pickle.dump(chunks_to_index, f)
+        pickle.dump(chunks, f)
+    if INDEX_DIR:
+        save_index_dir(INDEX_DIR, embeddings, bm25, chunks, page_images, faiss_index=index)
     print("✅ Saved indexes and chunks")
 
-    return index, bm25, chunks_to_index
+def index_version(faiss_index_path: Optional[str] = FAISS_INDEX_PATH, bm25_index_path: Optional[str] = BM25_INDEX_PATH, chunks_path: Optional[str] = CHUNKS_PATH, index_dir: Optional[str] = INDEX_DIR) -> str:
+    """
+    A short fingerprint of the index files `load_indexes` would read (paths,
+    sizes and modification times). It changes whenever the indexes are rebuilt,
+    so it can key caches of retrieval results.
+    """
+    if is_index_dir(index_dir):
+        paths = [os.path.join(index_dir, name) for name in os.listdir(index_dir)]
+    else:
+        paths = [path for path in (faiss_index_path, bm25_index_path, chunks_path) if path]
+    digest = hashlib.sha1()
+    for path in sorted(paths):
+        if os.path.isfile(path):
+            stat = os.stat(path)
+            digest.update(f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()[:16]
 
-def load_indexes() -> Tuple[Optional[faiss.IndexFlatIP], Optional[BM25Okapi], Optional[List[Dict[str, Any]]]]:
+def load_indexes(faiss_index_path: Optional[str] = FAISS_INDEX_PATH, bm25_index_path: Optional[str] = BM25_INDEX_PATH, chunks_path: Optional[str] = CHUNKS_PATH, index_dir: Optional[str] = INDEX_DIR) -> Tuple[Optional[faiss.Index], Optional[BM25Index], Optional[List[Dict[str, Any]]]]:
     """
-    Loads pre-built indexes from disk.
+    Loads pre-built indexes from disk. The memory-mapped index directory is
+    used when it exists; otherwise the legacy FAISS/pickle files are read.
+    Paths default to the configured manual.
 
     Returns:
         A tuple containing the FAISS index, BM25 index, and the list of chunks,
         or (None, None, None) if the files are not found.
     """
     try:
+        if is_index_dir(index_dir):
+            return load_index_dir(index_dir)
         print("Loading existing indexes from disk...")
-        index = faiss.read_index(FAISS_INDEX_PATH)
-        with open(BM25_INDEX_PATH, "rb") as f:
+        index = faiss.read_index(faiss_index_path)
+        with open(bm25_index_path, "rb") as f:
             bm25 = pickle.load(f)
-        with open(CHUNKS_PATH, "rb") as f:
+        if isinstance(bm25, BM25Okapi):
+            # Indexes built before the postings format: convert once at load time.
+            print(" Converting rank_bm25 model to postings index...")
+            bm25 = BM25Index.from_bm25okapi(bm25)
+        with open(chunks_path, "rb") as f:
             chunks = pickle.load(f)
+        if isinstance(index, faiss.IndexIDMap):
+            vectors_path = exact_vectors_path(faiss_index_path)
+            exact_vectors = np.load(vectors_path, mmap_mode="r") if is_quantized(index) and os.path.exists(vectors_path) else None
+            index = id_mapped_index(index, chunk_vector_ids(chunks), exact_vectors)
         print(" Loaded existing indexes")
         return index, bm25, chunks
     except FileNotFoundError:
@@ -69,4 +660,58 @@ def load_indexes() -> Tuple[Optional[faiss.IndexFlatIP], Optional[BM25Okapi], Op
         return None, None, None
     except Exception as e:
         print(f" Error loading indexes: {e}")
-        return None, None, None
\ No newline at end of file
+        return None, None, None
+
+def save_index_dir(path: str, embeddings: np.ndarray, bm25: BM25Index, chunks: List[Dict[str, Any]], page_images: Optional[Mapping[int, bytes]] = None, faiss_index: Optional[faiss.Index] = None) -> None:
+    """
+    Writes embeddings, BM25 postings, chunks and page images in the compact
+    index directory format. Approximate (non-flat) FAISS indexes are stored
+    alongside; exact search and re-scoring read the embedding matrix.
+    """
+    print(f"Writing index directory to {path}...")
+    terms, arrays, params = bm25.to_arrays()
+    ann_index = None
+    if faiss_index is not None and not isinstance(base_faiss_index(faiss_index), faiss.IndexFlat):
+        ann_index = faiss.serialize_index(faiss_index).tobytes()
+    write_index_dir(path, embeddings, terms, arrays, params, chunks, page_images, chunk_ids=chunk_vector_ids(chunks), ann_index=ann_index)
+
+def load_index_dir(path: str) -> Tuple[Any, BM25Index, List[Dict[str, Any]]]:
+    """
+    Opens a compact index directory. Nothing is copied into process memory:
+    the embeddings, postings and chunk text stay memory-mapped.
+    """
+    print(f"Loading index directory {path}...")
+    stored = read_index_dir(path)
+    if stored["ann_index_path"]:
+        # Read into memory (not memory-mapped) so that incremental re-indexing can update it.
+        index = id_mapped_index(faiss.read_index(stored["ann_index_path"]), np.asarray(stored["chunk_ids"]), stored["embeddings"])
+    else:
+        index = EmbeddingMatrixIndex(stored["embeddings"])
+    bm25 = BM25Index.from_arrays(stored["bm25_terms"], stored["bm25_arrays"], stored["bm25_params"])
+    print(f" Loaded index directory (format v{stored['manifest']['format_version']}, {index.ntotal} chunks)")
+    return index, bm25, stored["chunks"]
+
+def convert_legacy_indexes(out_dir: str, faiss_path: str = FAISS_INDEX_PATH, bm25_path: str = BM25_INDEX_PATH, chunks_path: str = CHUNKS_PATH) -> None:
+    """Converts the FAISS index and BM25/chunk pickles into an index directory."""
+    index = faiss.read_index(faiss_path)
+    with open(bm25_path, "rb") as f:
+        bm25 = pickle.load(f)
+    if isinstance(bm25, BM25Okapi):
+        bm25 = BM25Index.from_bm25okapi(bm25)
+    with open(chunks_path, "rb") as f:
+        chunks = pickle.load(f)
+    if isinstance(index, faiss.IndexIDMap):
+        embeddings = index.reconstruct_batch(chunk_vector_ids(chunks))
+    else:
+        embeddings = index.reconstruct_n(0, index.ntotal)
+    save_index_dir(out_dir, embeddings, bm25, chunks)
+    print(f"✅ Converted {len(chunks)} chunks to {out_dir}")
+
+
+if __name__ == "__main__":
+    # Usage: python -m src.indexer [OUT_DIR]  (defaults to INDEX_DIR)
+    out_dir = sys.argv[1] if len(sys.argv) > 1 else INDEX_DIR
+    if not out_dir:
+        print("Usage: python -m src.indexer OUT_DIR (or set INDEX_DIR in .env)")
+        sys.exit(1)
+    convert_legacy_indexes(out_dir)
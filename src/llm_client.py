@@ -0,0 +1,325 @@
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple, Union
+import numpy as np
+import requests
+import google.generativeai as genai
+from google.api_core import exceptions as api_exceptions
+from src.config import (
+    GEMINI_API_KEY, GEMINI_API_ENDPOINT, GEMINI_MODEL, GEMINI_FALLBACK_MODEL, GEMINI_TIMEOUT_S, GEMINI_RETRIES,
+    GEMINI_BACKOFF_S, GEMINI_HEDGE, GEMINI_HEDGE_QUANTILE, MAX_CONCURRENT_REQUESTS,
+)
+
+# Configure Gemini API
+if GEMINI_API_ENDPOINT:
+    # e.g. the local stub server (python -m src.stub_llm), which speaks the REST API
+    genai.configure(api_key=GEMINI_API_KEY, transport="rest", client_options={"api_endpoint": GEMINI_API_ENDPOINT})
+else:
+    genai.configure(api_key=GEMINI_API_KEY)
+
+Prompt = Union[str, List[Any]]
+
+# Rate limits, overload and transient server or connection failures. Other errors are not retried.
+RETRYABLE_ERRORS = (
+    api_exceptions.TooManyRequests, api_exceptions.ResourceExhausted, api_exceptions.ServiceUnavailable,
+    api_exceptions.InternalServerError, api_exceptions.BadGateway, api_exceptions.GatewayTimeout, requests.ConnectionError,
+)
+TIMEOUT_ERRORS = (TimeoutError, api_exceptions.DeadlineExceeded, requests.Timeout)
+
+MAX_BACKOFF_S = 8.0
+# Latencies of recent primary-model answers kept for the hedging delay.
+LATENCY_WINDOW = 256
+HEDGE_MIN_SAMPLES = 20
+# Part of the deadline kept for the fallback model.
+FALLBACK_SHARE = 0.25
+
+Attempt = Callable[[str, float], Any]
+
+
+class LLMClient:
+    """
+    The long-lived Gemini client behind `src.generator`.
+
+    Model handles (and with them the SDK's connections) are created once and
+    shared by all requests. Each answer has a deadline of `timeout_s`: every
+    attempt is sent with the time left as its timeout (the SDK's own retries
+    are off), and attempts that were rate-limited or failed transiently are
+    retried up to `retries` times with full-jitter exponential backoff while
+    time remains.
+
+    With `hedge`, a second request is sent when the first has not answered
+    within the `hedge_quantile` of recent latencies, and the first answer
+    wins. Text-only prompts fall back to `fallback_model` when the primary
+    model fails or times out; the primary model then gets
+    `1 - FALLBACK_SHARE` of the deadline. Streams are retried and fall back
+    only until their first chunk, and are not hedged.
+    """
+
+    def __init__(self, model_name: str = GEMINI_MODEL, fallback_model: str = GEMINI_FALLBACK_MODEL, timeout_s: float = GEMINI_TIMEOUT_S, retries: int = GEMINI_RETRIES, backoff_s: float = GEMINI_BACKOFF_S, hedge: bool = GEMINI_HEDGE, hedge_quantile: float = GEMINI_HEDGE_QUANTILE, rest: bool = bool(GEMINI_API_ENDPOINT), workers: int = MAX_CONCURRENT_REQUESTS):
+        self.model_name = model_name
+        self.fallback_model = fallback_model or None
+        self.timeout_s = timeout_s
+        self.retries = retries
+        self.backoff_s = backoff_s
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        # The SDK has no async client for the REST transport, so there the
+        # blocking calls run on threads, one per admitted request (two when hedging).
+        self.rest = rest
+        self.workers = workers * (2 if hedge else 1)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._models: Dict[str, genai.GenerativeModel] = {}
+        self._latencies: deque = deque(maxlen=LATENCY_WINDOW)
+        self._counts = {"calls": 0, "attempts": 0, "retries": 0, "hedges": 0, "hedge_wins": 0, "fallbacks": 0, "timeouts": 0, "failures": 0}
+        self._lock = threading.Lock()
+
+    def model(self, name: str) -> genai.GenerativeModel:
+        """The shared handle of model `name`."""
+        model = self._models.get(name)
+        if model is None:
+            with self._lock:
+                model = self._models.setdefault(name, genai.GenerativeModel(name))
+        return model
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="gemini")
+            return self._executor
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counts[name] += 1
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds after which a request to the primary model is hedged, or None (hedging off, or too few latencies seen)."""
+        if not self.hedge:
+            return None
+        with self._lock:
+            if len(self._latencies) < HEDGE_MIN_SAMPLES:
+                return None
+            return float(np.quantile(self._latencies, self.hedge_quantile))
+
+    def _deadlines(self, prompt: Prompt) -> Tuple[float, Optional[float]]:
+        """The deadlines of the primary model and of the fallback (None when the prompt cannot fall back)."""
+        now = time.monotonic()
+        if self.fallback_model and isinstance(prompt, str):
+            return now + self.timeout_s * (1 - FALLBACK_SHARE), now + self.timeout_s
+        return now + self.timeout_s, None
+
+    def _backoff(self, retry: int) -> float:
+        return random.uniform(0, min(MAX_BACKOFF_S, self.backoff_s * 2 ** retry))
+
+    def _attempt(self, model_name: str, prompt: Prompt, deadline: float, stream: bool = False) -> Any:
+        """One blocking request with the time left until `deadline` as its timeout."""
+        timeout = deadline - time.monotonic()
+        if timeout <= 0:
+            raise TimeoutError(f"{model_name} did not answer within {self.timeout_s:g}s")
+        self._count("attempts")
+        start = time.perf_counter()
+        # A stream's first chunk is read here, so failures before any output surface (and are retried) here.
+        response = self.model(model_name).generate_content(prompt, stream=stream, request_options={"timeout": timeout, "retry": None})
+        if model_name == self.model_name and not stream:
+            with self._lock:
+                self._latencies.append(time.perf_counter() - start)
+        return response
+
+    async def _attempt_async(self, model_name: str, prompt: Prompt, deadline: float, stream: bool = False) -> Any:
+        if self.rest:
+            return await asyncio.get_running_loop().run_in_executor(self._get_executor(), self._attempt, model_name, prompt, deadline, stream)
+        timeout = deadline - time.monotonic()
+        if timeout <= 0:
+            raise TimeoutError(f"{model_name} did not answer within {self.timeout_s:g}s")
+        self._count("attempts")
+        start = time.perf_counter()
+        response = await self.model(model_name).generate_content_async(prompt, stream=stream, request_options={"timeout": timeout, "retry": None})
+        if model_name == self.model_name and not stream:
+            with self._lock:
+                self._latencies.append(time.perf_counter() - start)
+        return response
+
+    def _hedged(self, model_name: str, prompt: Prompt, deadline: float) -> Any:
+        """`_attempt`, plus a second request when the first is slower than `hedge_delay`. The first answer wins."""
+        delay = self.hedge_delay() if model_name == self.model_name else None
+        if delay is None or time.monotonic() + delay >= deadline:
+            return self._attempt(model_name, prompt, deadline)
+        executor = self._get_executor()
+        first = executor.submit(self._attempt, model_name, prompt, deadline)
+        pending = {first}
+        if not wait(pending, timeout=delay).done:
+            self._count("hedges")
+            pending.add(executor.submit(self._attempt, model_name, prompt, deadline))
+        error: Optional[BaseException] = None
+        # The loser is left to finish (or time out) on its thread.
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                raise TimeoutError(f"{model_name} did not answer within {self.timeout_s:g}s")
+            for future in sorted(done, key=lambda future: future.exception() is not None):
+                if future.exception() is None:
+                    if future is not first:
+                        self._count("hedge_wins")
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    async def _hedged_async(self, model_name: str, prompt: Prompt, deadline: float) -> Any:
+        """Async variant of `_hedged`. The loser is cancelled."""
+        delay = self.hedge_delay() if model_name == self.model_name else None
+        first = asyncio.ensure_future(self._attempt_async(model_name, prompt, deadline))
+        pending = {first}
+        try:
+            if delay is not None and time.monotonic() + delay < deadline:
+                done, _ = await asyncio.wait(pending, timeout=delay)
+                if not done:
+                    self._count("hedges")
+                    pending.add(asyncio.ensure_future(self._attempt_async(model_name, prompt, deadline)))
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=max(0.0, deadline - time.monotonic()), return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    raise TimeoutError(f"{model_name} did not answer within {self.timeout_s:g}s")
+                # Successes first; checking every exception also marks it as retrieved.
+                for task in sorted(done, key=lambda task: task.exception() is not None):
+                    if task.exception() is None:
+                        if task is not first:
+                            self._count("hedge_wins")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def _retrying(self, attempt: Attempt, model_name: str, deadline: float) -> Any:
+        """Runs `attempt(model_name, deadline)`, retrying retryable errors with backoff while time remains."""
+        for retry in range(self.retries + 1):
+            try:
+                return attempt(model_name, deadline)
+            except RETRYABLE_ERRORS:
+                pause = self._backoff(retry)
+                if retry == self.retries or time.monotonic() + pause >= deadline:
+                    raise
+                self._count("retries")
+                time.sleep(pause)
+
+    async def _retrying_async(self, attempt: Callable[[str, float], Awaitable[Any]], model_name: str, deadline: float) -> Any:
+        for retry in range(self.retries + 1):
+            try:
+                return await attempt(model_name, deadline)
+            except RETRYABLE_ERRORS:
+                pause = self._backoff(retry)
+                if retry == self.retries or time.monotonic() + pause >= deadline:
+                    raise
+                self._count("retries")
+                await asyncio.sleep(pause)
+
+    def _run(self, prompt: Prompt, attempt: Attempt) -> Any:
+        """Runs `attempt` on the primary model and, for text-only prompts, on the fallback model if that fails."""
+        primary_deadline, fallback_deadline = self._deadlines(prompt)
+        self._count("calls")
+        try:
+            try:
+                return self._retrying(attempt, self.model_name, primary_deadline)
+            except RETRYABLE_ERRORS + TIMEOUT_ERRORS:
+                if fallback_deadline is None:
+                    raise
+            self._count("fallbacks")
+            return self._retrying(attempt, self.fallback_model, fallback_deadline)
+        except Exception as e:
+            self._count("timeouts" if isinstance(e, TIMEOUT_ERRORS) else "failures")
+            raise
+
+    async def _run_async(self, prompt: Prompt, attempt: Callable[[str, float], Awaitable[Any]]) -> Any:
+        primary_deadline, fallback_deadline = self._deadlines(prompt)
+        self._count("calls")
+        try:
+            try:
+                return await self._retrying_async(attempt, self.model_name, primary_deadline)
+            except RETRYABLE_ERRORS + TIMEOUT_ERRORS:
+                if fallback_deadline is None:
+                    raise
+            self._count("fallbacks")
+            return await self._retrying_async(attempt, self.fallback_model, fallback_deadline)
+        except Exception as e:
+            self._count("timeouts" if isinstance(e, TIMEOUT_ERRORS) else "failures")
+            raise
+
+    def generate(self, prompt: Prompt) -> Any:
+        """Gemini's response to `prompt`. Raises the last error when no attempt succeeded in time."""
+        return self._run(prompt, lambda model_name, deadline: self._hedged(model_name, prompt, deadline))
+
+    async def generate_async(self, prompt: Prompt) -> Any:
+        """Async variant of `generate`."""
+        return await self._run_async(prompt, lambda model_name, deadline: self._hedged_async(model_name, prompt, deadline))
+
+    def stream(self, prompt: Prompt) -> Iterator[Any]:
+        """The response chunks of `prompt` as Gemini produces them."""
+        return iter(self._run(prompt, lambda model_name, deadline: self._attempt(model_name, prompt, deadline, stream=True)))
+
+    async def stream_async(self, prompt: Prompt) -> AsyncIterator[Any]:
+        """Async variant of `stream`. Errors after the first chunk are raised to the caller."""
+        if not self.rest:
+            response = await self._run_async(prompt, lambda model_name, deadline: self._attempt_async(model_name, prompt, deadline, stream=True))
+            async for chunk in response:
+                yield chunk
+            return
+
+        # REST transport: iterate the blocking stream on a thread and hand chunks over through a queue.
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        done = object()
+
+        def produce() -> None:
+            try:
+                for chunk in self.stream(prompt):
+                    loop.call_soon_threadsafe(queue.put_nowait, chunk)
+                loop.call_soon_threadsafe(queue.put_nowait, done)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+
+        loop.run_in_executor(self._get_executor(), produce)
+        while True:
+            item = await queue.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            latencies = list(self._latencies)
+            stats = {"model": self.model_name, "fallback_model": self.fallback_model, "timeout_s": self.timeout_s, **self._counts}
+        if latencies:
+            p50, p95 = np.percentile(latencies, [50, 95])
+            stats.update(p50_ms=1000 * float(p50), p95_ms=1000 * float(p95))
+        delay = self.hedge_delay()
+        stats["hedge_delay_ms"] = None if delay is None else 1000 * delay
+        return stats
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+
+_default_client: Optional[LLMClient] = None
+_default_client_lock = threading.Lock()
+
+def get_llm_client() -> LLMClient:
+    """Returns the process-wide generation client, creating it on first use."""
+    global _default_client
+    if _default_client is None:
+        with _default_client_lock:
+            if _default_client is None:
+                _default_client = LLMClient()
+    return _default_client
+
+def set_llm_client(client: LLMClient) -> None:
+    """Registers an already-created client as the process-wide default."""
+    global _default_client
+    _default_client = client
@@ -0,0 +1,209 @@
+# src/loadtest.py
+"""
+A concurrent HTTP load driver for the RAG API (src/api.py).
+
+At each concurrency level, that many closed-loop clients send questions
+back to back, and throughput and p50/p95/p99 latency are reported. With
+--spawn the API and the stub Gemini server (src/stub_llm.py, answering after
+a fixed simulated latency) are started as subprocesses, so no Gemini key or
+network is needed:
+
+    python -m src.loadtest --spawn --llm-latency-ms 800 --concurrency 1 4 16 64
+    python -m src.loadtest --url http://127.0.0.1:8000 --save-baseline load_baseline.json
+    python -m src.loadtest --spawn --baseline load_baseline.json   # exits with 1 on regressions
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from collections import Counter
+from typing import List, Dict, Any, Optional
+import httpx
+from src.baseline import compare_to_baseline, latency_percentiles, print_baseline_comparison, save_baseline
+
+
+def spawn_servers(api_port: int = 8000, llm_port: int = 8001, llm_latency_ms: float = 800, llm_jitter_ms: float = 0, caches: bool = False, timeout_s: float = 180) -> List[subprocess.Popen]:
+    """
+    Starts the stub Gemini server and the API (pointed at it) and waits until
+    both answer. The API's answer, retrieval and embedding caches are off
+    unless `caches` is set, so repeated questions run the whole pipeline.
+
+    Returns:
+        The two processes; stop them with `stop_servers`.
+    """
+    env = {**os.environ, "GEMINI_API_ENDPOINT": f"http://127.0.0.1:{llm_port}"}
+    if not caches:
+        env.update(ANSWER_CACHE_SIZE="0", RETRIEVAL_CACHE_MB="0", EMBEDDING_CACHE_MB="0")
+    processes = [
+        subprocess.Popen([sys.executable, "-m", "src.stub_llm", "--port", str(llm_port), "--latency-ms", str(llm_latency_ms), "--jitter-ms", str(llm_jitter_ms)],
+                         stdout=subprocess.DEVNULL),  # access log; errors still reach stderr
+        subprocess.Popen([sys.executable, "-m", "uvicorn", "src.api:app", "--port", str(api_port), "--log-level", "warning"], env=env),
+    ]
+    deadline = time.monotonic() + timeout_s
+    for url in (f"http://127.0.0.1:{llm_port}/stats", f"http://127.0.0.1:{api_port}/"):
+        while True:
+            if any(process.poll() is not None for process in processes):
+                stop_servers(processes)
+                raise RuntimeError("A server exited during startup; see its output above.")
+            try:
+                if httpx.get(url, timeout=1).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            if time.monotonic() > deadline:
+                stop_servers(processes)
+                raise RuntimeError(f"{url} did not come up within {timeout_s:.0f}s")
+            time.sleep(0.5)
+    print(f"✅ API on port {api_port}, stub Gemini on port {llm_port} ({llm_latency_ms:g} ms per answer)")
+    return processes
+
+def stop_servers(processes: List[subprocess.Popen]) -> None:
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+async def _post(client: httpx.AsyncClient, url: str, question: str, stream: bool) -> Dict[str, Any]:
+    """Sends one question. Returns its status, latency and, for streams, the time to the first token."""
+    start = time.perf_counter()
+    first_token_ms = None
+    try:
+        if stream:
+            async with client.stream("POST", url, json={"question": question}) as response:
+                status = response.status_code
+                async for line in response.aiter_lines():
+                    if first_token_ms is None and line == "event: token":
+                        first_token_ms = (time.perf_counter() - start) * 1000
+                    elif line == "event: error":
+                        status = "error"
+        else:
+            response = await client.post(url, json={"question": question})
+            status = response.status_code
+    except httpx.HTTPError:
+        status = "error"
+    return {"status": status, "ms": (time.perf_counter() - start) * 1000, "first_token_ms": first_token_ms}
+
+async def run_level(url: str, questions: List[str], concurrency: int, num_requests: int, endpoint: str = "/ask", timeout_s: float = 120) -> Dict[str, Any]:
+    """
+    Sends `num_requests` questions (cycling through `questions`) from
+    `concurrency` clients, each sending its next question as soon as the
+    previous one is answered.
+
+    Returns:
+        Counts of ok / rejected (429) / failed requests, throughput of
+        successful requests and their latency percentiles (plus time to
+        the first token for /ask/stream).
+    """
+    stream = endpoint.endswith("/stream")
+    positions = iter(range(num_requests))
+    outcomes: List[Dict[str, Any]] = []
+
+    async def client_loop(client: httpx.AsyncClient) -> None:
+        # The iterator is shared by the clients of the event loop, so each question is sent once.
+        for position in positions:
+            outcomes.append(await _post(client, url + endpoint, questions[position % len(questions)], stream))
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=timeout_s) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(client_loop(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    statuses = Counter(outcome["status"] for outcome in outcomes)
+    ok = [outcome for outcome in outcomes if outcome["status"] == 200]
+    report = {
+        "concurrency": concurrency, "requests": len(outcomes), "ok": len(ok), "rejected": statuses[429],
+        "errors": len(outcomes) - len(ok) - statuses[429], "seconds": elapsed, "throughput_rps": len(ok) / elapsed,
+        **latency_percentiles([outcome["ms"] for outcome in ok]),
+    }
+    if stream:
+        report["first_token"] = latency_percentiles([outcome["first_token_ms"] for outcome in ok if outcome["first_token_ms"] is not None])
+    return report
+
+def load_test(url: str, questions: List[str], levels: List[int], requests_per_client: int = 10, min_requests: int = 20, endpoint: str = "/ask", warmup: int = 5) -> List[Dict[str, Any]]:
+    """
+    Runs `run_level` at each concurrency in `levels`, with `requests_per_client`
+    requests per client (at least `min_requests`), after `warmup` requests
+    that are not measured.
+    """
+    if warmup:
+        asyncio.run(run_level(url, questions, 1, warmup, endpoint))
+    reports = []
+    for concurrency in levels:
+        num_requests = max(min_requests, concurrency * requests_per_client)
+        report = asyncio.run(run_level(url, questions, concurrency, num_requests, endpoint))
+        print_level(report)
+        reports.append(report)
+    return reports
+
+def print_level(report: Dict[str, Any]) -> None:
+    line = (f"c={report['concurrency']:<4} | {report['requests']:>5} requests ({report['ok']} ok, {report['rejected']} rejected, {report['errors']} failed) | "
+            f"{report['throughput_rps']:7.1f} req/s | p50 {report['p50_ms']:8.1f} ms | p95 {report['p95_ms']:8.1f} ms | p99 {report['p99_ms']:8.1f} ms")
+    if "first_token" in report:
+        line += f" | first token p50 {report['first_token']['p50_ms']:.1f} ms"
+    print(line)
+
+def baseline_metrics(reports: List[Dict[str, Any]], endpoint: str) -> Dict[str, float]:
+    """Flat metrics of a load test for `baseline.save_baseline` / `compare_to_baseline`."""
+    metrics = {}
+    for report in reports:
+        prefix = f"load{endpoint}/c{report['concurrency']}"
+        metrics[f"{prefix}/throughput_rps"] = report["throughput_rps"]
+        for name in ("p50_ms", "p95_ms", "p99_ms"):
+            metrics[f"{prefix}/{name}"] = report[name]
+    return metrics
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test the RAG API")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="API base URL (ignored with --spawn)")
+    parser.add_argument("--spawn", action="store_true", help="start the API and a stub Gemini server for the test")
+    parser.add_argument("--port", type=int, default=8000, help="API port with --spawn")
+    parser.add_argument("--llm-port", type=int, default=8001, help="stub Gemini port with --spawn")
+    parser.add_argument("--llm-latency-ms", type=float, default=800, help="stub Gemini answer latency")
+    parser.add_argument("--llm-jitter-ms", type=float, default=0, help="uniform jitter of the stub latency (0 = deterministic)")
+    parser.add_argument("--caches", action="store_true", help="keep the API caches on with --spawn")
+    parser.add_argument("--endpoint", choices=["/ask", "/ask/stream"], default="/ask")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64], help="concurrency levels, run in order")
+    parser.add_argument("--requests-per-client", type=int, default=10, help="requests per client at each level")
+    parser.add_argument("--questions", help="file with one question per line (defaults to the evaluation questions)")
+    parser.add_argument("--save-baseline", metavar="PATH", help="write throughput and latency percentiles to PATH (JSON)")
+    parser.add_argument("--baseline", metavar="PATH", help="compare with a saved baseline; exits with 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="relative change counted as a regression")
+    args = parser.parse_args()
+
+    if args.questions:
+        with open(args.questions, encoding="utf-8") as f:
+            questions = [line.strip() for line in f if line.strip()]
+    else:
+        # Imported here: src.evaluation loads the retrieval stack (torch, faiss).
+        from src.evaluation import test_questions
+        questions = [question for question, _ in test_questions]
+
+    processes: Optional[List[subprocess.Popen]] = None
+    url = args.url.rstrip("/")
+    if args.spawn:
+        processes = spawn_servers(args.port, args.llm_port, args.llm_latency_ms, args.llm_jitter_ms, caches=args.caches)
+        url = f"http://127.0.0.1:{args.port}"
+    try:
+        print("="*80)
+        print(f"LOAD TEST: {url}{args.endpoint} ({len(questions)} questions)")
+        print("="*80)
+        reports = load_test(url, questions, args.concurrency, args.requests_per_client, endpoint=args.endpoint)
+    finally:
+        if processes is not None:
+            stop_servers(processes)
+
+    metrics = baseline_metrics(reports, args.endpoint)
+    if args.save_baseline:
+        save_baseline(metrics, args.save_baseline)
+        print(f"\n✅ Baseline of {len(metrics)} metrics written to {args.save_baseline}")
+    if args.baseline:
+        if print_baseline_comparison(compare_to_baseline(metrics, args.baseline, args.tolerance), args.baseline):
+            sys.exit(1)
@@ -0,0 +1,155 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import nullcontext
+from typing import Callable, Dict, Any, List, Optional, Sequence, Tuple
+from src.config import METRICS_ENABLED
+
+# Stages timed along the query pipeline (see `span`).
+STAGES = ("table_lookup", "embed", "faiss_search", "bm25", "fusion", "rerank", "context", "image_decode", "generate")
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+IMAGE_BUCKETS = (0, 1, 2, 3, 5, 10)
+
+
+class Histogram:
+    """
+    A thread-safe Prometheus histogram, optionally with one label
+    (e.g. `stage`). Rendered in the Prometheus text exposition format.
+    """
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float], label: Optional[str] = None):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.label = label
+        # label value -> (bucket counts, sum, count)
+        self._series: Dict[Optional[str], Tuple[List[int], float, int]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, label_value: Optional[str] = None) -> None:
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total, count = self._series.get(label_value) or ([0] * (len(self.buckets) + 1), 0.0, 0)
+            counts[position] += 1
+            self._series[label_value] = (counts, total + value, count + 1)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted(self._series.items(), key=lambda item: item[0] or "")
+            for label_value, (counts, total, count) in series:
+                labels = f'{self.label}="{label_value}"' if self.label else ""
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    le = "+Inf" if bound == float("inf") else repr(float(bound))
+                    lines.append(f'{self.name}_bucket{{{labels + "," if labels else ""}le="{le}"}} {cumulative}')
+                suffix = f"{{{labels}}}" if labels else ""
+                lines.append(f"{self.name}_sum{suffix} {total}")
+                lines.append(f"{self.name}_count{suffix} {count}")
+        return lines
+
+
+STAGE_SECONDS = Histogram("rag_stage_seconds", "Time spent in each stage of the query pipeline.", LATENCY_BUCKETS, label="stage")
+REQUEST_SECONDS = Histogram("rag_request_seconds", "End-to-end request latency.", LATENCY_BUCKETS, label="endpoint")
+COUNTS = {
+    "prompt_tokens": Histogram("rag_prompt_tokens", "Prompt tokens per Gemini call.", TOKEN_BUCKETS),
+    "output_tokens": Histogram("rag_output_tokens", "Answer tokens per Gemini call.", TOKEN_BUCKETS),
+    "images": Histogram("rag_prompt_images", "Page images per prompt.", IMAGE_BUCKETS),
+    "context_tokens": Histogram("rag_context_tokens", "Estimated tokens of the assembled context.", TOKEN_BUCKETS),
+}
+HISTOGRAMS = [REQUEST_SECONDS, STAGE_SECONDS, *COUNTS.values()]
+
+
+class Timing:
+    """The per-request breakdown: milliseconds per stage (summed when a stage runs several times) and counts."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages_ms: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, ms: float) -> None:
+        with self._lock:
+            self.stages_ms[stage] = self.stages_ms.get(stage, 0.0) + ms
+
+    def count(self, kind: str, value: int) -> None:
+        with self._lock:
+            self.counts[kind] = self.counts.get(kind, 0) + value
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"total_ms": (time.perf_counter() - self.started) * 1000, "stages_ms": dict(self.stages_ms), "counts": dict(self.counts)}
+
+
+_timing: contextvars.ContextVar[Optional[Timing]] = contextvars.ContextVar("rag_timing", default=None)
+
+def start_timing() -> Timing:
+    """Starts collecting the timing breakdown of the current request (its context and the threads it hands work to)."""
+    timing = Timing()
+    _timing.set(timing)
+    return timing
+
+def get_timing() -> Optional[Timing]:
+    return _timing.get()
+
+def in_context(fn: Callable) -> Callable:
+    """
+    Wraps `fn` to run in a copy of the caller's context, so spans on executor
+    threads still reach the request's `Timing`.
+    """
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.copy().run(fn, *args, **kwargs)
+
+
+class _Span:
+    __slots__ = ("stage", "timing", "start")
+
+    def __init__(self, stage: str, timing: Optional[Timing]):
+        self.stage = stage
+        self.timing = timing
+
+    def __enter__(self) -> "_Span":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        elapsed = time.perf_counter() - self.start
+        if METRICS_ENABLED:
+            STAGE_SECONDS.observe(elapsed, self.stage)
+        if self.timing is not None:
+            self.timing.add(self.stage, elapsed * 1000)
+
+
+_NOOP = nullcontext()
+
+def span(stage: str):
+    """
+    Times a pipeline stage into the `rag_stage_seconds` histogram and the
+    current request's `Timing`. A shared no-op context when metrics are
+    disabled and no breakdown was requested.
+    """
+    timing = _timing.get()
+    if not METRICS_ENABLED and timing is None:
+        return _NOOP
+    return _Span(stage, timing)
+
+def record_count(kind: str, value: int) -> None:
+    """Records a count (prompt_tokens, output_tokens, images or context_tokens) of the current request."""
+    if METRICS_ENABLED:
+        COUNTS[kind].observe(value)
+    timing = _timing.get()
+    if timing is not None:
+        timing.count(kind, value)
+
+def observe_request(endpoint: str, seconds: float) -> None:
+    if METRICS_ENABLED:
+        REQUEST_SECONDS.observe(seconds, endpoint)
+
+def render_metrics() -> str:
+    """All histograms in the Prometheus text exposition format."""
+    return "\n".join(line for histogram in HISTOGRAMS for line in histogram.render()) + "\n"
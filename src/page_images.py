@@ -0,0 +1,159 @@
+import io
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Mapping, Tuple
+import fitz
+from PIL import Image
+from src.config import PDF_PATH, PAGE_IMAGE_CACHE_MB, PAGE_IMAGE_DPI
+
+def render_page_png(doc: fitz.Document, page_number: int, dpi: int = PAGE_IMAGE_DPI) -> bytes:
+    """Renders one (1-based) page of an open PDF to PNG bytes."""
+    return doc[page_number - 1].get_pixmap(dpi=dpi).tobytes("png")
+
+def render_page_images(pdf_path: str, page_numbers: List[int], dpi: int = PAGE_IMAGE_DPI) -> Dict[int, bytes]:
+    """Renders the given (1-based) pages of a PDF to PNG bytes, keyed by page number."""
+    with fitz.open(pdf_path) as doc:
+        return {page_number: render_page_png(doc, page_number, dpi) for page_number in page_numbers}
+
+
+def trim_margins(image: Image.Image, threshold: int = 245, padding: int = 8) -> Image.Image:
+    """Crops the blank margins around the printed area of a page."""
+    box = image.convert("L").point(lambda value: 255 if value < threshold else 0).getbbox()
+    if box is None:
+        return image
+    left, top, right, bottom = box
+    return image.crop((max(0, left - padding), max(0, top - padding), min(image.width, right + padding), min(image.height, bottom + padding)))
+
+
+class PageImageStore:
+    """
+    Page images keyed by page number, loaded only when a request needs them.
+
+    PNG bytes come from `source` (the memory-mapped page-image blob of an index
+    directory, or a plain dict) or are rendered from the source PDF. Decoded
+    and optionally downscaled images are kept in an LRU cache bounded by their
+    decoded size in bytes.
+    """
+
+    def __init__(self, source: Optional[Mapping[int, bytes]] = None, pdf_path: Optional[str] = PDF_PATH, dpi: int = PAGE_IMAGE_DPI, max_cache_bytes: int = PAGE_IMAGE_CACHE_MB * 1024 * 1024):
+        """
+        Args:
+            source: Page number -> PNG bytes. Anything with `get` and `in` works.
+            pdf_path: The source PDF, used for pages missing from `source` or for other DPIs.
+            dpi: The resolution of the images in `source`.
+            max_cache_bytes: Budget for decoded images kept in memory.
+        """
+        self.source = source if source is not None else {}
+        self.pdf_path = pdf_path
+        self.dpi = dpi
+        self.max_cache_bytes = max_cache_bytes
+        self._cache: "OrderedDict[Tuple[int, Optional[int], int, bool], Image.Image]" = OrderedDict()
+        self._cache_bytes = 0
+        self._lock = threading.Lock()
+        self._render_lock = threading.Lock()
+        self._doc: Optional[fitz.Document] = None
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def for_chunks(cls, chunks: List[Dict[str, Any]], pdf_path: Optional[str] = PDF_PATH) -> "PageImageStore":
+        """
+        Creates the store for a loaded corpus. Index directories provide their
+        page-image blob; legacy chunk pickles have their PNG bytes moved out of
+        the chunks so that only a page reference is left behind.
+        """
+        page_images = getattr(chunks, "page_images", None)
+        if page_images is not None:
+            return cls(page_images, pdf_path=pdf_path)
+
+        source = {}
+        for chunk in chunks:
+            if "page_image" not in chunk:
+                continue
+            page_image = chunk.pop("page_image")
+            if page_image is not None:
+                source.setdefault(chunk["page_number"], page_image)
+            chunk["has_image"] = page_image is not None
+        return cls(source, pdf_path=pdf_path)
+
+    def has_image(self, page_number: int) -> bool:
+        """True if the page has a stored image (rendering from the PDF is always possible)."""
+        return page_number in self.source
+
+    def get_png(self, page_number: int, dpi: Optional[int] = None) -> Optional[bytes]:
+        """Returns the PNG bytes of a page, rendering it from the PDF if needed."""
+        dpi = dpi or self.dpi
+        if dpi == self.dpi and page_number in self.source:
+            return bytes(self.source.get(page_number))
+        if not self.pdf_path:
+            return None
+        with self._render_lock:
+            if self._doc is None:
+                self._doc = fitz.open(self.pdf_path)
+            return render_page_png(self._doc, page_number, dpi)
+
+    def get(self, page_number: int, max_side: Optional[int] = None, dpi: Optional[int] = None, crop: bool = False) -> Optional[Image.Image]:
+        """
+        Returns the decoded page image, or None if it is not available.
+        Each (size, crop) variant is cached separately.
+
+        Args:
+            page_number: The 1-based page number.
+            max_side: If set, the image is downscaled so its longest side fits.
+            dpi: Render resolution; defaults to the resolution of the stored images.
+            crop: If True, blank margins are cropped before downscaling.
+        """
+        key = (page_number, max_side, dpi or self.dpi, crop)
+        with self._lock:
+            image = self._cache.get(key)
+            if image is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return image
+            self.misses += 1
+
+        png = self.get_png(page_number, dpi)
+        if png is None:
+            return None
+        image = Image.open(io.BytesIO(png))
+        image.load()
+        if crop:
+            image = trim_margins(image)
+        if max_side and max(image.size) > max_side:
+            image.thumbnail((max_side, max_side))
+
+        self._add_to_cache(key, image)
+        return image
+
+    def _add_to_cache(self, key: Tuple[int, Optional[int], int, bool], image: Image.Image) -> None:
+        size = image.width * image.height * len(image.getbands())
+        if size > self.max_cache_bytes:
+            return
+        with self._lock:
+            if key in self._cache:
+                return
+            self._cache[key] = image
+            self._cache_bytes += size
+            while self._cache_bytes > self.max_cache_bytes:
+                _, evicted = self._cache.popitem(last=False)
+                self._cache_bytes -= evicted.width * evicted.height * len(evicted.getbands())
+
+    def stats(self) -> Dict[str, int]:
+        """Cache counters for monitoring."""
+        with self._lock:
+            return {"cached_images": len(self._cache), "cached_bytes": self._cache_bytes, "hits": self.hits, "misses": self.misses}
+
+
+_default_store: Optional[PageImageStore] = None
+
+def get_page_image_store() -> PageImageStore:
+    """Returns the process-wide page image store (rendering from PDF_PATH by default)."""
+    global _default_store
+    if _default_store is None:
+        _default_store = PageImageStore()
+    return _default_store
+
+def set_page_image_store(store: PageImageStore) -> None:
+    """Registers the store used by generate_answer when none is passed explicitly."""
+    global _default_store
+    _default_store = store
@@ -0,0 +1,579 @@
+import json
+import math
+import os
+import sys
+import threading
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Callable, Iterable, Optional, Tuple
+from src.config import (FAISS_INDEX_PATH, BM25_INDEX_PATH, CHUNKS_PATH, INDEX_DIR, PDF_PATH, MANUALS_CONFIG, DEFAULT_MANUAL, MANUALS_MEMORY_MB,
+                        MANUAL_SEARCH_WORKERS, TABLE_LOOKUP, INFER_METADATA_FILTERS, INDEX_WATCH_INTERVAL_S)
+from src.embedding import Embedder, get_embedding_service
+from src.index_store import EmbeddingMatrixIndex, is_index_dir
+from src.indexer import (BM25Index, IdMappedIndex, MetadataFilters, MetadataIndex, PageIndex, RescoringIndex, build_page_index, index_version,
+                         load_indexes, search_parameters)
+from src.metrics import in_context, span
+from src.page_images import PageImageStore
+from src.generator import Prompt, build_prompt, generate_answer
+from src.retriever import answer_response, build_context, hybrid_search, infer_filters, select_results
+from src.tables import TableAnswer, TableIndex
+
+
+@dataclass
+class ManualSpec:
+    """Where the indexes of one manual live on disk."""
+    name: str
+    faiss_index_path: Optional[str] = None
+    bm25_index_path: Optional[str] = None
+    chunks_path: Optional[str] = None
+    index_dir: Optional[str] = None
+    pdf_path: Optional[str] = None
+
+    def faiss_index_file(self) -> Optional[str]:
+        """The FAISS index file read into memory at load time, if any."""
+        path = os.path.join(self.index_dir, "faiss.index") if is_index_dir(self.index_dir) else self.faiss_index_path
+        return path if path and os.path.isfile(path) else None
+
+    def version(self) -> str:
+        """Changes whenever one of the index files is rewritten."""
+        return index_version(self.faiss_index_path, self.bm25_index_path, self.chunks_path, self.index_dir)
+
+
+@dataclass
+class Manual:
+    """A loaded manual: its indexes, chunks and page images."""
+    name: str
+    index: Any
+    bm25: BM25Index
+    chunks: List[Dict[str, Any]]
+    page_index: PageIndex
+    metadata: MetadataIndex
+    tables: TableIndex
+    image_store: PageImageStore
+    size_bytes: int
+    version: str
+    # Snapshots currently pinning this manual (guarded by the registry lock).
+    refs: int = field(default=0, compare=False, repr=False)
+
+
+def _nbytes(*arrays: Optional[np.ndarray]) -> int:
+    return sum(array.nbytes for array in arrays if array is not None)
+
+def manual_memory_bytes(spec: ManualSpec, index: Any, bm25: BM25Index, chunks: List[Dict[str, Any]], page_index: PageIndex, metadata: MetadataIndex, image_store: PageImageStore) -> int:
+    """
+    Estimates the memory of a loaded manual, charged against MANUALS_MEMORY_MB.
+
+    Memory-mapped arrays are counted in full, since searches page all of them
+    in: the embedding matrix (or the exact vectors of a quantized index), the
+    BM25 postings and the chunk text. A FAISS index read into memory counts
+    as the size of its file, which is its serialized size. Stored page images
+    count too, plus the bound of the decoded-image cache (PAGE_IMAGE_CACHE_MB).
+    """
+    total = 0
+    if isinstance(index, EmbeddingMatrixIndex):
+        total += index.embeddings.nbytes
+    else:
+        faiss_file = spec.faiss_index_file()
+        total += os.path.getsize(faiss_file) if faiss_file else 0
+        if isinstance(index, IdMappedIndex):
+            # The chunk ids plus their sorted copy and sort order.
+            total += 3 * index.chunk_ids.nbytes
+        if isinstance(index, RescoringIndex):
+            total += index.exact_vectors.nbytes
+
+    total += _nbytes(bm25.postings_offsets, bm25.postings_docs, bm25.postings_tfs, bm25.postings_impacts, bm25.term_max_impacts, bm25.doc_len, bm25.idf)
+    total += sys.getsizeof(bm25.vocab) + sum(sys.getsizeof(term) for term in bm25.vocab)
+
+    texts = getattr(chunks, "texts", None)
+    if texts is not None:
+        total += os.path.getsize(texts.path) + _nbytes(chunks.text_offsets, chunks.page_numbers)
+    else:
+        total += sum(sys.getsizeof(chunk) + sys.getsizeof(chunk["content"]) for chunk in chunks)
+    total += _nbytes(page_index.page_numbers, page_index.chunk_page, page_index.page_chunks, page_index.page_offsets)
+    total += sum(bitmap.nbytes for by_value in metadata.bitmaps.values() for bitmap in by_value.values())
+
+    blob = getattr(image_store.source, "blob", None)
+    if blob is not None:
+        total += os.path.getsize(blob.path)
+    else:
+        total += sum(len(png) for png in image_store.source.values())
+    return total + image_store.max_cache_bytes
+
+def load_manual_specs(path: Optional[str] = MANUALS_CONFIG) -> Dict[str, ManualSpec]:
+    """
+    Reads the manuals config, a JSON object mapping each manual name to its
+    paths, e.g. {"b737-ng": {"index_dir": "./data/b737_ng_index", "pdf_path": "..."}}.
+    Without a config file, the manual from the environment is registered as
+    DEFAULT_MANUAL.
+    """
+    if not path:
+        return {DEFAULT_MANUAL: ManualSpec(DEFAULT_MANUAL, FAISS_INDEX_PATH, BM25_INDEX_PATH, CHUNKS_PATH, INDEX_DIR, PDF_PATH)}
+    with open(path, encoding="utf-8") as f:
+        config = json.load(f)
+    return {name: ManualSpec(name=name, **paths) for name, paths in config.items()}
+
+
+class IndexRegistry:
+    """
+    Named manuals, loaded on first use and unloaded least-recently-used first
+    once the loaded manuals exceed the memory budget.
+
+    Unloading only drops the registry's reference: requests already holding a
+    Manual finish with it, and its memory is released afterwards. Requests
+    pin the manuals they use with a `snapshot`, which lets `reload` swap in a
+    new index version while they finish on the old one.
+    """
+
+    def __init__(self, specs: Dict[str, ManualSpec], max_memory_bytes: int = MANUALS_MEMORY_MB * 1024 * 1024, search_workers: int = MANUAL_SEARCH_WORKERS):
+        self.specs = dict(specs)
+        self.default_name = DEFAULT_MANUAL if DEFAULT_MANUAL in self.specs else next(iter(self.specs))
+        self.max_memory_bytes = max_memory_bytes
+        self._loaded: "OrderedDict[str, Manual]" = OrderedDict()
+        self._loaded_bytes = 0
+        self._lock = threading.Lock()
+        self._load_locks = {name: threading.Lock() for name in self.specs}
+        self.executor = ThreadPoolExecutor(max_workers=search_workers, thread_name_prefix="manual-search")
+        # Swapped-out or unloaded manuals still pinned by a snapshot.
+        self._retired: List[Manual] = []
+        # Called as listener(name, old manual or None, new manual) after every swap.
+        self.swap_listeners: List[Callable[[str, Optional[Manual], Manual], None]] = []
+        self.loads = 0
+        self.evictions = 0
+        self.swaps = 0
+        self.failed_swaps = 0
+
+    @classmethod
+    def from_config(cls, path: Optional[str] = MANUALS_CONFIG) -> "IndexRegistry":
+        return cls(load_manual_specs(path))
+
+    def names(self) -> List[str]:
+        return list(self.specs)
+
+    def resolve(self, names: Optional[List[str]] = None) -> List[str]:
+        """The requested manual names without duplicates, or the default manual."""
+        return list(dict.fromkeys(names or [self.default_name]))
+
+    def versions(self, names: List[str]) -> Dict[str, str]:
+        """The index version of each named manual (loading it if needed)."""
+        return {name: self.get(name).version for name in names}
+
+    def get(self, name: str) -> Manual:
+        """
+        Returns a loaded manual, loading it (and unloading others) if needed.
+
+        Raises:
+            KeyError: If no manual is registered under `name`.
+            RuntimeError: If the manual's indexes cannot be loaded.
+        """
+        return self._get(name, pin=False)
+
+    def acquire(self, name: str) -> Manual:
+        """Like `get`, but pins the manual until `release`, across swaps and unloads."""
+        return self._get(name, pin=True)
+
+    def release(self, manual: Manual) -> None:
+        """Unpins a manual. A swapped-out manual is dropped with its last pin."""
+        with self._lock:
+            manual.refs -= 1
+            if manual.refs == 0 and any(retired is manual for retired in self._retired):
+                self._retired = [retired for retired in self._retired if retired is not manual]
+                print(f" Released manual '{manual.name}' (version {manual.version})")
+
+    def snapshot(self) -> "Snapshot":
+        """A pinned view of the registry for one request (see `Snapshot`)."""
+        return Snapshot(self)
+
+    def _get(self, name: str, pin: bool) -> Manual:
+        if name not in self.specs:
+            raise KeyError(f"Unknown manual '{name}'. Available: {', '.join(self.specs)}")
+        with self._lock:
+            manual = self._loaded.get(name)
+            if manual is not None:
+                self._loaded.move_to_end(name)
+                manual.refs += pin
+                return manual
+
+        # Loads of different manuals run in parallel; concurrent requests for one manual load it once.
+        with self._load_locks[name]:
+            with self._lock:
+                manual = self._loaded.get(name)
+                if manual is not None:
+                    self._loaded.move_to_end(name)
+                    manual.refs += pin
+                    return manual
+            manual = self._load(self.specs[name])
+            with self._lock:
+                self._loaded[name] = manual
+                self._loaded_bytes += manual.size_bytes
+                self.loads += 1
+                manual.refs += pin
+                self._evict(keep=name)
+            return manual
+
+    def reload(self, name: str) -> Optional[Manual]:
+        """
+        Hot-swaps a loaded manual to the current version of its index files.
+
+        The new version is loaded in the calling thread and validated
+        (`validate_manual`) while requests are still served from the old one.
+        It then replaces the old version atomically: new requests get the new
+        version, snapshots taken earlier finish on the old one, which is
+        dropped when the last of them closes. Swap listeners are called last.
+
+        Returns:
+            The new Manual, or None if the files did not change or the manual
+            is not loaded (it is then loaded from the current files on first use).
+
+        Raises:
+            KeyError: If no manual is registered under `name`.
+            RuntimeError: If the new version cannot be loaded or fails
+                validation. The old version stays in service.
+        """
+        if name not in self.specs:
+            raise KeyError(f"Unknown manual '{name}'. Available: {', '.join(self.specs)}")
+        spec = self.specs[name]
+        with self._load_locks[name]:
+            with self._lock:
+                current = self._loaded.get(name)
+            if current is None or current.version == spec.version():
+                return None
+            try:
+                manual = self._load(spec)
+                validate_manual(manual, current)
+            except Exception:
+                with self._lock:
+                    self.failed_swaps += 1
+                raise
+            with self._lock:
+                old = self._loaded.pop(name, None)
+                if old is not None:
+                    self._loaded_bytes -= old.size_bytes
+                    self._retire(old)
+                self._loaded[name] = manual
+                self._loaded_bytes += manual.size_bytes
+                self.swaps += 1
+                self._evict(keep=name)
+        print(f"✅ Swapped manual '{name}' to version {manual.version}")
+        for listener in self.swap_listeners:
+            listener(name, old, manual)
+        return manual
+
+    def _load(self, spec: ManualSpec) -> Manual:
+        print(f"Loading manual '{spec.name}'...")
+        version = spec.version()
+        index, bm25, chunks = load_indexes(spec.faiss_index_path, spec.bm25_index_path, spec.chunks_path, spec.index_dir)
+        if index is None or bm25 is None or chunks is None:
+            raise RuntimeError(f"Could not load the indexes of manual '{spec.name}'")
+        image_store = PageImageStore.for_chunks(chunks, pdf_path=spec.pdf_path)
+        page_index, metadata = build_page_index(chunks), MetadataIndex.from_chunks(chunks)
+        size_bytes = manual_memory_bytes(spec, index, bm25, chunks, page_index, metadata, image_store)
+        return Manual(spec.name, index, bm25, chunks, page_index, metadata, TableIndex.from_chunks(chunks), image_store, size_bytes, version)
+
+    def _evict(self, keep: str) -> None:
+        """Unloads least recently used manuals until the budget is met. Called with the lock held."""
+        while self._loaded_bytes > self.max_memory_bytes and len(self._loaded) > 1:
+            name = next(iter(self._loaded))
+            if name == keep:
+                self._loaded.move_to_end(name)
+                continue
+            evicted = self._loaded.pop(name)
+            self._loaded_bytes -= evicted.size_bytes
+            self._retire(evicted)
+            self.evictions += 1
+            print(f" Unloaded manual '{name}' ({evicted.size_bytes / 1e6:.1f} MB)")
+
+    def _retire(self, manual: Manual) -> None:
+        """Keeps track of a manual leaving the registry while snapshots still pin it. Called with the lock held."""
+        if manual.refs > 0:
+            self._retired.append(manual)
+
+    def loaded(self) -> List[Manual]:
+        """The currently loaded manuals, least recently used first (does not count as a use)."""
+        with self._lock:
+            return list(self._loaded.values())
+
+    def unload(self, name: str) -> None:
+        with self._lock:
+            manual = self._loaded.pop(name, None)
+            if manual is not None:
+                self._loaded_bytes -= manual.size_bytes
+                self._retire(manual)
+
+    def stats(self) -> Dict[str, Any]:
+        """Registry counters for monitoring."""
+        with self._lock:
+            return {
+                "registered": list(self.specs), "loaded": list(self._loaded), "loaded_bytes": self._loaded_bytes,
+                "max_memory_bytes": self.max_memory_bytes, "loads": self.loads, "evictions": self.evictions,
+                "versions": {name: manual.version for name, manual in self._loaded.items()},
+                "swaps": self.swaps, "failed_swaps": self.failed_swaps,
+                "retired": [{"name": manual.name, "version": manual.version, "refs": manual.refs} for manual in self._retired],
+                "retired_bytes": sum(manual.size_bytes for manual in self._retired),
+            }
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False)
+
+
+class Snapshot:
+    """
+    One request's view of an IndexRegistry. Each manual is pinned on first
+    access, so the request uses one version of it throughout, even if it is
+    hot-swapped meanwhile, and that version stays alive until `close`.
+    Can be passed wherever the registry is read from (`retrieve_query`,
+    `lookup_tables`, `batch.batch_query`).
+    """
+
+    def __init__(self, registry: IndexRegistry):
+        self.registry = registry
+        self.specs = registry.specs
+        self.default_name = registry.default_name
+        self.executor = registry.executor
+        self._manuals: Dict[str, Manual] = {}
+        self._lock = threading.Lock()
+
+    def names(self) -> List[str]:
+        return self.registry.names()
+
+    def resolve(self, names: Optional[List[str]] = None) -> List[str]:
+        return self.registry.resolve(names)
+
+    def get(self, name: str) -> Manual:
+        with self._lock:
+            manual = self._manuals.get(name)
+            if manual is None:
+                manual = self._manuals[name] = self.registry.acquire(name)
+            return manual
+
+    def versions(self, names: List[str]) -> Dict[str, str]:
+        return {name: self.get(name).version for name in names}
+
+    def close(self) -> None:
+        with self._lock:
+            manuals, self._manuals = list(self._manuals.values()), {}
+        for manual in manuals:
+            self.registry.release(manual)
+
+    def __enter__(self) -> "Snapshot":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def validate_manual(manual: Manual, current: Optional[Manual] = None) -> None:
+    """
+    Checks a freshly loaded manual before it serves requests: the vector
+    index, BM25 index and chunks agree in size, the vectors have the
+    dimension of the version in service (i.e. the same embedding model), and
+    a search finds a chunk.
+
+    Raises:
+        RuntimeError: Naming the first failed check.
+    """
+    num_chunks = len(manual.chunks)
+    if num_chunks == 0:
+        raise RuntimeError(f"Manual '{manual.name}' has no chunks")
+    if manual.index.ntotal != num_chunks:
+        raise RuntimeError(f"Manual '{manual.name}': {manual.index.ntotal} vectors for {num_chunks} chunks")
+    if manual.bm25.corpus_size != num_chunks:
+        raise RuntimeError(f"Manual '{manual.name}': {manual.bm25.corpus_size} BM25 documents for {num_chunks} chunks")
+    if current is not None and manual.index.d != current.index.d:
+        raise RuntimeError(f"Manual '{manual.name}': embedding dimension changed from {current.index.d} to {manual.index.d}")
+    probe = np.full((1, manual.index.d), 1 / math.sqrt(manual.index.d), dtype=np.float32)
+    _, ids = manual.index.search(probe, 1)
+    if not 0 <= ids[0][0] < num_chunks:
+        raise RuntimeError(f"Manual '{manual.name}': a test search found no chunk")
+
+
+class IndexWatcher:
+    """
+    Polls the index files of the loaded manuals every `interval_s` seconds
+    and hot-swaps (`IndexRegistry.reload`) those whose version changed.
+
+    A new version is only loaded once two consecutive polls saw it, so files
+    still being written are not picked up. A version that fails to load or
+    validate is not retried until the files change again.
+    """
+
+    def __init__(self, registry: IndexRegistry, interval_s: float = INDEX_WATCH_INTERVAL_S):
+        self.registry = registry
+        self.interval_s = interval_s
+        self._seen: Dict[str, str] = {}
+        self._failed: Dict[str, str] = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="index-watcher", daemon=True)
+
+    def start(self) -> "IndexWatcher":
+        self._thread.start()
+        return self
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def check(self) -> List[str]:
+        """Polls once. Returns the names of the manuals swapped."""
+        swapped = []
+        for manual in self.registry.loaded():
+            version = self.registry.specs[manual.name].version()
+            previous, self._seen[manual.name] = self._seen.get(manual.name), version
+            if version == manual.version or version != previous or self._failed.get(manual.name) == version:
+                continue
+            try:
+                if self.registry.reload(manual.name) is not None:
+                    swapped.append(manual.name)
+            except Exception as e:
+                self._failed[manual.name] = version
+                print(f" Could not swap manual '{manual.name}' to version {version}: {e}")
+        return swapped
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_s):
+            try:
+                self.check()
+            except Exception as e:
+                print(f" Index watch failed: {e}")
+
+
+def search_manuals(question: str, manuals: List[Manual], top_k: int = 5, embedder: Optional[Embedder] = None, executor: Optional[ThreadPoolExecutor] = None, nprobe: Optional[int] = None, ef_search: Optional[int] = None, query_embedding: Optional[np.ndarray] = None, filters: Optional[MetadataFilters] = None) -> List[Dict[str, Any]]:
+    """
+    Runs the hybrid search in every manual in parallel and merges the results.
+
+    The query is embedded once and shared by all manuals. Fused scores are
+    normalised within each manual, so the per-manual lists are merged by score.
+    With several manuals, each result carries the name of its "manual".
+
+    Without explicit `filters`, weight-limit questions are restricted to the
+    matching performance tables (`retriever.infer_filters`), falling back to
+    the whole manual if that finds nothing.
+
+    Returns:
+        The best `top_k` results across all manuals, best first.
+    """
+    if query_embedding is None:
+        with span("embed"):
+            query_embedding = (embedder or get_embedding_service()).encode_query(question)
+
+    def search(manual: Manual) -> List[Dict[str, Any]]:
+        params = search_parameters(manual.index, nprobe=nprobe, ef_search=ef_search)
+        manual_filters = filters
+        if manual_filters is None and INFER_METADATA_FILTERS:
+            manual_filters = infer_filters(question, manual.metadata)
+        results = hybrid_search(question, manual.index, manual.bm25, manual.chunks, top_k=top_k, page_index=manual.page_index, search_params=params, query_embedding=query_embedding, index_version=manual.version, filters=manual_filters, metadata_index=manual.metadata)
+        if not results and filters is None and manual_filters:
+            results = hybrid_search(question, manual.index, manual.bm25, manual.chunks, top_k=top_k, page_index=manual.page_index, search_params=params, query_embedding=query_embedding, index_version=manual.version)
+        return results
+
+    if len(manuals) == 1:
+        return search(manuals[0])
+
+    per_manual = executor.map(in_context(search), manuals) if executor is not None else map(search, manuals)
+    return merge_results(manuals, per_manual, top_k)
+
+def merge_results(manuals: List[Manual], per_manual: Iterable[List[Dict[str, Any]]], top_k: int) -> List[Dict[str, Any]]:
+    """Tags each manual's results with its name and keeps the `top_k` best overall."""
+    merged = []
+    for manual, results in zip(manuals, per_manual):
+        for result in results:
+            result["manual"] = manual.name
+            merged.append(result)
+    merged.sort(key=lambda result: result["score"], reverse=True)
+    return merged[:top_k]
+
+
+@dataclass
+class RetrievedQuery:
+    """The outcome of retrieval for one question: everything its prompt is built from."""
+    question: str
+    query_embedding: np.ndarray
+    manuals: List[Manual]
+    context: str
+    visual_parts: List[Dict[str, Any]]
+    sources: List[Dict[str, Any]]
+
+    @property
+    def versions(self) -> Dict[str, str]:
+        """The index version of each manual the results come from."""
+        return {manual.name: manual.version for manual in self.manuals}
+
+    @property
+    def image_stores(self) -> Dict[str, PageImageStore]:
+        return {manual.name: manual.image_store for manual in self.manuals}
+
+    def build_prompt(self) -> Prompt:
+        """Builds the Gemini prompt. Loads page images, so keep it off the event loop."""
+        return build_prompt(self.question, self.context, self.visual_parts, image_store=self.manuals[0].image_store, image_stores=self.image_stores)
+
+def retrieve_query(question: str, registry: IndexRegistry, names: Optional[List[str]] = None, top_k: int = 5, embedder: Optional[Embedder] = None, nprobe: Optional[int] = None, ef_search: Optional[int] = None, filters: Optional[MetadataFilters] = None) -> RetrievedQuery:
+    """
+    Loads the requested manuals (default: the registry's default manual),
+    retrieves `top_k * 2` candidates from them, re-ranks them and selects the
+    `top_k` that make up the context.
+    """
+    manuals = [registry.get(name) for name in registry.resolve(names)]
+    with span("embed"):
+        query_embedding = (embedder or get_embedding_service()).encode_query(question)
+    results = search_manuals(question, manuals, top_k=top_k * 2, executor=registry.executor, nprobe=nprobe, ef_search=ef_search, query_embedding=query_embedding, filters=filters)
+    context, visual_parts, sources = build_context(select_results(question, results, top_k))
+    # Results of a single-manual search do not carry their manual.
+    for source in sources:
+        source.setdefault("manual", manuals[0].name)
+    return RetrievedQuery(question, query_embedding, manuals, context, visual_parts, sources)
+
+def lookup_tables(question: str, registry: IndexRegistry, names: Optional[List[str]] = None) -> Optional[TableAnswer]:
+    """
+    Answers weight-limit questions directly from the performance tables of
+    the requested manuals (see src/tables.py). Returns None when the question
+    is not a table lookup, or the tables cannot answer it unambiguously.
+    """
+    if not TABLE_LOOKUP:
+        return None
+    for name in registry.resolve(names):
+        with span("table_lookup"):
+            answer = registry.get(name).tables.answer(question)
+        if answer is not None:
+            for source in answer.sources:
+                source["manual"] = name
+            return answer
+    return None
+
+def query_manuals(question: str, registry: IndexRegistry, names: Optional[List[str]] = None, top_k: int = 5, embedder: Optional[Embedder] = None, nprobe: Optional[int] = None, ef_search: Optional[int] = None, filters: Optional[MetadataFilters] = None) -> Dict[str, Any]:
+    """
+    Answers a question from one or several manuals of the registry. Questions
+    the performance tables answer directly skip retrieval and generation.
+
+    Args:
+        question: The user's question.
+        registry: The index registry.
+        names: The manuals to search. Defaults to the registry's default manual.
+        top_k: The number of results used as context.
+        embedder: The shared embedding service. Defaults to the process-wide instance.
+        nprobe: IVF lists scanned per query, for approximate indexes.
+        ef_search: HNSW search depth, for approximate indexes.
+        filters: Metadata filters restricting retrieval (see `indexer.MetadataIndex`).
+
+    Returns:
+        A dictionary containing the answer, the source page numbers and the
+        (manual, page) sources.
+    """
+    table_answer = lookup_tables(question, registry, names)
+    if table_answer is not None:
+        return answer_response(table_answer.answer, table_answer.sources)
+    retrieved = retrieve_query(question, registry, names, top_k=top_k, embedder=embedder, nprobe=nprobe, ef_search=ef_search, filters=filters)
+    answer = generate_answer(question, retrieved.context, retrieved.visual_parts, image_store=retrieved.manuals[0].image_store, image_stores=retrieved.image_stores)
+    return answer_response(answer, retrieved.sources)
+
+def prepare_query(question: str, registry: IndexRegistry, names: Optional[List[str]] = None, top_k: int = 5, embedder: Optional[Embedder] = None, nprobe: Optional[int] = None, ef_search: Optional[int] = None, filters: Optional[MetadataFilters] = None) -> Tuple[Prompt, List[Dict[str, Any]]]:
+    """
+    The blocking part of `query_manuals`: retrieval, re-ranking and prompt
+    building. The prompt is then sent with `generate_from_prompt(_async)`.
+
+    Returns:
+        (prompt, sources)
+    """
+    retrieved = retrieve_query(question, registry, names, top_k=top_k, embedder=embedder, nprobe=nprobe, ef_search=ef_search, filters=filters)
+    return retrieved.build_prompt(), retrieved.sources
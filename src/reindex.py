@@ -0,0 +1,185 @@
+import json
+import os
+import sys
+import time
+import faiss
+import numpy as np
+from typing import List, Dict, Any, Tuple, Optional
+from src.config import FAISS_INDEX_PATH, INDEX_DIR
+from src.document_processor import analyze_pages, chunk_page, detect_performance_table, diagram_pages, make_splitter, page_content_hashes, process_pdf
+from src.embedding import EmbeddingService, get_embedding_service
+from src.index_store import EmbeddingMatrixIndex
+from src.indexer import (BM25Index, IdMappedIndex, RescoringIndex, build_faiss_index, chunk_content_hash, chunk_vector_id,
+                         chunk_vector_ids, create_indexes, id_mapped_index, is_quantized, load_indexes, save_indexes, tokenize)
+from src.page_images import render_page_images
+
+# Page and chunk content hashes live next to the FAISS index.
+MANIFEST_PATH = os.path.splitext(FAISS_INDEX_PATH)[0] + "_manifest.json"
+
+def build_manifest(pdf_path: str, page_hashes: Dict[int, str], chunks: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Records the hash of every page and chunk that went into the index."""
+    return {
+        "pdf_path": os.path.abspath(pdf_path),
+        "updated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "pages": {str(page_number): page_hash for page_number, page_hash in page_hashes.items()},
+        "chunks": [{"chunk_id": chunk["chunk_id"], "page_number": chunk["page_number"], "hash": chunk_content_hash(chunk)} for chunk in chunks],
+    }
+
+def load_manifest(path: str = MANIFEST_PATH) -> Optional[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def save_manifest(manifest: Dict[str, Any], path: str = MANIFEST_PATH) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+
+def _id_mapped_faiss_index(index: Any, chunks: List[Dict[str, Any]]) -> faiss.IndexIDMap2:
+    """Returns an IndexIDMap2 holding the current vectors, whatever format they were loaded in."""
+    if isinstance(index, IdMappedIndex):
+        return index.index
+    # Flat or memory-mapped indexes are in chunk order: re-key the stored vectors by chunk id.
+    embeddings = index.embeddings if hasattr(index, "embeddings") else index.reconstruct_n(0, index.ntotal)
+    return build_faiss_index(np.ascontiguousarray(embeddings, dtype=np.float32), chunk_vector_ids(chunks))
+
+def _exact_vectors(index: Any) -> Optional[np.ndarray]:
+    """The float32 vectors of a loaded index in chunk order, or None if it only holds them in FAISS."""
+    if isinstance(index, RescoringIndex):
+        return index.exact_vectors
+    if isinstance(index, EmbeddingMatrixIndex):
+        return index.embeddings
+    return None
+
+def _stored_vectors(faiss_index: faiss.IndexIDMap2, ids: np.ndarray, known: List[Tuple[np.ndarray, Optional[np.ndarray]]]) -> np.ndarray:
+    """
+    The vectors of `ids` to save as the embedding matrix. Quantized indexes
+    only reconstruct approximations, so their exact vectors are looked up in
+    `known` ((ids, vectors) pairs) first.
+    """
+    if not is_quantized(faiss_index):
+        return faiss_index.reconstruct_batch(ids)
+    vectors = np.empty((len(ids), faiss_index.d), dtype=np.float32)
+    missing = np.ones(len(ids), dtype=bool)
+    for known_ids, known_vectors in known:
+        if known_vectors is None or not len(known_ids):
+            continue
+        order = np.argsort(known_ids, kind="stable")
+        slots = np.clip(np.searchsorted(known_ids[order], ids), 0, len(known_ids) - 1)
+        found = missing & (known_ids[order][slots] == ids)
+        vectors[found] = known_vectors[order[slots[found]]]
+        missing &= ~found
+    if missing.any():
+        print(f" No exact vectors for {int(missing.sum())} chunks, reconstructing them from the quantized index")
+        vectors[missing] = faiss_index.reconstruct_batch(ids[missing])
+    return vectors
+
+def _remove_vectors(faiss_index: faiss.IndexIDMap2, removed_ids: np.ndarray) -> faiss.IndexIDMap2:
+    """Removes vectors by id. HNSW graphs do not support removal, so those are rebuilt from the kept vectors."""
+    try:
+        faiss_index.remove_ids(removed_ids)
+        return faiss_index
+    except RuntimeError:
+        ids = faiss.vector_to_array(faiss_index.id_map)
+        kept_ids = ids[~np.isin(ids, removed_ids)]
+        print(f" Index type does not support removal, rebuilding it from {len(kept_ids)} vectors...")
+        return build_faiss_index(faiss_index.reconstruct_batch(kept_ids), kept_ids)
+
+def rebuild_indexes(pdf_path: str, embedder: Optional[EmbeddingService] = None, workers: Optional[int] = None) -> Tuple[IdMappedIndex, BM25Index, List[Dict[str, Any]]]:
+    """Full rebuild: processes the whole PDF, indexes it and records its manifest."""
+    chunks = process_pdf(pdf_path, workers=workers)
+    page_images = render_page_images(pdf_path, diagram_pages(chunks)) if INDEX_DIR else None
+    index, bm25, chunks = create_indexes(chunks, embedder=embedder, page_images=page_images)
+    save_manifest(build_manifest(pdf_path, page_content_hashes(pdf_path), chunks))
+    return index, bm25, chunks
+
+def update_indexes(pdf_path: str, embedder: Optional[EmbeddingService] = None, workers: Optional[int] = None) -> Tuple[Any, BM25Index, List[Dict[str, Any]]]:
+    """
+    Brings the indexes up to date with a revised manual, redoing only what changed.
+
+    Every page is hashed (cheap), and only pages whose hash differs from the
+    manifest are re-extracted and re-chunked. Only chunks whose content hash
+    is new are embedded. Their vectors are added to, and stale ones removed
+    from, the id-mapped FAISS index by chunk id. The BM25 postings are
+    rebuilt from the chunk text (no model involved, and IDF is corpus-wide
+    anyway). Without a manifest, a full rebuild is done.
+
+    Args:
+        pdf_path: The path to the (revised) PDF.
+        embedder: The shared embedding service. Defaults to the process-wide instance.
+        workers: Extraction processes for a full rebuild.
+
+    Returns:
+        The updated (FAISS index, BM25 index, chunks).
+    """
+    manifest = load_manifest()
+    index, bm25, chunks = load_indexes()
+    if manifest is None or index is None:
+        print("No index manifest found. Building indexes from scratch...")
+        return rebuild_indexes(pdf_path, embedder=embedder, workers=workers)
+
+    print("Hashing pages...")
+    page_hashes = page_content_hashes(pdf_path)
+    old_hashes = {int(page_number): page_hash for page_number, page_hash in manifest["pages"].items()}
+    changed_pages = sorted(page_number for page_number, page_hash in page_hashes.items() if old_hashes.get(page_number) != page_hash)
+    removed_pages = sorted(set(old_hashes) - set(page_hashes))
+    if not changed_pages and not removed_pages:
+        print("✅ Indexes are up to date")
+        return index, bm25, chunks
+    print(f" {len(changed_pages)} changed/new pages, {len(removed_pages)} removed pages")
+
+    page_image_source = getattr(chunks, "page_images", None)
+    chunks = list(chunks)
+    known_vectors = [(chunk_vector_ids(chunks), _exact_vectors(index))]
+    faiss_index = _id_mapped_faiss_index(index, chunks)
+
+    touched_pages = set(changed_pages) | set(removed_pages)
+    kept_chunks = [chunk for chunk in chunks if chunk["page_number"] not in touched_pages]
+    stale_ids = {chunk_vector_id(chunk) for chunk in chunks if chunk["page_number"] in touched_pages}
+
+    print(f"Re-extracting {len(changed_pages)} pages...")
+    splitter = make_splitter()
+    fresh_chunks = [chunk for page in analyze_pages(pdf_path, changed_pages) for chunk in chunk_page(page, detect_performance_table(page), splitter)]
+    fresh_ids = [chunk_vector_id(chunk) for chunk in fresh_chunks]
+
+    # Chunks whose content did not change keep their vector.
+    removed_ids = np.array(sorted(stale_ids - set(fresh_ids)), dtype=np.int64)
+    to_embed = [(chunk, chunk_id) for chunk, chunk_id in zip(fresh_chunks, fresh_ids) if chunk_id not in stale_ids]
+    if len(removed_ids):
+        faiss_index = _remove_vectors(faiss_index, removed_ids)
+    if to_embed:
+        print(f"Embedding {len(to_embed)} new or modified chunks...")
+        embedder = embedder or get_embedding_service()
+        embeddings = embedder.encode([chunk["content"] for chunk, _ in to_embed])
+        faiss.normalize_L2(embeddings)
+        added_ids = np.array([chunk_id for _, chunk_id in to_embed], dtype=np.int64)
+        faiss_index.add_with_ids(embeddings, added_ids)
+        known_vectors.append((added_ids, embeddings))
+    print(f" Removed {len(removed_ids)} vectors, added {len(to_embed)} vectors")
+
+    # Stable sort keeps the original chunk order within each page.
+    new_chunks = sorted(kept_chunks + fresh_chunks, key=lambda chunk: chunk["page_number"])
+    new_ids = chunk_vector_ids(new_chunks)
+    bm25 = BM25Index.from_corpus([tokenize(chunk["content"]) for chunk in new_chunks])
+
+    page_images = None
+    if INDEX_DIR:
+        # Unchanged pages keep their stored image; changed pages are re-rendered.
+        page_images = {}
+        if page_image_source is not None:
+            page_images = {page_number: page_image_source.get(page_number) for page_number in page_image_source.pages() if page_number not in touched_pages}
+        page_images.update(render_page_images(pdf_path, diagram_pages(fresh_chunks)))
+
+    vectors = _stored_vectors(faiss_index, new_ids, known_vectors)
+    save_indexes(faiss_index, bm25, new_chunks, vectors, page_images)
+    save_manifest(build_manifest(pdf_path, page_hashes, new_chunks))
+    print(f"✅ Re-indexed {len(changed_pages) + len(removed_pages)} pages")
+    return id_mapped_index(faiss_index, new_ids, vectors), bm25, new_chunks
+
+
+if __name__ == "__main__":
+    # Usage: python -m src.reindex PATH_TO_PDF
+    if len(sys.argv) < 2:
+        print("Usage: python -m src.reindex PATH_TO_PDF")
+        sys.exit(1)
+    update_indexes(sys.argv[1])
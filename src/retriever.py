@@ -1,61 +1,198 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 import numpy as np
-import io
-from PIL import Image
-from typing import List, Dict, Any, Tuple
-from sentence_transformers import SentenceTransformer
+from sentence_transformers import CrossEncoder
+from typing import List, Dict, Any, Tuple, Optional
+from src.cache import get_retrieval_cache
+from src.config import (CONTEXT_MAX_TOKENS, EMBEDDING_DEVICE, RERANKER, RERANKER_MODEL, RERANK_MAX_TOKENS, RERANK_BUDGET_MS,
+                        RERANK_BATCH_WINDOW_MS, RERANK_MAX_PAIRS)
+from src.context import assemble_context
+from src.embedding import Embedder, get_embedding_service
 from src.generator import generate_answer
+from src.indexer import BM25Index, MetadataFilters, MetadataIndex, PageIndex, build_page_index, normalize_filters, search_subset, tokenize
+from src.metrics import record_count, span
+from src.page_images import PageImageStore
+from src.tables import TableIndex, parse_table_query
 import faiss
-from rank_bm25 import BM25Okapi
 
-def hybrid_search(query: str, index: faiss.IndexFlatIP, bm25: BM25Okapi, all_chunks: List[Dict[str, Any]], top_k: int = 5, alpha: float = 0.5) -> List[Dict[str, Any]]:
-    """Performs a hybrid search combining semantic (FAISS) and keyword (BM25)."""
-    embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-    query_embedding = embedding_model.encode([query])
-    query_embedding = np.array(query_embedding).astype('float32')
-    distances, indices = index.search(query_embedding, top_k * 3)
+def fuse_scores(semantic_indices: np.ndarray, semantic_distances: np.ndarray, bm25_scores: np.ndarray, page_index: PageIndex, top_k: int = 5, alpha: float = 0.5, allowed: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+    """
+    Fuses FAISS and BM25 scores and keeps the best chunk of the `top_k` best pages.
 
-    semantic_scores = 1 / (1 + distances[0])
-    semantic_scores = semantic_scores / (semantic_scores.max() + 1e-6)
+    Everything is done on dense NumPy arrays: the per-page maximum is computed
+    with `np.maximum.at` and the top pages are selected with `argpartition`, so
+    only `top_k` pages are ever sorted.
 
-    tokenized_query = query.lower().split()
-    bm25_scores = bm25.get_scores(tokenized_query)
-    bm25_scores = bm25_scores / (bm25_scores.max() + 1e-6)
+    BM25 scores stay dense on purpose. Every chunk can score BM25 points, so
+    an exact top-k needs every chunk's score. A sparse candidate set from
+    `BM25Index.get_top_k` plus a pruning bound gave identical pages, but it ran
+    2-2.5x slower than `get_scores` on 200-50k chunk corpora.
 
-    combined_scores = {}
-    for idx, score in zip(indices[0], semantic_scores):
-        combined_scores[idx] = alpha * score
-    for idx, score in enumerate(bm25_scores):
-        if idx in combined_scores:
-            combined_scores[idx] += (1 - alpha) * score
-        else:
-            combined_scores[idx] = (1 - alpha) * score
+    Args:
+        semantic_indices: Chunk indices returned by FAISS for the query (-1 for empty slots).
+        semantic_distances: The matching FAISS inner-product scores.
+        bm25_scores: BM25 scores for every chunk.
+        page_index: The precomputed chunk -> page mapping.
+        top_k: Number of pages to return.
+        alpha: Weight of the semantic score (1 - alpha goes to BM25).
+        allowed: Optional boolean mask of the chunks that may be returned.
+
+    Returns:
+        A list of (chunk_idx, score) for the best chunk of each page, best page first.
+    """
+    semantic_scores = 1 / (1 + semantic_distances)
+    semantic_scores = semantic_scores / (semantic_scores.max() + 1e-6)
+    bm25_scores = bm25_scores / (bm25_scores.max() + 1e-6)
 
-    sorted_indices = sorted(combined_scores.items(), key=lambda x: x[1], reverse=True)
+    combined_scores = (1 - alpha) * bm25_scores.astype(np.float64)
+    found = semantic_indices >= 0
+    combined_scores[semantic_indices[found]] += alpha * semantic_scores[found].astype(np.float64)
+    if allowed is not None:
+        combined_scores[~allowed] = -np.inf
 
     # Group by page to ensure page diversity
-    page_groups = {}
-    for idx, score in sorted_indices:
-        chunk = all_chunks[idx]
-        page_num = chunk["page_number"]
-        if page_num not in page_groups:
-            page_groups[page_num] = {"chunks": [], "max_score": score, "page_num": page_num}
-        page_groups[page_num]["chunks"].append({"chunk_idx": idx, "score": score, "chunk": chunk})
-        if score > page_groups[page_num]["max_score"]:
-            page_groups[page_num]["max_score"] = score
-
-    sorted_pages = sorted(page_groups.values(), key=lambda x: x["max_score"], reverse=True)
+    num_pages = len(page_index.page_numbers)
+    page_max = np.full(num_pages, -np.inf)
+    np.maximum.at(page_max, page_index.chunk_page, combined_scores)
+
+    k = min(top_k, num_pages)
+    if k <= 0:
+        return []
+    top_pages = np.argpartition(-page_max, k - 1)[:k]
+    top_pages = top_pages[np.argsort(-page_max[top_pages], kind="stable")]
+    top_pages = top_pages[np.isfinite(page_max[top_pages])]
+
+    fused = []
+    for page_pos in top_pages:
+        page_chunks = page_index.chunks_for_page(page_pos)
+        best_idx = page_chunks[np.argmax(combined_scores[page_chunks])]
+        fused.append((int(best_idx), float(combined_scores[best_idx])))
+    return fused
 
+# Table type answering each kind of weight-limit question (see `tables.TableQuery`).
+QUANTITY_TABLE_TYPES = {"climb_limit": "field_climb_limits", "field_limit": "field_climb_limits", "landing_limit": "landing_limits"}
+
+def infer_filters(question: str, metadata_index: MetadataIndex) -> Optional[Dict[str, str]]:
+    """
+    Metadata filters implied by a weight-limit question (see
+    `tables.parse_table_query`): its table type, narrowed by the altitude,
+    runway condition and flap setting it names as long as some chunk still
+    matches. None for other questions.
+    """
+    query = parse_table_query(question)
+    if query is None:
+        return None
+    filters = {"table_type": QUANTITY_TABLE_TYPES[query.quantity]}
+    if not metadata_index.mask(filters).any():
+        return None
+    named = {
+        "altitude": f"{query.altitude_ft:g}" if query.altitude_ft is not None else None,
+        "runway_condition": query.runway_condition, "flap_setting": query.flap_setting,
+    }
+    for field, value in named.items():
+        if value is not None and metadata_index.mask({**filters, field: value}).any():
+            filters[field] = value
+    return filters
+
+def fused_results(all_chunks: List[Dict[str, Any]], fused: List[Tuple[int, float]]) -> List[Dict[str, Any]]:
+    """Turns `fuse_scores` output into search results."""
     results = []
-    for page_group in sorted_pages[:top_k]:
-        best_chunk = max(page_group["chunks"], key=lambda x: x["score"])
-        chunk = best_chunk["chunk"]
+    for chunk_idx, score in fused:
+        chunk = all_chunks[chunk_idx]
         results.append({
-            "content": chunk["content"], "page_number": page_group["page_num"], "type": chunk.get("type", "text"),
-            "score": float(best_chunk["score"]), "has_image": chunk.get("page_image") is not None,
-            "page_image": chunk.get("page_image"), "metadata": chunk.get("metadata", {})
+            "content": chunk["content"], "page_number": chunk["page_number"], "type": chunk.get("type", "text"),
+            "score": score, "has_image": chunk.get("has_image", chunk.get("page_image") is not None), "metadata": chunk.get("metadata", {})
         })
     return results
 
+def hybrid_search(query: str, index: faiss.IndexFlatIP, bm25: BM25Index, all_chunks: List[Dict[str, Any]], top_k: int = 5, alpha: float = 0.5, embedder: Optional[Embedder] = None, page_index: Optional[PageIndex] = None, search_params: Optional[faiss.SearchParameters] = None, query_embedding: Optional[np.ndarray] = None, index_version: Optional[str] = None, filters: Optional[MetadataFilters] = None, metadata_index: Optional[MetadataIndex] = None) -> List[Dict[str, Any]]:
+    """
+    Performs a hybrid search combining semantic (FAISS) and keyword (BM25).
+    `search_params` (see `indexer.search_parameters`) overrides nprobe/efSearch
+    for approximate indexes. A precomputed `query_embedding` (1, d) skips the
+    embedding step, e.g. when one query is searched in several manuals.
+
+    `filters` (see `indexer.MetadataIndex`) restrict the search to chunks
+    with matching metadata: FAISS (through an ID selector) and BM25 only score
+    that subset. Returns an empty list when no chunk matches.
+
+    When `index_version` (see `indexer.index_version`) identifies the index
+    contents, results are memoized in the process-wide retrieval cache, keyed
+    by the query, `top_k`, `alpha`, the search parameters and that version.
+    """
+    cache_key = None
+    if index_version is not None:
+        cache_key = (query, top_k, alpha, getattr(search_params, "nprobe", None), getattr(search_params, "efSearch", None), normalize_filters(filters), index_version)
+        cached = get_retrieval_cache().get(cache_key)
+        if cached is not None:
+            # Callers annotate and re-sort results, so each gets its own copies.
+            return [dict(result) for result in cached]
+
+    allowed = None
+    if filters:
+        allowed = (metadata_index or MetadataIndex.from_chunks(all_chunks)).mask(filters)
+        if not allowed.any():
+            return []
+
+    page_index = page_index or build_page_index(all_chunks)
+    if query_embedding is None:
+        with span("embed"):
+            query_embedding = (embedder or get_embedding_service()).encode_query(query)
+    with span("faiss_search"):
+        if allowed is None:
+            distances, indices = index.search(query_embedding, top_k * 3, params=search_params)
+        else:
+            distances, indices = search_subset(index, query_embedding, top_k * 3, np.flatnonzero(allowed), params=search_params)
+
+    with span("bm25"):
+        bm25_scores = bm25.get_scores(tokenize(query), allowed=allowed)
+
+    with span("fusion"):
+        results = fused_results(all_chunks, fuse_scores(indices[0], distances[0], bm25_scores, page_index, top_k=top_k, alpha=alpha, allowed=allowed))
+    if cache_key is not None:
+        get_retrieval_cache().put(cache_key, tuple(dict(result) for result in results))
+    return results
+
+# Queries scored together by `batch_hybrid_search`; bounds the (block, num_chunks) BM25 score matrix.
+BATCH_BLOCK_SIZE = 256
+
+def batch_hybrid_search(queries: List[str], index: faiss.IndexFlatIP, bm25: BM25Index, all_chunks: List[Dict[str, Any]], top_k: int = 5, alpha: float = 0.5, embedder: Optional[Embedder] = None, page_index: Optional[PageIndex] = None, search_params: Optional[faiss.SearchParameters] = None, query_embeddings: Optional[np.ndarray] = None, filters: Optional[MetadataFilters] = None, metadata_index: Optional[MetadataIndex] = None) -> List[List[Dict[str, Any]]]:
+    """
+    `hybrid_search` for many queries at once, with the same results in input order.
+
+    All queries are embedded in one call (unless `query_embeddings` (n, d) is
+    given). Each block of `BATCH_BLOCK_SIZE` queries then gets a single FAISS
+    search over its query matrix, and one BM25 pass that reads the postings
+    of every distinct term once (`BM25Index.get_scores_batch`). `filters`
+    apply to every query.
+    """
+    if not queries:
+        return []
+    allowed = None
+    if filters:
+        allowed = (metadata_index or MetadataIndex.from_chunks(all_chunks)).mask(filters)
+        if not allowed.any():
+            return [[] for _ in queries]
+    page_index = page_index or build_page_index(all_chunks)
+    if query_embeddings is None:
+        query_embeddings = (embedder or get_embedding_service()).encode(queries, batch_size=64)
+
+    results = []
+    for start in range(0, len(queries), BATCH_BLOCK_SIZE):
+        block = queries[start:start + BATCH_BLOCK_SIZE]
+        block_embeddings = np.ascontiguousarray(query_embeddings[start:start + len(block)], dtype=np.float32)
+        if allowed is None:
+            distances, indices = index.search(block_embeddings, top_k * 3, params=search_params)
+        else:
+            distances, indices = search_subset(index, block_embeddings, top_k * 3, np.flatnonzero(allowed), params=search_params)
+        bm25_scores = bm25.get_scores_batch([tokenize(query) for query in block], allowed=allowed)
+        for row in range(len(block)):
+            fused = fuse_scores(indices[row], distances[row], bm25_scores[row], page_index, top_k=top_k, alpha=alpha, allowed=allowed)
+            results.append(fused_results(all_chunks, fused))
+    return results
+
 def simple_rerank(query: str, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """Simple re-ranking based on query type."""
     query_lower = query.lower()
@@ -74,7 +211,220 @@ def simple_rerank(query: str, results: List[Dict[str, Any]]) -> List[Dict[str, A
     results.sort(key=lambda x: x["rerank_score"], reverse=True)
     return results
 
-def query_boeing_manual(question: str, index: faiss.IndexFlatIP, bm25: BM25Okapi, all_chunks: List[Dict[str, Any]], top_k: int = 5) -> Dict[str, Any]:
+class Reranker:
+    """
+    Orders retrieved candidates for a query, setting their "rerank_score".
+    The base class applies the keyword heuristics of `simple_rerank`.
+    """
+
+    name = "heuristic"
+
+    def rerank(self, query: str, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return simple_rerank(query, results)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"reranker": self.name}
+
+    def close(self) -> None:
+        pass
+
+
+class CrossEncoderReranker(Reranker):
+    """
+    Scores (query, chunk) pairs with a cross-encoder on CPU.
+
+    All candidates of a request are scored in one batch, and requests arriving
+    within `window_ms` of each other share a forward pass of up to `max_pairs`
+    pairs, as in `EmbeddingBatcher`. Pairs are truncated to `max_tokens`
+    tokens. A request whose scores are not ready within `budget_ms` (queueing
+    included) falls back to the heuristic order, so reranking never adds more
+    than the budget to a request.
+    """
+
+    name = "cross-encoder"
+
+    def __init__(self, model_name: str = RERANKER_MODEL, device: str = EMBEDDING_DEVICE, max_tokens: int = RERANK_MAX_TOKENS, budget_ms: float = RERANK_BUDGET_MS, window_ms: float = RERANK_BATCH_WINDOW_MS, max_pairs: int = RERANK_MAX_PAIRS):
+        print(f"Loading reranker model '{model_name}' on {device}...")
+        self.model_name = model_name
+        self.model = CrossEncoder(model_name, max_length=max_tokens, device=device)
+        # Cuts passages before tokenization; the tokenizer truncates to max_tokens.
+        self.max_chars = max_tokens * 8
+        self.budget = budget_ms / 1000.0
+        self.window = window_ms / 1000.0
+        self.max_pairs = max(1, max_pairs)
+        self._queue: "queue.Queue[Optional[Tuple[List[Tuple[str, str]], Future]]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.fallbacks = 0
+        self.batches = 0
+        self.pairs_scored = 0
+        self.total_batch_s = 0.0
+
+        self.model.predict([("warm up", "warm up")], show_progress_bar=False)
+        self._worker = threading.Thread(target=self._run, name="reranker-batcher", daemon=True)
+        self._worker.start()
+        print("✅ Reranker ready")
+
+    def rerank(self, query: str, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if not results:
+            return results
+        future: Future = Future()
+        self._queue.put(([(query, r["content"][:self.max_chars]) for r in results], future))
+        try:
+            scores = future.result(timeout=self.budget)
+        except FutureTimeoutError:
+            # Not scored in time; if still queued it is dropped from its batch.
+            future.cancel()
+            with self._lock:
+                self.requests += 1
+                self.fallbacks += 1
+            return simple_rerank(query, results)
+        except Exception as e:
+            print(f"Reranker failed, using heuristic order: {e}")
+            with self._lock:
+                self.requests += 1
+                self.fallbacks += 1
+            return simple_rerank(query, results)
+
+        with self._lock:
+            self.requests += 1
+        for result, score in zip(results, scores):
+            result["rerank_score"] = float(score)
+        results.sort(key=lambda x: x["rerank_score"], reverse=True)
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "reranker": self.name, "model": self.model_name, "budget_ms": 1000 * self.budget,
+                "requests": self.requests, "fallbacks": self.fallbacks, "batches": self.batches,
+                "mean_pairs_per_batch": self.pairs_scored / self.batches if self.batches else 0.0,
+                "mean_batch_ms": 1000 * self.total_batch_s / self.batches if self.batches else 0.0,
+            }
+
+    def close(self) -> None:
+        """Stops the worker thread after the requests already queued are scored."""
+        self._queue.put(None)
+        self._worker.join()
+
+    def _collect_batch(self, first: Tuple[List[Tuple[str, str]], Future]) -> Tuple[List[Tuple[List[Tuple[str, str]], Future]], bool]:
+        batch = [first]
+        num_pairs = len(first[0])
+        deadline = time.monotonic() + self.window
+        while num_pairs < self.max_pairs:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+            num_pairs += len(item[0])
+        return batch, False
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch, stop = self._collect_batch(first)
+            # Skip requests that already gave up and fell back.
+            batch = [(pairs, future) for pairs, future in batch if future.set_running_or_notify_cancel()]
+            if batch:
+                pairs = [pair for request_pairs, _ in batch for pair in request_pairs]
+                start = time.perf_counter()
+                try:
+                    scores = np.asarray(self.model.predict(pairs, batch_size=len(pairs), show_progress_bar=False), dtype=np.float32)
+                    offset = 0
+                    for request_pairs, future in batch:
+                        future.set_result(scores[offset:offset + len(request_pairs)])
+                        offset += len(request_pairs)
+                except Exception as e:
+                    for _, future in batch:
+                        future.set_exception(e)
+                with self._lock:
+                    self.batches += 1
+                    self.pairs_scored += len(pairs)
+                    self.total_batch_s += time.perf_counter() - start
+            if stop:
+                return
+
+
+RERANKERS = {"heuristic": Reranker, "cross-encoder": CrossEncoderReranker}
+
+_default_reranker: Optional[Reranker] = None
+_default_reranker_lock = threading.Lock()
+
+def get_reranker() -> Reranker:
+    """Returns the process-wide reranker selected by RERANKER, creating it on first use."""
+    global _default_reranker
+    if _default_reranker is None:
+        with _default_reranker_lock:
+            if _default_reranker is None:
+                if RERANKER not in RERANKERS:
+                    raise ValueError(f"Unknown RERANKER '{RERANKER}' (expected one of: {', '.join(RERANKERS)})")
+                _default_reranker = RERANKERS[RERANKER]()
+    return _default_reranker
+
+def set_reranker(reranker: Reranker) -> None:
+    """Registers an already-created reranker as the process-wide default."""
+    global _default_reranker
+    _default_reranker = reranker
+
+def select_results(question: str, results: List[Dict[str, Any]], top_k: int = 5, reranker: Optional[Reranker] = None) -> List[Dict[str, Any]]:
+    """Re-ranks retrieved candidates (with the process-wide reranker by default) and keeps the `top_k` used as context."""
+    with span("rerank"):
+        return (reranker or get_reranker()).rerank(question, results)[:top_k]
+
+def build_context(results: List[Dict[str, Any]], max_tokens: int = CONTEXT_MAX_TOKENS) -> Tuple[str, List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Splits ranked results into the text context and the visual pages for the
+    generator within a token budget (see `context.assemble_context`), and
+    lists the cited pages in rank order.
+
+    Returns:
+        (context, visual_parts, sources), where each source is
+        {"page": page_number, "score": score} plus "manual" for results that carry one.
+    """
+    with span("context"):
+        context, visual_parts, sources, tokens = assemble_context(results, max_tokens=max_tokens)
+    record_count("context_tokens", tokens)
+    return context, visual_parts, sources
+
+def answer_from_results(question: str, results: List[Dict[str, Any]], top_k: int = 5, image_store: Optional[PageImageStore] = None, image_stores: Optional[Dict[str, PageImageStore]] = None) -> Dict[str, Any]:
+    """
+    Re-ranks retrieved results, keeps the best `top_k` and generates the answer.
+
+    Args:
+        question: The user's question.
+        results: Candidates from `hybrid_search` (or several manuals merged).
+        top_k: The number of results used as context.
+        image_store: Where visual pages are loaded from. Defaults to the process-wide store.
+        image_stores: Per-manual image stores, for results that carry a "manual".
+
+    Returns:
+        A dictionary containing the answer, the source page numbers and the
+        (manual, page) sources.
+    """
+    # Step 2: Re-ranking
+    results = select_results(question, results, top_k)
+
+    # Step 3: Prepare context for generation
+    context, visual_parts, sources = build_context(results)
+
+    # Step 4: Generate answer
+    answer = generate_answer(question, context, visual_parts, image_store=image_store, image_stores=image_stores)
+
+    return answer_response(answer, sources)
+
+def answer_response(answer: str, sources: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """The response dictionary for an answer and its sources."""
+    return {"answer": answer, "pages": sorted({source["page"] for source in sources}), "sources": sources}
+
+def query_boeing_manual(question: str, index: faiss.IndexFlatIP, bm25: BM25Index, all_chunks: List[Dict[str, Any]], top_k: int = 5, embedder: Optional[Embedder] = None, page_index: Optional[PageIndex] = None, image_store: Optional[PageImageStore] = None, search_params: Optional[faiss.SearchParameters] = None, index_version: Optional[str] = None, tables: Optional[TableIndex] = None, filters: Optional[MetadataFilters] = None) -> Dict[str, Any]:
     """
     Complete RAG query pipeline: retrieval, re-ranking, and answer generation.
 
@@ -84,36 +434,24 @@ def query_boeing_manual(question: str, index: faiss.IndexFlatIP, bm25: BM25Okapi
         bm25: The BM25 index.
         all_chunks: The list of all document chunks.
         top_k: The number of top results to consider.
+        embedder: The shared embedding service. Defaults to the process-wide instance.
+        page_index: The precomputed chunk -> page mapping. Built on the fly if omitted.
+        image_store: Where visual pages are loaded from. Defaults to the process-wide store.
+        search_params: Per-query FAISS search parameters (nprobe/efSearch).
+        index_version: Fingerprint of the indexes; enables the retrieval cache.
+        tables: Performance table grids; questions they answer skip retrieval and generation.
+        filters: Metadata filters restricting retrieval (see `indexer.MetadataIndex`).
 
     Returns:
         A dictionary containing the answer and a list of source page numbers.
     """
-    # Step 1: Initial retrieval
-    results = hybrid_search(question, index, bm25, all_chunks, top_k=top_k * 2)
+    if tables is not None:
+        with span("table_lookup"):
+            table_answer = tables.answer(question)
+        if table_answer is not None:
+            return answer_response(table_answer.answer, table_answer.sources)
 
-    # Step 2: Re-ranking
-    results = simple_rerank(question, results)
-    results = results[:top_k]
-
-    # Step 3: Prepare context for generation
-    seen_pages = set()
-    page_numbers = []
-    text_parts = []
-    visual_parts = []
-
-    for r in results:
-        if r["page_number"] not in seen_pages:
-            page_numbers.append(r["page_number"])
-            seen_pages.add(r["page_number"])
-
-        if r["type"] == "visual" and r["has_image"]:
-            visual_parts.append(r)
-        else:
-            text_parts.append(f"[Page {r['page_number']}]\n{r['content']}")
-
-    context = "\n\n---\n\n".join(text_parts)
-
-    # Step 4: Generate answer
-    answer = generate_answer(question, context, visual_parts)
+    # Step 1: Initial retrieval
+    results = hybrid_search(question, index, bm25, all_chunks, top_k=top_k * 2, embedder=embedder, page_index=page_index, search_params=search_params, index_version=index_version, filters=filters)
 
-    return {"answer": answer, "pages": sorted(list(set(page_numbers)))}
\ No newline at end of file
+    return answer_from_results(question, results, top_k=top_k, image_store=image_store)
@@ -0,0 +1,136 @@
+# src/stub_llm.py
+"""
+A local stand-in for the Gemini API, for load-testing the RAG API offline.
+
+It answers `generateContent` (and streams `streamGenerateContent`) requests
+of the Gemini REST API after a simulated latency, without calling any model.
+Start it and point the API at it:
+
+    python -m src.stub_llm --port 8001 --latency-ms 800
+    GEMINI_API_ENDPOINT=http://127.0.0.1:8001 python main.py
+
+To exercise the client's retries, hedging and fallback (src/llm_client.py),
+it can answer a share of requests with 503 (--error-rate), add a latency
+tail (--slow-rate, --slow-ms) or reject whole models (--unavailable):
+
+    python -m src.stub_llm --error-rate 0.2 --slow-rate 0.05 --slow-ms 5000 --unavailable gemini-2.5-pro
+"""
+import argparse
+import asyncio
+import json
+import random
+from typing import List, Dict, Any, Optional
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI(title="Stub Gemini API")
+
+# Simulated generation latency, set from the command line.
+latency_ms = 800.0
+jitter_ms = 200.0
+# Injected failures, set from the command line.
+error_rate = 0.0
+slow_rate = 0.0
+slow_ms = 0.0
+unavailable_models: List[str] = []
+requests_served = 0
+errors_returned = 0
+
+def _count_parts(body: Dict[str, Any]) -> Dict[str, int]:
+    counts = {"text_chars": 0, "images": 0}
+    for content in body.get("contents", []):
+        for part in content.get("parts", []):
+            if "text" in part:
+                counts["text_chars"] += len(part["text"])
+            elif "inline_data" in part or "inlineData" in part:
+                counts["images"] += 1
+    return counts
+
+def _response(text: str, prompt_chars: int, finished: bool = True) -> Dict[str, Any]:
+    candidate = {"content": {"parts": [{"text": text}], "role": "model"}, "index": 0}
+    if finished:
+        candidate["finishReason"] = "STOP"
+    return {
+        "candidates": [candidate],
+        "usageMetadata": {"promptTokenCount": prompt_chars // 4, "candidatesTokenCount": len(text) // 4, "totalTokenCount": (prompt_chars + len(text)) // 4},
+    }
+
+def _delay_ms() -> float:
+    delay_ms = max(0.0, latency_ms + random.uniform(-jitter_ms, jitter_ms))
+    if random.random() < slow_rate:
+        delay_ms += slow_ms
+    return delay_ms
+
+def _injected_error(model: str) -> Optional[JSONResponse]:
+    """A 503 in the Gemini error format for unavailable models and `error_rate` of the requests."""
+    global errors_returned
+    if model not in unavailable_models and random.random() >= error_rate:
+        return None
+    errors_returned += 1
+    return JSONResponse(status_code=503, content={"error": {"code": 503, "message": f"{model} is overloaded (stub)", "status": "UNAVAILABLE"}})
+
+@app.post("/v1beta/models/{model}:generateContent")
+async def generate_content(model: str, request: Request):
+    """Returns a canned answer in the Gemini response format after the simulated latency."""
+    global requests_served
+    counts = _count_parts(await request.json())
+    error = _injected_error(model)
+    if error is not None:
+        return error
+    delay_ms = _delay_ms()
+    await asyncio.sleep(delay_ms / 1000)
+    requests_served += 1
+    text = f"Stub answer from {model} ({counts['text_chars']} prompt characters, {counts['images']} images, {delay_ms:.0f} ms)."
+    return _response(text, counts["text_chars"])
+
+@app.post("/v1beta/models/{model}:streamGenerateContent")
+async def stream_generate_content(model: str, request: Request):
+    """
+    Streams the canned answer word by word as a JSON array of responses (the
+    REST streaming format). The first word arrives after a quarter of the
+    simulated latency, the rest are spread over the remainder.
+    """
+    counts = _count_parts(await request.json())
+    error = _injected_error(model)
+    if error is not None:
+        return error
+    delay_ms = _delay_ms()
+    words = f"Stub answer from {model} ({counts['text_chars']} prompt characters, {counts['images']} images, {delay_ms:.0f} ms).".split(" ")
+
+    async def chunks():
+        global requests_served
+        await asyncio.sleep(delay_ms / 4000)
+        yield "["
+        for i, word in enumerate(words):
+            if i:
+                await asyncio.sleep(delay_ms * 3 / 4000 / len(words))
+            last = i == len(words) - 1
+            yield ("," if i else "") + json.dumps(_response(word if last else word + " ", counts["text_chars"], finished=last))
+        yield "]"
+        requests_served += 1
+
+    return StreamingResponse(chunks(), media_type="application/json")
+
+@app.get("/stats")
+def read_stats():
+    return {
+        "requests_served": requests_served, "errors_returned": errors_returned, "latency_ms": latency_ms, "jitter_ms": jitter_ms,
+        "error_rate": error_rate, "slow_rate": slow_rate, "slow_ms": slow_ms, "unavailable_models": unavailable_models,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stub Gemini API server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency-ms", type=float, default=latency_ms)
+    parser.add_argument("--jitter-ms", type=float, default=jitter_ms)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 503")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="share of requests delayed by --slow-ms")
+    parser.add_argument("--slow-ms", type=float, default=0.0)
+    parser.add_argument("--unavailable", nargs="+", default=[], metavar="MODEL", help="models that always answer 503")
+    args = parser.parse_args()
+    latency_ms, jitter_ms = args.latency_ms, args.jitter_ms
+    error_rate, slow_rate, slow_ms, unavailable_models = args.error_rate, args.slow_rate, args.slow_ms, args.unavailable
+    uvicorn.run(app, host=args.host, port=args.port)
@@ -0,0 +1,357 @@
+# src/tables.py
+"""
+Direct lookups in the performance tables of the manual.
+
+At ingestion, the words of each field/climb limit and landing limit page are
+grouped into visual rows (`document_processor.word_rows`) and parsed here
+into numeric grids, which are stored in the metadata of the page's
+performance_table chunk ("table_grid"). At query time, `TableIndex` extracts
+the table parameters from the question (pressure altitude, OAT, field
+length, runway condition) and, when they pin down a known table, reads or
+interpolates the value directly. Anything it cannot answer with certainty
+is left to retrieval and the LLM.
+"""
+import re
+import numpy as np
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import List, Dict, Any, Optional, Tuple, Sequence
+
+# Table types (see `document_processor.detect_performance_table`) that are parsed into grids.
+GRID_TABLE_TYPES = ("field_climb_limits", "landing_limits")
+
+# Column headers of each grid: OAT in °C across field/climb limit tables,
+# pressure altitude in feet across landing limit tables.
+HEADER_RANGES = {"field_climb_limits": (-60.0, 60.0), "landing_limits": (0.0, 15000.0)}
+FIELD_LENGTH_RANGE = (500.0, 6000.0)  # row labels: (corrected) field length in meters
+WEIGHT_RANGE = (20.0, 120.0)  # cells: weights in 1000 KG
+
+_NUMBER_RE = re.compile(r"^-?\d+(?:\.\d+)?$")
+
+# Corrections the grids do not hold; questions mentioning them go to the LLM.
+_UNSUPPORTED_TERMS = ("wind", "slope", "anti-ice", "anti ice", "bleed", "packs", "obstacle", "brake", "adjust")
+
+# A visual row of a page: (x center, word) pairs from left to right.
+WordRow = List[Tuple[float, str]]
+
+def _number(word: str) -> Optional[float]:
+    word = word.replace("−", "-").replace("–", "-").replace(",", "").strip("|")
+    return float(word) if _NUMBER_RE.match(word) else None
+
+def _numbers(row: WordRow) -> List[Tuple[float, float, bool]]:
+    """(x, value, is_decimal) of the numeric words of a row."""
+    numbers = []
+    for x, word in row:
+        value = _number(word)
+        if value is not None:
+            numbers.append((x, value, "." in word))
+    return numbers
+
+def _find_header(rows: Sequence[WordRow], low: float, high: float, prefer_celsius: bool) -> Optional[int]:
+    """Index of the row holding the column values: 3+ increasing integers in [low, high] and nothing else numeric."""
+    candidates = []
+    for i, row in enumerate(rows):
+        numbers = _numbers(row)
+        values = [value for _, value, _ in numbers]
+        if (len(values) >= 3 and not any(is_decimal for _, _, is_decimal in numbers)
+                and all(low <= value <= high for value in values) and all(a < b for a, b in zip(values, values[1:]))):
+            candidates.append(i)
+    if prefer_celsius:
+        # Field/climb limit tables repeat the OAT in °F; use the °C row.
+        for i in candidates:
+            if any("°C" in word or word.upper() in ("C", "(C)", "(°C)") for _, word in rows[i]):
+                return i
+    return candidates[0] if candidates else None
+
+def _align(numbers: List[Tuple[float, float, bool]], column_x: np.ndarray, tolerance: float) -> List[Optional[float]]:
+    """Places each value under the nearest column header; values between columns are dropped."""
+    cells: List[Optional[float]] = [None] * len(column_x)
+    for x, value, _ in numbers:
+        column = int(np.argmin(np.abs(column_x - x)))
+        if abs(column_x[column] - x) <= tolerance and cells[column] is None:
+            cells[column] = value
+    return cells
+
+def parse_table_grid(table_type: str, rows: Sequence[WordRow]) -> Optional[Dict[str, Any]]:
+    """
+    Parses the word rows of a performance table page into a numeric grid.
+
+    Returns:
+        A JSON-serializable dict with "row_values" (field lengths, m),
+        "column_values" (OAT °C or pressure altitude ft), "weights" (one list
+        per row, None for empty cells) and, for field/climb limit tables,
+        "climb_limit" (one value per column). None if no grid is found.
+    """
+    if table_type not in HEADER_RANGES:
+        return None
+    header = _find_header(rows, *HEADER_RANGES[table_type], prefer_celsius=table_type == "field_climb_limits")
+    if header is None:
+        return None
+    header_numbers = _numbers(rows[header])
+    column_x = np.array([x for x, _, _ in header_numbers])
+    column_values = [value for _, value, _ in header_numbers]
+    tolerance = 0.75 * float(np.min(np.diff(column_x))) if len(column_x) > 1 else 0.0
+
+    row_values, weights, climb_limit = [], [], None
+    for row in rows[header + 1:]:
+        numbers = _numbers(row)
+        cells = [number for number in numbers if number[2] and WEIGHT_RANGE[0] <= number[1] <= WEIGHT_RANGE[1]]
+        if len(cells) < 2:
+            continue
+        label = numbers[0]
+        is_climb_row = any("climb" in word.lower() for _, word in row) or (label[2] and bool(row_values))
+        if table_type == "field_climb_limits" and is_climb_row:
+            if climb_limit is None:
+                climb_limit = _align(cells, column_x, tolerance)
+        elif not label[2] and FIELD_LENGTH_RANGE[0] <= label[1] <= FIELD_LENGTH_RANGE[1]:
+            row_values.append(label[1])
+            weights.append(_align(cells, column_x, tolerance))
+
+    if len(row_values) < 2 or len(set(row_values)) != len(row_values):
+        return None
+    order = np.argsort(row_values, kind="stable")
+    grid = {"row_values": [row_values[i] for i in order], "column_values": column_values, "weights": [weights[i] for i in order]}
+    if climb_limit is not None:
+        grid["climb_limit"] = climb_limit
+    return grid
+
+
+def _bracket(axis: np.ndarray, x: float) -> Optional[Tuple[int, int, float]]:
+    """(i, j, w) such that x = (1 - w) * axis[i] + w * axis[j]; None outside the axis."""
+    if len(axis) == 0 or x < axis[0] or x > axis[-1]:
+        return None
+    j = int(np.searchsorted(axis, x))
+    if axis[j] == x:
+        return j, j, 0.0
+    return j - 1, j, float((x - axis[j - 1]) / (axis[j] - axis[j - 1]))
+
+def _interpolate(axis: np.ndarray, values: np.ndarray, x: float) -> Optional[float]:
+    """Linear interpolation that refuses to extrapolate or to use empty (NaN) cells."""
+    bracket = _bracket(axis, x)
+    if bracket is None:
+        return None
+    i, j, w = bracket
+    value = (1 - w) * values[i] + w * values[j]
+    return None if np.isnan(value) else float(value)
+
+
+@dataclass
+class PerformanceTable:
+    """The numeric grid of one performance table page."""
+    table_type: str
+    page_number: int
+    altitude_ft: Optional[float]
+    runway_condition: Optional[str]
+    flap_setting: Optional[str]
+    row_values: np.ndarray  # field length (m), increasing
+    column_values: np.ndarray  # OAT (°C) or pressure altitude (ft), increasing
+    weights: np.ndarray  # (rows, columns), 1000 KG, NaN for empty cells
+    climb_limit: Optional[np.ndarray]  # (columns,)
+
+    @classmethod
+    def from_chunk(cls, chunk: Dict[str, Any]) -> Optional["PerformanceTable"]:
+        metadata = chunk.get("metadata", {})
+        grid = metadata.get("table_grid")
+        if not grid:
+            return None
+        to_array = lambda values: np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+        altitude = metadata.get("altitude")
+        return cls(
+            table_type=metadata["table_type"], page_number=chunk["page_number"],
+            altitude_ft=float(altitude) if altitude is not None else None,
+            runway_condition=metadata.get("runway_condition"), flap_setting=metadata.get("flap_setting"),
+            row_values=to_array(grid["row_values"]), column_values=to_array(grid["column_values"]),
+            weights=np.stack([to_array(row) for row in grid["weights"]]),
+            climb_limit=to_array(grid["climb_limit"]) if grid.get("climb_limit") else None,
+        )
+
+    def weight(self, row: float, column: float) -> Optional[float]:
+        """Bilinear interpolation of the weight grid at (field length, column value)."""
+        row_bracket = _bracket(self.row_values, row)
+        if row_bracket is None:
+            return None
+        i, j, w = row_bracket
+        low = _interpolate(self.column_values, self.weights[i], column)
+        high = _interpolate(self.column_values, self.weights[j], column)
+        if low is None or high is None:
+            return None
+        return (1 - w) * low + w * high
+
+    def climb_limit_weight(self, oat_c: float) -> Optional[float]:
+        if self.climb_limit is None:
+            return None
+        return _interpolate(self.column_values, self.climb_limit, oat_c)
+
+
+@dataclass
+class TableQuery:
+    """The table parameters found in a question."""
+    quantity: str  # "climb_limit", "field_limit" or "landing_limit"
+    altitude_ft: Optional[float] = None
+    oat_c: Optional[float] = None
+    field_length_m: Optional[float] = None
+    runway_condition: Optional[str] = None
+    flap_setting: Optional[str] = None
+
+_ALTITUDE_RE = re.compile(r"(-?\d[\d,]*)\s*(?:ft|feet|foot)\b", re.IGNORECASE)
+_TEMPERATURE_RE = re.compile(r"(-?\d+(?:\.\d+)?)\s*(?:°|º|deg(?:rees?)?)?\s*([CF])\b", re.IGNORECASE)
+_OAT_RE = re.compile(r"\boat\s*(?:of|is|=|:)?\s*(-?\d+(?:\.\d+)?)", re.IGNORECASE)
+_LENGTH_RE = re.compile(r"(\d[\d,]*)\s*(?:m|meters?|metres?)\b", re.IGNORECASE)
+_FLAPS_RE = re.compile(r"\bflaps?\s*(\d+)", re.IGNORECASE)
+
+def parse_table_query(question: str) -> Optional[TableQuery]:
+    """
+    Extracts the table parameters of a weight-limit question, e.g. "climb
+    limit weight at 2000 ft, dry, 50°C". Returns None for other questions and
+    for questions involving corrections the grids do not hold (wind, slope,
+    anti-ice, ...).
+    """
+    text = question.replace("−", "-").replace("–", "-")
+    lower = text.lower()
+    if "climb limit" in lower:
+        quantity = "climb_limit"
+    elif "landing" in lower and ("field limit" in lower or "limit weight" in lower):
+        quantity = "landing_limit"
+    elif "field limit" in lower:
+        quantity = "field_limit"
+    else:
+        return None
+    if any(term in lower for term in _UNSUPPORTED_TERMS):
+        return None
+
+    query = TableQuery(quantity)
+    altitude = _ALTITUDE_RE.search(text)
+    if altitude:
+        query.altitude_ft = float(altitude.group(1).replace(",", ""))
+    elif "sea level" in lower:
+        query.altitude_ft = 0.0
+    temperature = _TEMPERATURE_RE.search(text)
+    if temperature:
+        value = float(temperature.group(1))
+        query.oat_c = value if temperature.group(2).upper() == "C" else (value - 32) * 5 / 9
+    else:
+        oat = _OAT_RE.search(text)
+        if oat:
+            query.oat_c = float(oat.group(1))
+    length = _LENGTH_RE.search(text)
+    if length:
+        query.field_length_m = float(length.group(1).replace(",", ""))
+    if re.search(r"\bwet\b", lower):
+        query.runway_condition = "wet"
+    elif re.search(r"\bdry\b", lower):
+        query.runway_condition = "dry"
+    flaps = _FLAPS_RE.search(text)
+    if flaps:
+        query.flap_setting = flaps.group(1)
+    return query
+
+
+@dataclass
+class TableAnswer:
+    """An answer read from performance tables, with the pages it comes from."""
+    answer: str
+    value: float
+    table: str
+    sources: List[Dict[str, Any]]
+
+
+class TableIndex:
+    """
+    The performance table grids of a manual, grouped by table type and
+    runway condition and sorted by pressure altitude.
+    """
+
+    def __init__(self, tables: List[PerformanceTable]):
+        self.tables = tables
+        self._groups: Dict[Tuple[str, Optional[str]], List[PerformanceTable]] = defaultdict(list)
+        for table in tables:
+            self._groups[(table.table_type, table.runway_condition)].append(table)
+        for group in self._groups.values():
+            group.sort(key=lambda table: (table.altitude_ft is None, table.altitude_ft or 0.0))
+
+    @classmethod
+    def from_chunks(cls, chunks: Sequence[Dict[str, Any]]) -> "TableIndex":
+        types = getattr(chunks, "types", None)
+        positions = range(len(chunks)) if types is None else [i for i, chunk_type in enumerate(types) if chunk_type == "performance_table"]
+        tables = []
+        for i in positions:
+            chunk = chunks[i]
+            if chunk.get("type") == "performance_table":
+                table = PerformanceTable.from_chunk(chunk)
+                if table is not None:
+                    tables.append(table)
+        return cls(tables)
+
+    def __len__(self) -> int:
+        return len(self.tables)
+
+    def _candidates(self, table_type: str, query: TableQuery) -> Optional[List[PerformanceTable]]:
+        """The tables of the only runway condition/flap setting matching the query, or None if ambiguous."""
+        groups = [key for key in self._groups if key[0] == table_type and (query.runway_condition is None or key[1] in (None, query.runway_condition))]
+        if len(groups) != 1:
+            return None
+        tables = [table for table in self._groups[groups[0]] if query.flap_setting is None or table.flap_setting in (None, query.flap_setting)]
+        altitudes = [table.altitude_ft for table in tables]
+        if len(set(altitudes)) != len(altitudes):
+            return None  # e.g. several flap settings at one altitude and the question names none
+        return tables
+
+    def _across_altitudes(self, tables: List[PerformanceTable], altitude_ft: float, read) -> Optional[Tuple[float, List[int]]]:
+        """Reads each bracketing altitude's table and interpolates linearly in altitude."""
+        altitudes = np.array([table.altitude_ft for table in tables], dtype=np.float64)
+        bracket = _bracket(altitudes, altitude_ft)
+        if bracket is None:
+            return None
+        i, j, w = bracket
+        low, high = read(tables[i]), read(tables[j])
+        if low is None or high is None:
+            return None
+        pages = sorted({tables[i].page_number, tables[j].page_number})
+        return (1 - w) * low + w * high, pages
+
+    def lookup(self, query: TableQuery) -> Optional[Tuple[float, str, List[int]]]:
+        """Returns (weight in 1000 KG, table type, pages) or None if the tables cannot answer."""
+        if query.quantity == "landing_limit":
+            tables = self._candidates("landing_limits", query)
+            if not tables or len(tables) != 1 or query.field_length_m is None or query.altitude_ft is None:
+                return None
+            value = tables[0].weight(query.field_length_m, query.altitude_ft)
+            return None if value is None else (value, "landing_limits", [tables[0].page_number])
+
+        tables = self._candidates("field_climb_limits", query)
+        if not tables or query.altitude_ft is None or query.oat_c is None or any(table.altitude_ft is None for table in tables):
+            return None
+        if query.quantity == "climb_limit":
+            result = self._across_altitudes(tables, query.altitude_ft, lambda table: table.climb_limit_weight(query.oat_c))
+        elif query.field_length_m is not None:
+            result = self._across_altitudes(tables, query.altitude_ft, lambda table: table.weight(query.field_length_m, query.oat_c))
+        else:
+            return None
+        return None if result is None else (result[0], "field_climb_limits", result[1])
+
+    def answer(self, question: str) -> Optional[TableAnswer]:
+        """Answers a weight-limit question from the tables, or returns None to fall back to the LLM."""
+        if not self.tables:
+            return None
+        query = parse_table_query(question)
+        if query is None:
+            return None
+        found = self.lookup(query)
+        if found is None:
+            return None
+        value, table_type, pages = found
+        name = {"climb_limit": "Climb limit weight", "field_limit": "Field limit weight", "landing_limit": "Landing field limit weight"}[query.quantity]
+        conditions = [f"{query.altitude_ft:g} FT pressure altitude"]
+        if query.field_length_m is not None:
+            conditions.append(f"{query.field_length_m:g} M field length")
+        if query.oat_c is not None and query.quantity != "landing_limit":
+            conditions.append(f"OAT {query.oat_c:g} °C")
+        runway = next((table.runway_condition for table in self.tables if table.page_number == pages[0]), None)
+        if runway:
+            conditions.append(f"{runway} runway")
+        if len(pages) == 1:
+            where = f"the performance table on page {pages[0]}"
+        else:
+            where = f"the performance tables on pages {pages[0]} and {pages[1]} (interpolated in altitude)"
+        answer = f"{name}: {value:.1f} (1000 KG) at {', '.join(conditions)}, from {where}."
+        return TableAnswer(answer, value, table_type, [{"page": page, "score": 1.0} for page in pages])
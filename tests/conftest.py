@@ -0,0 +1,5 @@
+import os
+
+# src.config refuses to import without these; the tests never read the files or call Gemini.
+for name in ("GEMINI_API_KEY", "FAISS_INDEX_PATH", "BM25_INDEX_PATH", "CHUNKS_PATH"):
+    os.environ.setdefault(name, "unused-in-tests")
@@ -0,0 +1,115 @@
+import numpy as np
+import pytest
+from src import cache
+from src.cache import AnswerCache, question_quantities
+
+SCOPE = (("default",), 5)
+VERSIONS = {"default": "v1"}
+SOURCES = [{"page": 83, "score": 0.9, "manual": "default"}, {"page": 84, "score": 0.7, "manual": "default"}]
+
+
+class Clock:
+    def __init__(self, now: float = 1_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, "time", clock)
+    return clock
+
+def unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+EMBEDDING = unit([1.0, 0.0, 0.0, 0.0])
+NEAR = unit([1.0, 0.1, 0.0, 0.0])  # cosine ~0.995 with EMBEDDING
+FAR = unit([1.0, 1.0, 0.0, 0.0])  # cosine ~0.71
+
+
+def test_exact_hit_ignores_case_spacing_and_punctuation(clock):
+    answers = AnswerCache(max_entries=8, ttl_s=60, threshold=0.95)
+    answers.put("What is the climb limit weight?", SCOPE, "52,000 kg", SOURCES, EMBEDDING, VERSIONS)
+
+    entry = answers.get_exact("  what is the  CLIMB limit weight ", SCOPE, VERSIONS)
+    assert entry is not None and entry.answer == "52,000 kg"
+    assert answers.get_exact("What is the climb limit weight?", (("other",), 5), VERSIONS) is None
+    assert answers.stats()["exact_hits"] == 1
+
+def test_semantic_hit_needs_similar_question_and_same_pages(clock):
+    answers = AnswerCache(max_entries=8, ttl_s=60, threshold=0.95)
+    answers.put("What is the climb limit weight?", SCOPE, "52,000 kg", SOURCES, EMBEDDING, VERSIONS)
+
+    entry = answers.get_similar("What's the climb limit weight?", NEAR, list(reversed(SOURCES)), SCOPE, VERSIONS)
+    assert entry is not None and entry.answer == "52,000 kg"
+    assert answers.get_similar("What is the climb limit weight?", FAR, SOURCES, SCOPE, VERSIONS) is None
+    assert answers.get_similar("What's the climb limit weight?", NEAR, SOURCES[:1], SCOPE, VERSIONS) is None
+    assert answers.get_similar("What's the climb limit weight?", NEAR, SOURCES, (("other",), 5), VERSIONS) is None
+    stats = answers.stats()
+    assert (stats["semantic_hits"], stats["misses"]) == (1, 3)
+
+def test_entries_expire_after_ttl(clock):
+    answers = AnswerCache(max_entries=8, ttl_s=60, threshold=0.95)
+    answers.put("What is the climb limit weight?", SCOPE, "52,000 kg", SOURCES, EMBEDDING, VERSIONS)
+
+    clock.now += 60
+    assert answers.get_exact("What is the climb limit weight?", SCOPE, VERSIONS) is not None
+    clock.now += 1
+    assert answers.get_similar("What's the climb limit weight?", NEAR, SOURCES, SCOPE, VERSIONS) is None
+    assert answers.get_exact("What is the climb limit weight?", SCOPE, VERSIONS) is None
+    assert answers.stats()["expirations"] == 1
+    assert answers.stats()["entries"] == 0
+
+def test_new_index_version_invalidates_entries(clock):
+    answers = AnswerCache(max_entries=8, ttl_s=60, threshold=0.95)
+    answers.put("What is the climb limit weight?", SCOPE, "52,000 kg", SOURCES, EMBEDDING, VERSIONS)
+
+    swapped = {"default": "v2"}
+    assert answers.get_similar("What's the climb limit weight?", NEAR, SOURCES, SCOPE, swapped) is None
+    assert answers.get_exact("What is the climb limit weight?", SCOPE, swapped) is None
+    assert answers.get_exact("What is the climb limit weight?", SCOPE, VERSIONS) is None
+
+def test_invalidate_drops_only_entries_of_the_manual(clock):
+    answers = AnswerCache(max_entries=8, ttl_s=60, threshold=0.95)
+    answers.put("Question one", SCOPE, "one", SOURCES, EMBEDDING, VERSIONS)
+    answers.put("Question two", (("max",), 5), "two", SOURCES, FAR, {"max": "v1"})
+
+    answers.invalidate("default")
+    assert answers.get_exact("Question one", SCOPE, VERSIONS) is None
+    assert answers.get_exact("Question two", (("max",), 5), {"max": "v1"}) is not None
+    assert answers.stats()["invalidations"] == 1
+
+def test_least_recently_used_entries_are_evicted(clock):
+    answers = AnswerCache(max_entries=2, ttl_s=60, threshold=0.95)
+    answers.put("Question one", SCOPE, "one", SOURCES, EMBEDDING, VERSIONS)
+    answers.put("Question two", SCOPE, "two", SOURCES, FAR, VERSIONS)
+    answers.get_exact("Question one", SCOPE, VERSIONS)
+    answers.put("Question three", SCOPE, "three", SOURCES, NEAR, VERSIONS)
+
+    assert answers.get_exact("Question two", SCOPE, VERSIONS) is None
+    assert answers.get_exact("Question one", SCOPE, VERSIONS) is not None
+    assert answers.stats()["evictions"] == 1
+
+def test_disabled_cache_stores_nothing(clock):
+    answers = AnswerCache(max_entries=0)
+    answers.put("What is the climb limit weight?", SCOPE, "52,000 kg", SOURCES, EMBEDDING, VERSIONS)
+    assert answers.get_exact("What is the climb limit weight?", SCOPE, VERSIONS) is None
+    assert answers.get_similar("What is the climb limit weight?", EMBEDDING, SOURCES, SCOPE, VERSIONS) is None
+
+def test_questions_differing_in_one_value_miss(clock):
+    answers = AnswerCache(max_entries=8, ttl_s=60, threshold=0.95)
+    answers.put("Climb limit weight at 2,000 ft, dry, 50°C?", SCOPE, "52,000 kg", SOURCES, EMBEDDING, VERSIONS)
+
+    assert answers.get_similar("Climb limit weight at 2,000 ft, dry, 40°C?", NEAR, SOURCES, SCOPE, VERSIONS) is None
+    entry = answers.get_similar("What's the climb limit weight for a dry runway, 50 C and 2000 feet?", NEAR, SOURCES, SCOPE, VERSIONS)
+    assert entry is not None and entry.answer == "52,000 kg"
+
+def test_question_quantities():
+    assert question_quantities("Climb limit weight at 2,000 ft, dry, 50°C?") == ("2000ft", "50c")
+    assert question_quantities("at 2000 feet and 50 C") == ("2000ft", "50c")
+    assert question_quantities("Flaps 15 takeoff at -5°C") == ("-5c", "15")
+    assert question_quantities("What is V1 for a 737-800?") == ("737", "800")
+    assert question_quantities("What is V1?") == ()
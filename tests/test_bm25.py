@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+from rank_bm25 import BM25Okapi
+from src.benchmark import make_synthetic_corpus
+from src.indexer import BM25Index
+
+CORPUS = [
+    "check the flap position before takeoff".split(),
+    "flap retraction speed depends on the flap position and weight".split(),
+    "the anti ice must be on when icing conditions exist".split(),
+    "set takeoff thrust and check the engine instruments".split(),
+    "the landing gear must be down before landing".split(),
+    "engine anti ice on during takeoff in icing conditions".split(),
+]
+
+QUERIES = [
+    ["flap", "position"],
+    ["takeoff", "thrust"],
+    ["hydraulic", "pump"],              # no term in the corpus
+    ["flap", "hydraulic", "speed"],     # one term missing
+    ["flap", "flap", "position"],       # repeated term
+    ["the", "engine", "the"],           # repeated term with a floored IDF
+    [],
+]
+
+
+def _assert_top_k_matches_full_sort(index, query, k):
+    scores = index.get_scores(query)
+    ids, top_scores = index.get_top_k(query, k)
+    expected = np.sort(scores)[::-1][:len(top_scores)]
+
+    assert np.allclose(top_scores, expected)
+    assert np.allclose(scores[ids], top_scores)
+    assert len(set(ids.tolist())) == len(ids)
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_get_scores_matches_bm25okapi(query):
+    okapi = BM25Okapi(CORPUS)
+    index = BM25Index.from_corpus(CORPUS)
+
+    assert np.allclose(index.get_scores(query), okapi.get_scores(query))
+    assert np.allclose(index.get_batch_scores(query, [0, 2, 5]), okapi.get_batch_scores(query, [0, 2, 5]))
+
+def test_from_bm25okapi_matches_from_corpus():
+    okapi = BM25Okapi(CORPUS)
+    converted = BM25Index.from_bm25okapi(okapi)
+    built = BM25Index.from_corpus(CORPUS)
+
+    for query in QUERIES:
+        assert np.allclose(converted.get_scores(query), built.get_scores(query))
+
+def test_get_scores_batch_matches_get_scores():
+    index = BM25Index.from_corpus(CORPUS)
+    batch = index.get_scores_batch(QUERIES)
+
+    for row, query in enumerate(QUERIES):
+        assert np.allclose(batch[row], index.get_scores(query))
+
+def test_negative_idf_matches_bm25okapi():
+    # Most terms are in every document, so the average IDF and the epsilon
+    # floor given to those terms are negative.
+    corpus = [["a", "b", "c"], ["a", "b", "d"], ["a", "b", "e"]]
+    okapi = BM25Okapi(corpus)
+    index = BM25Index.from_corpus(corpus)
+
+    assert index.has_negative_impacts
+    for query in (["a"], ["a", "c"], ["c", "b", "b"], ["z"]):
+        assert np.allclose(index.get_scores(query), okapi.get_scores(query))
+        _assert_top_k_matches_full_sort(index, query, 2)
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_get_scores_matches_bm25okapi_on_synthetic_corpus(seed):
+    corpus, vocab, probs = make_synthetic_corpus(300, vocab_size=2_000, seed=seed)
+    okapi = BM25Okapi(corpus)
+    index = BM25Index.from_corpus(corpus)
+    rng = np.random.default_rng(seed)
+
+    for _ in range(20):
+        query = rng.choice(vocab, size=4, p=probs).tolist() + ["missing"]
+        assert np.allclose(index.get_scores(query), okapi.get_scores(query))
+
+@pytest.mark.parametrize("k", [1, 5, 50, 1_000])
+@pytest.mark.parametrize("seed", [0, 1])
+def test_get_top_k_matches_full_sort(k, seed):
+    corpus, vocab, probs = make_synthetic_corpus(500, vocab_size=2_000, seed=seed)
+    index = BM25Index.from_corpus(corpus)
+    rng = np.random.default_rng(seed)
+
+    assert not index.has_negative_impacts
+    for size in (1, 3, 6):
+        query = rng.choice(vocab, size=size, p=probs).tolist()
+        _assert_top_k_matches_full_sort(index, query, k)
+        _assert_top_k_matches_full_sort(index, query + query[:1], k)
+
+def test_get_top_k_returns_only_matching_documents():
+    index = BM25Index.from_corpus(CORPUS)
+
+    ids, scores = index.get_top_k(["landing"], 5)
+    assert ids.tolist() == [4]
+    assert len(scores) == 1
+    assert len(index.get_top_k(["hydraulic"], 5)[0]) == 0
+    assert len(index.get_top_k(["flap"], 0)[0]) == 0
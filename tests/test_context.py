@@ -0,0 +1,82 @@
+from src.context import MIN_BLOCK_TOKENS, assemble_context, estimate_tokens, overlap_length, page_image_tokens, trim_overlaps
+
+
+def text_result(page, content, score=1.0, manual=None):
+    result = {"page_number": page, "type": "text", "has_image": False, "content": content, "score": score}
+    if manual is not None:
+        result["manual"] = manual
+    return result
+
+def visual_result(page, content="Takeoff speeds diagram", score=1.0):
+    return {"page_number": page, "type": "visual", "has_image": True, "content": content, "score": score}
+
+def words(prefix, count):
+    return " ".join(f"{prefix}{i}" for i in range(count))
+
+
+def test_everything_fits_within_budget():
+    results = [text_result(1, words("a", 20), 0.9), text_result(2, words("b", 20), 0.8)]
+    context, visual_parts, sources, used = assemble_context(results, max_tokens=8000)
+
+    assert context == f"[Page 1]\n{words('a', 20)}\n\n---\n\n[Page 2]\n{words('b', 20)}"
+    assert visual_parts == []
+    assert sources == [{"page": 1, "score": 0.9}, {"page": 2, "score": 0.8}]
+    assert used <= 8000
+
+def test_token_budget_truncates_then_skips():
+    results = [text_result(page, words(f"p{page}x", 350)) for page in (1, 2, 3)]
+    context, _, sources, used = assemble_context(results, max_tokens=1000)
+
+    assert used <= 1000
+    assert "[Page 1]" in context and "[Page 2]" in context and "[Page 3]" not in context
+    assert len(context.split("\n\n---\n\n")[1]) < len("[Page 2]\n" + words("p2x", 350))
+    # Every retrieved page is cited, whether or not its text fitted.
+    assert [source["page"] for source in sources] == [1, 2, 3]
+
+def test_first_page_is_always_included():
+    content = words("long", 2000)
+    context, _, sources, used = assemble_context([text_result(7, content)], max_tokens=10)
+
+    assert context.startswith("[Page 7]\n")
+    assert len(context) - len("[Page 7]\n") == MIN_BLOCK_TOKENS * 4
+    assert sources == [{"page": 7, "score": 1.0}]
+    assert used > 10
+
+def test_first_visual_page_is_always_included():
+    _, visual_parts, sources, used = assemble_context([visual_result(3), visual_result(4)], max_tokens=10)
+
+    assert [part["page_number"] for part in visual_parts] == [3]
+    assert used == page_image_tokens() + estimate_tokens("Takeoff speeds diagram")
+    assert [source["page"] for source in sources] == [3, 4]
+
+def test_contained_text_is_dropped_but_its_page_cited():
+    results = [text_result(1, "Flaps 15 takeoff: retract to flaps 5 at V2 + 15 knots."), text_result(2, "retract to  flaps 5")]
+    context, _, sources, _ = assemble_context(results)
+
+    assert "[Page 2]" not in context
+    assert [source["page"] for source in sources] == [1, 2]
+
+def test_splitter_overlap_is_trimmed():
+    shared = "Set takeoff thrust and verify the engine indications are normal. "
+    first = words("start", 30) + " " + shared
+    second = shared + words("end", 30)
+    context, _, _, _ = assemble_context([text_result(1, first), text_result(2, second)])
+
+    assert context.count(shared.strip()) == 1
+    assert context.endswith(f"[Page 2]\n{words('end', 30)}")
+
+def test_overlap_length():
+    assert overlap_length("abc " + "x" * 30, "x" * 30 + " def") == 30
+    assert overlap_length("abc short", "short def") == 0
+    assert overlap_length("one " * 10, "two " * 10) == 0
+
+def test_trim_overlaps_cuts_both_ends():
+    block = "The anti-ice system must be on when icing conditions exist."
+    text = block[-30:] + " middle text " + block[:30]
+    assert trim_overlaps(text, [block]) == " middle text "
+
+def test_duplicate_pages_are_cited_once_with_manual():
+    results = [text_result(5, words("a", 10), 0.9, "ng"), text_result(5, words("b", 10), 0.5, "ng"), text_result(5, words("c", 10), 0.4, "max")]
+    _, _, sources, _ = assemble_context(results)
+
+    assert sources == [{"page": 5, "score": 0.9, "manual": "ng"}, {"page": 5, "score": 0.4, "manual": "max"}]
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+from src.benchmark import legacy_fuse_scores, make_synthetic_chunks, make_synthetic_scores
+from src.indexer import build_page_index
+from src.retriever import fuse_scores
+
+
+@pytest.mark.parametrize("num_chunks", [50, 1_000, 20_000])
+# Not alpha=0: pages without a BM25 match would tie at 0, in no defined order.
+@pytest.mark.parametrize("alpha", [0.3, 0.5, 0.7, 1.0])
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_fuse_scores_matches_legacy(num_chunks, alpha, seed):
+    top_k = 5
+    chunks = make_synthetic_chunks(num_chunks, seed=seed)
+    indices, distances, bm25_scores = make_synthetic_scores(num_chunks, top_k * 3, seed=seed)
+
+    legacy = legacy_fuse_scores(indices, distances, bm25_scores, chunks, top_k=top_k, alpha=alpha)
+    fused = fuse_scores(indices, distances, bm25_scores, build_page_index(chunks), top_k=top_k, alpha=alpha)
+
+    assert [idx for idx, _ in fused] == [idx for idx, _ in legacy]
+    assert np.allclose([score for _, score in fused], [score for _, score in legacy])
+
+def test_fuse_scores_returns_one_chunk_per_page():
+    chunks = make_synthetic_chunks(2_000)
+    indices, distances, bm25_scores = make_synthetic_scores(2_000, 30)
+    fused = fuse_scores(indices, distances, bm25_scores, build_page_index(chunks), top_k=10)
+
+    pages = [chunks[idx]["page_number"] for idx, _ in fused]
+    assert len(fused) == 10
+    assert len(set(pages)) == len(pages)
+    assert [score for _, score in fused] == sorted((score for _, score in fused), reverse=True)
+
+def test_fuse_scores_ignores_empty_faiss_slots():
+    chunks = make_synthetic_chunks(200)
+    indices, distances, bm25_scores = make_synthetic_scores(200, 15)
+    padded_indices = np.concatenate([indices, [-1, -1]])
+    padded_distances = np.concatenate([distances, np.full(2, np.finfo(np.float32).min, dtype=np.float32)])
+    page_index = build_page_index(chunks)
+
+    assert fuse_scores(padded_indices, padded_distances, bm25_scores, page_index) == fuse_scores(indices, distances, bm25_scores, page_index)
+
+def test_fuse_scores_respects_allowed_mask():
+    chunks = make_synthetic_chunks(1_000)
+    indices, distances, bm25_scores = make_synthetic_scores(1_000, 15)
+    allowed = np.zeros(1_000, dtype=bool)
+    allowed[::3] = True
+    fused = fuse_scores(indices, distances, bm25_scores, build_page_index(chunks), top_k=5, allowed=allowed)
+
+    assert fused
+    assert all(allowed[idx] for idx, _ in fused)
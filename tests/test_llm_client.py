@@ -0,0 +1,191 @@
+import asyncio
+import threading
+import time
+import pytest
+import requests
+from google.api_core import exceptions as api_exceptions
+from src.admission import AdmissionRejected
+from src.api import _generation_status
+from src.llm_client import FALLBACK_SHARE, HEDGE_MIN_SAMPLES, TIMEOUT_ERRORS, LLMClient
+
+
+class FakeModel:
+    """
+    Stands in for a `genai.GenerativeModel`: each call takes the next
+    (delay_s, outcome) of its script and returns the outcome after the delay,
+    or raises it when it is an exception. Like the SDK, a call gives up with
+    DeadlineExceeded once its request timeout has passed.
+    """
+
+    def __init__(self, *script):
+        self.script = list(script)
+        self.calls = 0
+        self.cancelled = 0
+        self._lock = threading.Lock()
+
+    def _next(self):
+        with self._lock:
+            self.calls += 1
+            return self.script.pop(0) if len(self.script) > 1 else self.script[0]
+
+    @staticmethod
+    def _outcome(outcome, delay, timeout):
+        if delay > timeout:
+            raise api_exceptions.DeadlineExceeded("request timed out")
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    def generate_content(self, prompt, stream=False, request_options=None):
+        delay, outcome = self._next()
+        timeout = request_options["timeout"]
+        time.sleep(min(delay, timeout))
+        return self._outcome(outcome, delay, timeout)
+
+    async def generate_content_async(self, prompt, stream=False, request_options=None):
+        delay, outcome = self._next()
+        timeout = request_options["timeout"]
+        try:
+            await asyncio.sleep(min(delay, timeout))
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return self._outcome(outcome, delay, timeout)
+
+
+def make_client(primary, fallback=None, timeout_s=2.0, hedge=True, latency_s=0.02, samples=HEDGE_MIN_SAMPLES):
+    client = LLMClient(model_name="primary", fallback_model="fallback" if fallback else "", timeout_s=timeout_s,
+                       retries=0, backoff_s=0.01, hedge=hedge, hedge_quantile=0.5, rest=False, workers=2)
+    client._models = {"primary": primary}
+    if fallback:
+        client._models["fallback"] = fallback
+    client._latencies.extend([latency_s] * samples)
+    return client
+
+
+def test_hedge_delay_needs_min_samples():
+    client = make_client(FakeModel((0, "ok")), samples=HEDGE_MIN_SAMPLES - 1)
+    assert client.hedge_delay() is None
+
+    client._latencies.append(0.02)
+    assert client.hedge_delay() == pytest.approx(0.02)
+    assert make_client(FakeModel((0, "ok")), hedge=False).hedge_delay() is None
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_no_hedge_before_min_samples(use_async):
+    primary = FakeModel((0.2, "slow"), (0, "fast"))
+    client = make_client(primary, samples=HEDGE_MIN_SAMPLES - 1)
+
+    answer = asyncio.run(client.generate_async("question")) if use_async else client.generate("question")
+    assert answer == "slow"
+    assert client.stats()["hedges"] == 0
+    assert primary.calls == 1
+
+def test_hedge_wins_when_primary_is_slow():
+    primary = FakeModel((0.5, "slow"), (0, "fast"))
+    client = make_client(primary)
+
+    assert client.generate("question") == "fast"
+    stats = client.stats()
+    assert (stats["hedges"], stats["hedge_wins"]) == (1, 1)
+    client.close()
+
+def test_async_hedge_cancels_the_loser():
+    primary = FakeModel((0.5, "slow"), (0, "fast"))
+    client = make_client(primary)
+
+    assert asyncio.run(client.generate_async("question")) == "fast"
+    stats = client.stats()
+    assert (stats["hedges"], stats["hedge_wins"]) == (1, 1)
+    assert primary.calls == 2
+    assert primary.cancelled == 1
+
+def test_no_hedge_when_primary_answers_in_time():
+    primary = FakeModel((0, "fast"))
+    client = make_client(primary, latency_s=0.2)
+
+    assert asyncio.run(client.generate_async("question")) == "fast"
+    assert client.stats()["hedges"] == 0
+    assert primary.calls == 1
+
+def test_fallback_for_text_prompts():
+    primary = FakeModel((0, api_exceptions.ServiceUnavailable("overloaded")))
+    fallback = FakeModel((0, "from fallback"))
+    client = make_client(primary, fallback, hedge=False)
+
+    assert client.generate("question") == "from fallback"
+    assert asyncio.run(client.generate_async("question")) == "from fallback"
+    assert client.stats()["fallbacks"] == 2
+
+def test_no_fallback_for_prompts_with_images():
+    primary = FakeModel((0, api_exceptions.ServiceUnavailable("overloaded")))
+    fallback = FakeModel((0, "from fallback"))
+    client = make_client(primary, fallback, hedge=False)
+    prompt = ["question", {"mime_type": "image/png", "data": b""}]
+
+    with pytest.raises(api_exceptions.ServiceUnavailable):
+        client.generate(prompt)
+    with pytest.raises(api_exceptions.ServiceUnavailable):
+        asyncio.run(client.generate_async(prompt))
+    assert fallback.calls == 0
+    assert client.stats()["failures"] == 2
+
+def test_no_fallback_for_other_errors():
+    primary = FakeModel((0, api_exceptions.InvalidArgument("bad request")))
+    fallback = FakeModel((0, "from fallback"))
+    client = make_client(primary, fallback, hedge=False)
+
+    with pytest.raises(api_exceptions.InvalidArgument):
+        client.generate("question")
+    assert fallback.calls == 0
+
+def test_deadlines():
+    client = make_client(FakeModel((0, "ok")), FakeModel((0, "ok")), timeout_s=4.0)
+    start = time.monotonic()
+
+    primary, fallback = client._deadlines("question")
+    assert primary - start == pytest.approx(4.0 * (1 - FALLBACK_SHARE), abs=0.05)
+    assert fallback - start == pytest.approx(4.0, abs=0.05)
+    primary, fallback = client._deadlines(["question", b"image"])
+    assert primary - start == pytest.approx(4.0, abs=0.05)
+    assert fallback is None
+    assert make_client(FakeModel((0, "ok")), timeout_s=4.0)._deadlines("question")[1] is None
+
+@pytest.mark.parametrize("hedge", [False, True])
+def test_timeout_when_the_deadline_passes(hedge):
+    primary = FakeModel((5, "too late"))
+    fallback = FakeModel((5, "too late"))
+    client = make_client(primary, fallback, timeout_s=0.3, hedge=hedge, latency_s=0.05)
+
+    start = time.monotonic()
+    with pytest.raises(TIMEOUT_ERRORS):
+        client.generate("question")
+    with pytest.raises(TIMEOUT_ERRORS):
+        asyncio.run(client.generate_async("question"))
+    assert time.monotonic() - start < 2 * 0.3 + 0.5
+    stats = client.stats()
+    assert (stats["fallbacks"], stats["timeouts"]) == (2, 2)
+    client.close()
+
+def test_fallback_keeps_its_share_of_the_deadline():
+    primary = FakeModel((5, "too late"))
+    fallback = FakeModel((0, "from fallback"))
+    client = make_client(primary, fallback, timeout_s=0.4, hedge=False)
+
+    start = time.monotonic()
+    assert asyncio.run(client.generate_async("question")) == "from fallback"
+    assert time.monotonic() - start == pytest.approx(0.4 * (1 - FALLBACK_SHARE), abs=0.1)
+
+@pytest.mark.parametrize("error, status", [
+    (TimeoutError("deadline"), 504),
+    (api_exceptions.DeadlineExceeded("deadline"), 504),
+    (requests.Timeout("deadline"), 504),
+    (api_exceptions.ServiceUnavailable("overloaded"), 502),
+    (api_exceptions.TooManyRequests("rate limited"), 502),
+    (requests.ConnectionError("reset"), 502),
+    (api_exceptions.InvalidArgument("bad request"), 500),
+    (ValueError("bug"), 500),
+    (AdmissionRejected("full"), 429),
+])
+def test_generation_status(error, status):
+    assert _generation_status(error) == status
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+from src.indexer import BM25Index, save_index_dir, tokenize
+from src.registry import IndexRegistry, ManualSpec
+
+
+def write_manual(path, texts, dim=8, seed=0):
+    """Writes an index directory with one chunk per text, one page per chunk."""
+    chunks = [{"content": text, "page_number": i + 1, "chunk_id": f"page_{i + 1}_chunk_0", "type": "text", "has_image": False, "metadata": {}}
+              for i, text in enumerate(texts)]
+    embeddings = np.random.default_rng(seed).standard_normal((len(texts), dim)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    save_index_dir(str(path), embeddings, BM25Index.from_corpus([tokenize(text) for text in texts]), chunks)
+
+V1 = ["flaps 15 takeoff retraction schedule", "climb limit weight table", "landing field limit"]
+V2 = ["flaps 15 takeoff retraction schedule revised", "climb limit weight table revised", "landing field limit revised", "brake cooling schedule"]
+
+@pytest.fixture
+def registry(tmp_path):
+    write_manual(tmp_path / "manual", V1)
+    registry = IndexRegistry({"default": ManualSpec("default", index_dir=str(tmp_path / "manual"))}, max_memory_bytes=1 << 40)
+    yield registry
+    registry.close()
+
+def probe(manual):
+    """The content of the chunk a fixed query finds in `manual`."""
+    _, ids = manual.index.search(np.ones((1, manual.index.d), dtype=np.float32), 1)
+    return manual.chunks[int(ids[0][0])]["content"]
+
+
+def test_snapshot_keeps_its_version_across_a_swap(registry, tmp_path):
+    snapshot = registry.snapshot()
+    old = snapshot.get("default")
+    write_manual(tmp_path / "manual", V2, seed=1)
+
+    new = registry.reload("default")
+    assert new is not None and new.version != old.version
+    assert registry.get("default") is new
+    assert snapshot.get("default") is old
+    assert snapshot.versions(["default"]) == {"default": old.version}
+
+    # The old version's files were replaced on disk, but its memory maps stay readable.
+    assert len(old.chunks) == len(V1)
+    assert probe(old) in V1
+    assert old.bm25.get_scores(tokenize("climb limit")).argmax() == 1
+    assert len(new.chunks) == len(V2) and probe(new) in V2
+
+    assert [retired["version"] for retired in registry.stats()["retired"]] == [old.version]
+    snapshot.close()
+    assert registry.stats()["retired"] == []
+    assert old.refs == 0 and new.refs == 0
+
+def test_snapshot_taken_after_a_swap_sees_the_new_version(registry, tmp_path):
+    registry.get("default")
+    write_manual(tmp_path / "manual", V2, seed=1)
+    new = registry.reload("default")
+
+    with registry.snapshot() as snapshot:
+        assert snapshot.get("default") is new
+        assert new.refs == 1
+    assert new.refs == 0
+    assert registry.stats()["retired"] == []
+
+def test_swapped_out_version_without_snapshots_is_dropped(registry, tmp_path):
+    registry.get("default")
+    write_manual(tmp_path / "manual", V2, seed=1)
+    registry.reload("default")
+    assert registry.stats()["retired"] == []
+    assert registry.stats()["swaps"] == 1
+
+def test_reload_without_changes_keeps_the_loaded_version(registry):
+    current = registry.get("default")
+    assert registry.reload("default") is None
+    assert registry.get("default") is current
+
+def test_failed_validation_keeps_the_old_version(registry, tmp_path):
+    with registry.snapshot() as snapshot:
+        old = snapshot.get("default")
+        write_manual(tmp_path / "manual", V2, dim=16, seed=1)
+        with pytest.raises(RuntimeError, match="embedding dimension"):
+            registry.reload("default")
+        assert registry.get("default") is old
+        assert snapshot.get("default") is old
+    assert registry.stats()["failed_swaps"] == 1
+    assert old.refs == 0
@@ -0,0 +1,186 @@
+import functools
+import hashlib
+import zlib
+import numpy as np
+import pytest
+import src.indexer as indexer
+import src.reindex as reindex
+from src.document_processor import chunk_page, detect_performance_table, make_splitter
+from src.indexer import chunk_vector_ids
+
+# The functions the tests point at a temporary directory.
+BUILD_FAISS_INDEX = indexer.build_faiss_index
+LOAD_INDEXES = indexer.load_indexes
+LOAD_MANIFEST = reindex.load_manifest
+SAVE_MANIFEST = reindex.save_manifest
+
+DIM = 16
+WORDS = ["flap", "thrust", "takeoff", "landing", "gear", "brake", "climb", "weight", "altitude", "runway",
+         "engine", "fuel", "pump", "hydraulic", "pressure", "speed", "anti", "ice", "check", "limit"]
+
+
+def make_page(page_number, seed, num_words=60, diagram=False):
+    """An analyzed page (as `analyze_page` returns it) with random words; long pages are split into several chunks."""
+    text = " ".join(np.random.default_rng(seed).choice(WORDS, size=num_words))
+    return {"page_number": page_number, "text": text, "char_count": len(text), "has_images": diagram,
+            "ink_density": 0.3 if diagram else 0.05, "is_blank": False, "is_diagram": diagram}
+
+def make_manual(num_pages=8):
+    """Page number -> page; page 2 is a diagram and page 4 is long enough for several chunks."""
+    return {n: make_page(n, seed=n, num_words=600 if n == 4 else 60, diagram=n == 2) for n in range(1, num_pages + 1)}
+
+def revise(pages, change):
+    pages = dict(pages)
+    if change == "edit_text":
+        pages[3] = make_page(3, seed=100)
+    elif change == "edit_long":
+        pages[4] = make_page(4, seed=101, num_words=400)
+    elif change == "edit_diagram":
+        pages[2] = make_page(2, seed=102, diagram=True)
+    elif change == "add":
+        pages[len(pages) + 1] = make_page(len(pages) + 1, seed=103, diagram=True)
+    elif change == "remove":
+        del pages[len(pages)]
+    return pages
+
+
+class HashEmbedder:
+    """Deterministic unit vectors derived from the text, in place of the sentence-transformer."""
+
+    def __init__(self):
+        self.encoded = 0
+
+    def encode(self, texts, **kwargs):
+        self.encoded += len(texts)
+        return np.stack([np.random.default_rng(zlib.crc32(text.encode())).standard_normal(DIM) for text in texts]).astype(np.float32)
+
+
+class FakeManuals:
+    """Stands in for the PDF functions `src.reindex` uses, reading pages from `self.versions[pdf_path]`."""
+
+    def __init__(self, versions):
+        self.versions = versions
+        self.rendered = []
+
+    def process_pdf(self, pdf_path, workers=None):
+        splitter = make_splitter()
+        pages = self.versions[pdf_path]
+        return [chunk for n in sorted(pages) for chunk in chunk_page(pages[n], detect_performance_table(pages[n]), splitter)]
+
+    def page_content_hashes(self, pdf_path):
+        pages = self.versions[pdf_path]
+        return {n: hashlib.sha1(f"{page['text']}|{page['is_diagram']}".encode()).hexdigest() for n, page in pages.items()}
+
+    def analyze_pages(self, pdf_path, page_numbers):
+        return [self.versions[pdf_path][n] for n in page_numbers]
+
+    def render_page_images(self, pdf_path, page_numbers):
+        self.rendered.extend(page_numbers)
+        return {n: b"PNG" + self.versions[pdf_path][n]["text"].encode() for n in page_numbers}
+
+
+@pytest.fixture
+def use_dir(monkeypatch):
+    """Returns a function pointing the indexer and re-indexer at the index files of a directory."""
+    def use(path, kind, index_dir):
+        faiss_path, bm25_path, chunks_path = str(path / "faiss.index"), str(path / "bm25.pkl"), str(path / "chunks.pkl")
+        directory = str(path / "index") if index_dir else ""
+        monkeypatch.setattr(indexer, "FAISS_INDEX_PATH", faiss_path)
+        monkeypatch.setattr(indexer, "BM25_INDEX_PATH", bm25_path)
+        monkeypatch.setattr(indexer, "CHUNKS_PATH", chunks_path)
+        monkeypatch.setattr(indexer, "INDEX_DIR", directory)
+        monkeypatch.setattr(reindex, "INDEX_DIR", directory)
+        build = functools.partial(BUILD_FAISS_INDEX, kind=kind)
+        monkeypatch.setattr(indexer, "build_faiss_index", build)
+        monkeypatch.setattr(reindex, "build_faiss_index", build)
+        load = functools.partial(LOAD_INDEXES, faiss_index_path=faiss_path, bm25_index_path=bm25_path, chunks_path=chunks_path, index_dir=directory)
+        monkeypatch.setattr(reindex, "load_indexes", load)
+        monkeypatch.setattr(reindex, "load_manifest", functools.partial(LOAD_MANIFEST, path=str(path / "manifest.json")))
+        monkeypatch.setattr(reindex, "save_manifest", functools.partial(SAVE_MANIFEST, path=str(path / "manifest.json")))
+        return load
+    return use
+
+def use_manuals(monkeypatch, manuals):
+    for name in ("process_pdf", "page_content_hashes", "analyze_pages", "render_page_images"):
+        monkeypatch.setattr(reindex, name, getattr(manuals, name))
+
+def stored_vectors(index):
+    if isinstance(index, indexer.IdMappedIndex):
+        return np.asarray(index.exact_vectors) if isinstance(index, indexer.RescoringIndex) else index.embeddings(index.chunk_ids)
+    return np.asarray(index.embeddings)
+
+
+@pytest.mark.parametrize("change", ["edit_text", "edit_long", "edit_diagram", "add", "remove"])
+@pytest.mark.parametrize("kind, index_dir", [("flat", True), ("hnsw", True), ("sq8", True), ("flat", False), ("sq8", False)])
+def test_update_matches_full_rebuild(tmp_path, monkeypatch, use_dir, capsys, change, kind, index_dir):
+    v1 = make_manual()
+    manuals = FakeManuals({"v1": v1, "v2": revise(v1, change)})
+    use_manuals(monkeypatch, manuals)
+    embedder = HashEmbedder()
+
+    (tmp_path / "updated").mkdir()
+    (tmp_path / "rebuilt").mkdir()
+    load_updated = use_dir(tmp_path / "updated", kind, index_dir)
+    reindex.rebuild_indexes("v1", embedder=embedder)
+    num_v1 = embedder.encoded
+    manuals.rendered.clear()
+    capsys.readouterr()
+    updated_index, updated_bm25, updated_chunks = reindex.update_indexes("v2", embedder=embedder)
+    output = capsys.readouterr().out
+    embedded, rendered = embedder.encoded - num_v1, sorted(manuals.rendered)
+    reloaded = load_updated()
+
+    load_rebuilt = use_dir(tmp_path / "rebuilt", kind, index_dir)
+    rebuilt_index, rebuilt_bm25, rebuilt_chunks = reindex.rebuild_indexes("v2", embedder=HashEmbedder())
+    from_disk = load_rebuilt()
+
+    # Only the touched page was re-embedded and re-rendered.
+    changed = {"edit_text": [3], "edit_long": [4], "edit_diagram": [2], "add": [9], "remove": []}[change]
+    assert embedded == sum(1 for chunk in rebuilt_chunks if chunk["page_number"] in changed)
+    assert rendered == ([n for n in changed if manuals.versions["v2"][n]["is_diagram"]] if index_dir else [])
+    if kind == "hnsw" and change != "add":
+        assert "does not support removal" in output
+
+    queries = stored_vectors(rebuilt_index)
+    for (index, bm25, chunks), (expected_index, expected_bm25, expected_chunks) in [
+        ((updated_index, updated_bm25, updated_chunks), (rebuilt_index, rebuilt_bm25, rebuilt_chunks)),
+        (reloaded, from_disk),
+    ]:
+        assert list(chunks) == list(expected_chunks)
+        assert np.array_equal(chunk_vector_ids(list(chunks)), chunk_vector_ids(list(expected_chunks)))
+        # Exact vectors, not reconstructions from the quantized codes.
+        assert np.allclose(stored_vectors(index), stored_vectors(expected_index), atol=1e-6)
+        distances, positions = index.search(queries, 5)
+        expected_distances, expected_positions = expected_index.search(queries, 5)
+        assert np.array_equal(positions, expected_positions)
+        assert np.allclose(distances, expected_distances, atol=1e-5)
+        for query in (["flap", "thrust"], ["hydraulic", "pressure", "limit"]):
+            assert np.allclose(bm25.get_scores(query), expected_bm25.get_scores(query))
+
+    if index_dir:
+        updated_images, rebuilt_images = reloaded[2].page_images, from_disk[2].page_images
+        assert updated_images.pages() == rebuilt_images.pages()
+        for n in rebuilt_images.pages():
+            assert updated_images.get(n) == rebuilt_images.get(n)
+
+def test_update_without_changes_keeps_the_indexes(tmp_path, monkeypatch, use_dir):
+    manuals = FakeManuals({"v1": make_manual()})
+    use_manuals(monkeypatch, manuals)
+    embedder = HashEmbedder()
+    use_dir(tmp_path, "flat", True)
+    reindex.rebuild_indexes("v1", embedder=embedder)
+    encoded = embedder.encoded
+
+    index, bm25, chunks = reindex.update_indexes("v1", embedder=embedder)
+    assert embedder.encoded == encoded
+    assert len(chunks) == index.ntotal == bm25.corpus_size
+
+def test_update_without_manifest_rebuilds(tmp_path, monkeypatch, use_dir):
+    manuals = FakeManuals({"v1": make_manual()})
+    use_manuals(monkeypatch, manuals)
+    embedder = HashEmbedder()
+    use_dir(tmp_path, "flat", True)
+
+    _, _, chunks = reindex.update_indexes("v1", embedder=embedder)
+    assert embedder.encoded == len(chunks)
+    assert reindex.load_manifest() is not None
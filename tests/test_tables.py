@@ -0,0 +1,150 @@
+import pytest
+from src.tables import PerformanceTable, TableIndex, parse_table_grid, parse_table_query
+
+OATS = [10, 20, 30, 40, 50]
+LENGTHS = [2000, 2400, 2800]
+COLUMN_X = [100, 150, 200, 250, 300]
+
+
+def field_limit(altitude, length, oat):
+    """The synthetic grids are linear in every parameter, so interpolation is exact."""
+    return 40 + length / 100 - oat / 10 - altitude / 1000
+
+def climb_limit(altitude, oat):
+    return 80 - oat / 5 - altitude / 1000
+
+def field_climb_rows(altitude):
+    """The word rows of a field/climb limit page: an °F and a °C header, field length rows and the climb limit row."""
+    rows = [
+        [(10, "FIELD"), (60, "LIMIT"), (110, "WEIGHT"), (170, "(1000"), (210, "KG)")],
+        [(10, "OAT"), (30, "(°F)")] + [(x, f"{oat * 9 / 5 + 32:g}") for x, oat in zip(COLUMN_X, OATS)],
+        [(10, "OAT"), (30, "(°C)")] + [(x, str(oat)) for x, oat in zip(COLUMN_X, OATS)],
+    ]
+    for length in LENGTHS:
+        rows.append([(10, str(length))] + [(x + 3, f"{field_limit(altitude, length, oat):.1f}") for x, oat in zip(COLUMN_X, OATS)])
+    rows.append([(10, "CLIMB"), (40, "LIMIT")] + [(x - 2, f"{climb_limit(altitude, oat):.1f}") for x, oat in zip(COLUMN_X, OATS)])
+    return rows
+
+def table_chunk(page, table_type, grid, altitude=None, runway="dry", flaps=None):
+    metadata = {"table_type": table_type, "altitude": altitude, "runway_condition": runway, "flap_setting": flaps, "table_grid": grid}
+    return {"content": "", "page_number": page, "chunk_id": f"page_{page}_enhanced", "type": "performance_table", "has_image": False, "metadata": metadata}
+
+def field_climb_chunk(page, altitude, runway="dry", flaps=None):
+    return table_chunk(page, "field_climb_limits", parse_table_grid("field_climb_limits", field_climb_rows(altitude)), str(altitude), runway, flaps)
+
+@pytest.fixture
+def tables():
+    return TableIndex.from_chunks([field_climb_chunk(82, 0), field_climb_chunk(83, 2000), field_climb_chunk(84, 4000),
+                                   {"content": "text", "page_number": 85, "chunk_id": "page_85_chunk_0", "type": "text", "metadata": {}}])
+
+
+def test_parse_field_climb_grid():
+    grid = parse_table_grid("field_climb_limits", field_climb_rows(2000))
+
+    assert grid["row_values"] == LENGTHS
+    assert grid["column_values"] == OATS  # the °C header, not the °F one
+    assert grid["weights"][1] == [round(field_limit(2000, 2400, oat), 1) for oat in OATS]
+    assert grid["climb_limit"] == [round(climb_limit(2000, oat), 1) for oat in OATS]
+
+def test_parse_grid_keeps_empty_cells_and_sorts_rows():
+    rows = field_climb_rows(0)
+    rows[3], rows[5] = rows[5], rows[3]
+    rows[4] = rows[4][:2] + rows[4][3:]  # no value under 20 °C
+    grid = parse_table_grid("field_climb_limits", rows)
+
+    assert grid["row_values"] == LENGTHS
+    assert grid["weights"][1][1] is None
+
+def test_parse_grid_without_table_returns_none():
+    assert parse_table_grid("field_climb_limits", [[(10, "NORMAL"), (60, "PROCEDURES")]]) is None
+    assert parse_table_grid("flap_retraction", field_climb_rows(0)) is None
+
+def test_parse_landing_grid():
+    altitudes = [0, 2000, 4000, 6000]
+    rows = [[(10, "PRESSURE"), (60, "ALTITUDE"), (110, "(FT)")] + [(x, str(altitude)) for x, altitude in zip(COLUMN_X, altitudes)]]
+    rows += [[(10, str(length))] + [(x, f"{50 + length / 100 - altitude / 1000:.1f}") for x, altitude in zip(COLUMN_X, altitudes)] for length in LENGTHS]
+    grid = parse_table_grid("landing_limits", rows)
+
+    assert grid["column_values"] == altitudes
+    assert grid["row_values"] == LENGTHS
+    assert "climb_limit" not in grid
+
+    landing = TableIndex.from_chunks([table_chunk(90, "landing_limits", grid, runway=None)])
+    answer = landing.answer("Landing field limit weight for 2400 m at 1000 ft?")
+    assert answer.value == pytest.approx(50 + 24 - 1)
+    assert answer.sources == [{"page": 90, "score": 1.0}]
+
+
+def test_parse_table_query():
+    query = parse_table_query("I'm calculating our takeoff weight for a dry runway. We're at 2,000 feet pressure altitude, and the OAT is 50°C. What's the climb limit weight ?")
+
+    assert (query.quantity, query.altitude_ft, query.oat_c, query.runway_condition) == ("climb_limit", 2000, 50, "dry")
+    assert parse_table_query("Climb limit weight at sea level, 86 °F").oat_c == pytest.approx(30)
+    assert parse_table_query("Field limit weight, 2400 m, flaps 5, 1000 ft, OAT 20").field_length_m == 2400
+
+@pytest.mark.parametrize("question", [
+    "What is the first flap retraction speed after a flaps 15 takeoff?",
+    "Climb limit weight at 2000 ft, 30°C with a 10 kt tailwind?",
+    "Field limit weight at 2000 ft, 30°C, 2400 m with engine anti-ice on?",
+])
+def test_other_questions_are_not_table_queries(question):
+    assert parse_table_query(question) is None
+
+
+def test_exact_lookup(tables):
+    answer = tables.answer("Climb limit weight at 2000 ft, dry, 30°C?")
+
+    assert answer.value == pytest.approx(climb_limit(2000, 30))
+    assert answer.table == "field_climb_limits"
+    assert answer.sources == [{"page": 83, "score": 1.0}]
+    assert "page 83" in answer.answer and "dry runway" in answer.answer
+
+def test_interpolates_in_oat_length_and_altitude(tables):
+    answer = tables.answer("Field limit weight at 1,000 ft, dry, 25°C, 2200 m?")
+
+    assert answer.value == pytest.approx(field_limit(1000, 2200, 25))
+    assert answer.sources == [{"page": 82, "score": 1.0}, {"page": 83, "score": 1.0}]
+    assert "interpolated in altitude" in answer.answer
+
+def test_empty_cells_are_not_interpolated():
+    rows = field_climb_rows(0)
+    rows[3] = rows[3][:2] + rows[3][3:]  # 2000 m row has no value under 20 °C
+    chunk = table_chunk(82, "field_climb_limits", parse_table_grid("field_climb_limits", rows), "0")
+    table = PerformanceTable.from_chunk(chunk)
+
+    assert table.weight(2000, 15) is None
+    assert table.weight(2400, 15) == pytest.approx(field_limit(0, 2400, 15))
+
+@pytest.mark.parametrize("question", [
+    "Climb limit weight at 2000 ft, dry, 55°C?",  # OAT beyond the columns
+    "Climb limit weight at 5000 ft, dry, 30°C?",  # altitude beyond the tables
+    "Field limit weight at 2000 ft, dry, 30°C, 3000 m?",  # field length beyond the rows
+    "Field limit weight at 2000 ft, dry, 30°C?",  # no field length
+    "Climb limit weight, dry, 30°C?",  # no altitude
+    "Climb limit weight at 2000 ft, wet, 30°C?",  # no wet tables
+])
+def test_out_of_range_or_incomplete_questions_return_none(tables, question):
+    assert tables.answer(question) is None
+
+def test_ambiguous_runway_condition_returns_none():
+    tables = TableIndex.from_chunks([field_climb_chunk(82, 2000, "dry"), field_climb_chunk(90, 2000, "wet")])
+
+    assert tables.answer("Climb limit weight at 2000 ft, 30°C?") is None
+    assert tables.answer("Climb limit weight at 2000 ft, wet, 30°C?").sources == [{"page": 90, "score": 1.0}]
+
+def test_ambiguous_flap_setting_returns_none():
+    tables = TableIndex.from_chunks([field_climb_chunk(82, 2000, flaps="5"), field_climb_chunk(83, 2000, flaps="15")])
+
+    assert tables.answer("Climb limit weight at 2000 ft, dry, 30°C?") is None
+    assert tables.answer("Climb limit weight at 2000 ft, dry, 30°C, flaps 15?").sources == [{"page": 83, "score": 1.0}]
+
+def test_chunk_page_stores_the_grid_with_its_page():
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    from src.document_processor import chunk_page, detect_performance_table
+
+    text = "FIELD LIMIT WEIGHT (1000 KG)\n2000 FT Pressure Altitude\nDry Runway\nClimb Limit"
+    page = {"page_number": 83, "text": text, "char_count": len(text), "is_diagram": False, "table_rows": field_climb_rows(2000)}
+    table_info = detect_performance_table(page)
+    chunks = chunk_page(page, table_info, RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=300))
+
+    assert TableIndex.from_chunks(chunks).answer("Climb limit weight at 2000 ft, dry, 30°C?").sources == [{"page": 83, "score": 1.0}]